@@ -0,0 +1,312 @@
+import json
+from array import array
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from coach.models.enums import DistanceUnit, Sport
+from coach.models.schema import TrainingPlan
+
+SPORTS = list(Sport)
+SPORT_CODES = {sport.value: code for code, sport in enumerate(SPORTS)}
+ZONES = 5
+METERS_PER_UNIT = {DistanceUnit.KM.value: 1000.0, DistanceUnit.M.value: 1.0}
+
+# Rough minutes per kilometre at zones 1-5, used for intervals without a
+# `duration_estimate`. Triathlon segments are costed as running.
+DEFAULT_PACE = np.array(
+    [
+        [2.4, 2.0, 1.8, 1.65, 1.5],  # CYCLING
+        [7.0, 6.0, 5.3, 4.8, 4.3],  # RUNNING
+        [25.0, 22.0, 20.0, 18.5, 17.0],  # SWIMMING
+        [7.0, 6.0, 5.3, 4.8, 4.3],  # TRIATHLON
+    ]
+)
+# Load per minute in each zone (Edwards' zone weighted TRIMP)
+DEFAULT_ZONE_WEIGHTS = np.arange(1.0, ZONES + 1)
+
+
+@dataclass
+class PlanColumns:
+    """Every warmup, interval and cooldown of a batch of plans, one row each.
+
+    Rows are grouped by plan, then week, then workout. `minutes` is NaN
+    where the model gave no `duration_estimate`. Per week columns
+    (`claimed_volume`) are indexed by `week_offsets[plan] + week`.
+    """
+
+    plan: np.ndarray  # int32, position of the plan in the batch
+    week: np.ndarray  # int32, 0-based week within the plan
+    sport: np.ndarray  # int8, index into SPORTS
+    zone: np.ndarray  # int8, effort zone 1-5
+    meters: np.ndarray  # float64
+    minutes: np.ndarray  # float64
+    week_counts: np.ndarray  # int32, weeks in each plan
+    claimed_volume: np.ndarray  # float64, total_weekly_volume or NaN
+
+    @property
+    def plan_count(self) -> int:
+        return len(self.week_counts)
+
+    @property
+    def max_weeks(self) -> int:
+        return int(self.week_counts.max()) if self.plan_count else 0
+
+    @property
+    def week_offsets(self) -> np.ndarray:
+        return np.concatenate(([0], np.cumsum(self.week_counts)[:-1]))
+
+    def week_mask(self) -> np.ndarray:
+        """(plans, max_weeks) True where the plan has that week"""
+        return np.arange(self.max_weeks) < self.week_counts[:, None]
+
+
+# (sport, effort zone, distance, distance unit, duration) of one segment
+Segment = tuple[str, int, int, str, float | None]
+
+
+def _model_weeks(
+    plan: TrainingPlan,
+) -> Iterator[tuple[int | None, list[Segment]]]:
+    for week in plan.weekly_workouts:
+        segments = []
+        for workout in week.workouts:
+            sport = workout.sport.value
+            for segment in (
+                workout.warmup,
+                *workout.intervals,
+                workout.cooldown,
+            ):
+                segments.append(
+                    (
+                        sport,
+                        segment.effort.value,
+                        segment.distance,
+                        segment.distance_unit.value,
+                        segment.duration_estimate,
+                    )
+                )
+        yield week.total_weekly_volume, segments
+
+
+def _json_weeks(
+    plan: dict[str, Any],
+) -> Iterator[tuple[int | None, list[Segment]]]:
+    for week in plan["weekly_workouts"]:
+        segments = []
+        for workout in week["workouts"]:
+            sport = workout["sport"]
+            for segment in (
+                workout["warmup"],
+                *workout["intervals"],
+                workout["cooldown"],
+            ):
+                segments.append(
+                    (
+                        sport,
+                        segment["effort"],
+                        segment["distance"],
+                        segment["distance_unit"],
+                        segment.get("duration_estimate"),
+                    )
+                )
+        yield week.get("total_weekly_volume"), segments
+
+
+def _plan_weeks(
+    plan: TrainingPlan | dict[str, Any] | str | Path,
+) -> Iterator[tuple[int | None, list[Segment]]]:
+    if isinstance(plan, TrainingPlan):
+        return _model_weeks(plan)
+    if isinstance(plan, (str, Path)):
+        return _json_weeks(json.loads(Path(plan).read_bytes()))
+    return _json_weeks(plan)
+
+
+def flatten_plans(
+    plans: Iterable[TrainingPlan | dict[str, Any] | str | Path],
+) -> PlanColumns:
+    """Flatten plans into columns, the only per-interval Python loop.
+
+    Plans can be `TrainingPlan` objects, already decoded JSON, or paths to
+    saved plan files. Decoded JSON is read as is, without validation.
+    """
+    plan_col, week_col = array("i"), array("i")
+    sport_col, zone_col = array("b"), array("b")
+    meters_col, minutes_col = array("d"), array("d")
+    week_counts, claimed_volume = array("i"), array("d")
+    nan = float("nan")
+
+    for plan_index, plan in enumerate(plans):
+        week_count = 0
+        for week_index, (volume, segments) in enumerate(_plan_weeks(plan)):
+            week_count += 1
+            claimed_volume.append(nan if volume is None else volume)
+            for sport, zone, distance, unit, duration in segments:
+                plan_col.append(plan_index)
+                week_col.append(week_index)
+                sport_col.append(SPORT_CODES[sport])
+                zone_col.append(zone)
+                meters_col.append(distance * METERS_PER_UNIT[unit])
+                minutes_col.append(nan if duration is None else duration)
+        week_counts.append(week_count)
+
+    return PlanColumns(
+        plan=np.frombuffer(plan_col, dtype=np.int32),
+        week=np.frombuffer(week_col, dtype=np.int32),
+        sport=np.frombuffer(sport_col, dtype=np.int8),
+        zone=np.frombuffer(zone_col, dtype=np.int8),
+        meters=np.frombuffer(meters_col, dtype=np.float64),
+        minutes=np.frombuffer(minutes_col, dtype=np.float64),
+        week_counts=np.frombuffer(week_counts, dtype=np.int32),
+        claimed_volume=np.frombuffer(claimed_volume, dtype=np.float64),
+    )
+
+
+@dataclass
+class PlanLoad:
+    """Weekly training load metrics for a batch of plans.
+
+    Weekly arrays are (plans, max_weeks), padded with NaN past the end of
+    shorter plans. Load is zone weighted minutes, so a 60 minute zone 2
+    session scores 120.
+    """
+
+    load: np.ndarray
+    minutes: np.ndarray
+    kilometers: np.ndarray
+    time_in_zone: np.ndarray  # (plans, max_weeks, 5) minutes per zone
+    ramp_rate: np.ndarray  # fractional load change from the previous week
+    acute_chronic: np.ndarray  # week load / rolling mean of recent weeks
+    claimed_volume: np.ndarray  # total_weekly_volume as generated
+
+    def summary(
+        self, acwr_range: tuple[float, float] = (0.8, 1.3)
+    ) -> dict[str, np.ndarray]:
+        """Per plan totals and peaks, one array entry per plan"""
+        low, high = acwr_range
+        weeks = np.sum(~np.isnan(self.load), axis=1)
+        with np.errstate(invalid="ignore"):
+            outside = (self.acute_chronic < low) | (self.acute_chronic > high)
+        return {
+            "total_load": np.nansum(self.load, axis=1),
+            "total_minutes": np.nansum(self.minutes, axis=1),
+            "total_kilometers": np.nansum(self.kilometers, axis=1),
+            "peak_load": _nanmax(self.load),
+            "peak_ramp_rate": _nanmax(self.ramp_rate),
+            "peak_acute_chronic": _nanmax(self.acute_chronic),
+            "weeks_outside_acwr": np.sum(outside, axis=1),
+            "intensity_share": np.nansum(
+                self.time_in_zone[:, :, 3:], axis=(1, 2)
+            )
+            / np.maximum(np.nansum(self.minutes, axis=1), 1e-9),
+            "weeks": weeks,
+        }
+
+    def rank(
+        self, acwr_range: tuple[float, float] = (0.8, 1.3)
+    ) -> np.ndarray:
+        """Plan indexes from safest to riskiest progression.
+
+        Ordered by weeks outside `acwr_range`, then by peak ramp rate.
+        """
+        summary = self.summary(acwr_range)
+        peak_ramp = np.nan_to_num(summary["peak_ramp_rate"], nan=0.0)
+        return np.lexsort((peak_ramp, summary["weeks_outside_acwr"]))
+
+
+def _nanmax(values: np.ndarray) -> np.ndarray:
+    # np.nanmax warns on all-NaN rows, e.g. ramp rate of a one week plan
+    filled = np.where(np.isnan(values), -np.inf, values)
+    peak = filled.max(axis=1, initial=-np.inf)
+    return np.where(np.isneginf(peak), np.nan, peak)
+
+
+def interval_minutes(
+    columns: PlanColumns, pace: np.ndarray = DEFAULT_PACE
+) -> np.ndarray:
+    """Given durations, or distance at the sport and zone's pace"""
+    estimated = columns.meters / 1000 * pace[columns.sport, columns.zone - 1]
+    return np.where(np.isnan(columns.minutes), estimated, columns.minutes)
+
+
+def _rolling_mean(weekly: np.ndarray, window: int) -> np.ndarray:
+    """Mean of each week and up to `window - 1` weeks before it"""
+    totals = np.cumsum(weekly, axis=1)
+    shifted = np.zeros_like(totals)
+    shifted[:, window:] = totals[:, :-window]
+    counts = np.minimum(np.arange(1, weekly.shape[1] + 1), window)
+    return (totals - shifted) / counts
+
+
+def training_load(
+    columns: PlanColumns,
+    pace: np.ndarray = DEFAULT_PACE,
+    zone_weights: np.ndarray = DEFAULT_ZONE_WEIGHTS,
+    chronic_weeks: int = 4,
+) -> PlanLoad:
+    """Weekly load, time in zone, ramp rate and acute:chronic ratio.
+
+    The acute:chronic ratio compares each week's load with the rolling mean
+    of the last `chronic_weeks` weeks (itself included), so early weeks of
+    a plan use a shorter window.
+    """
+    plans, weeks = columns.plan_count, columns.max_weeks
+    minutes = interval_minutes(columns, pace)
+    zone = columns.zone.astype(np.intp) - 1
+    cell = columns.plan.astype(np.intp) * weeks + columns.week
+
+    def per_week(weights: np.ndarray) -> np.ndarray:
+        counts = np.bincount(cell, weights=weights, minlength=plans * weeks)
+        # bincount of no rows comes back as int64
+        return counts.astype(np.float64, copy=False)
+
+    mask = columns.week_mask()
+    padded = np.where(mask, 0.0, np.nan)
+    load = per_week(minutes * zone_weights[zone]).reshape(plans, weeks)
+    load += padded
+    total_minutes = per_week(minutes).reshape(plans, weeks) + padded
+    kilometers = per_week(columns.meters / 1000).reshape(plans, weeks) + padded
+    time_in_zone = (
+        np.bincount(
+            cell * ZONES + zone,
+            weights=minutes,
+            minlength=plans * weeks * ZONES,
+        )
+        .astype(np.float64, copy=False)
+        .reshape(plans, weeks, ZONES)
+    )
+    time_in_zone += padded[:, :, None]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ramp_rate = np.full((plans, weeks), np.nan)
+        previous = load[:, :-1]
+        ramp_rate[:, 1:] = np.where(
+            previous > 0, (load[:, 1:] - previous) / previous, np.nan
+        )
+        chronic = _rolling_mean(np.nan_to_num(load), chronic_weeks)
+        acute_chronic = np.where(
+            mask & (chronic > 0), load / chronic, np.nan
+        )
+
+    claimed = np.full((plans, weeks), np.nan)
+    claimed[mask] = columns.claimed_volume
+
+    return PlanLoad(
+        load=load,
+        minutes=total_minutes,
+        kilometers=kilometers,
+        time_in_zone=time_in_zone,
+        ramp_rate=ramp_rate,
+        acute_chronic=acute_chronic,
+        claimed_volume=claimed,
+    )
+
+
+def analyse_plans(
+    plans: Iterable[TrainingPlan | dict[str, Any] | str | Path], **kwargs: Any
+) -> PlanLoad:
+    return training_load(flatten_plans(plans), **kwargs)
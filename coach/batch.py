@@ -0,0 +1,343 @@
+"""Generate training plans for many athletes in one process.
+
+Every plan runs on the same event loop against one compiled graph and one
+`Dependencies`, so all athletes share the HTTP client, the call scheduler
+and, with `--cache`, the response cache.
+
+    python -m coach.batch athletes.jsonl --output-dir plans/
+    python -m coach.batch athletes.jsonl --export-dir exports/
+
+Each line of the input file is a `TrainingPlanInput` record plus an
+`athlete_id`, with enums given by value, e.g.
+
+    {"athlete_id": "a-17", "workouts_per_week": 4, "training_goal": "BASE",
+     "sports": ["RUNNING"], "experience": "BEGINNER",
+     "available_time_per_session": 45, "current_weekly_volume": 120,
+     "programme_length": 8, "injuries_or_limitations": null}
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from dotenv import load_dotenv
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph.state import CompiledStateGraph
+from pydantic import TypeAdapter
+
+from coach.main import build_training_plan_graph, build_weekly_workout_graph
+from coach.models.dependencies import Dependencies
+from coach.models.routing import (
+    DEFAULT_ROUTES,
+    DEFAULT_TIERS,
+    print_routing_summary,
+)
+from coach.models.states import TrainingPlanInput
+from coach.postprocess import postprocess_plans, print_export_summary
+
+training_plan_input_adapter = TypeAdapter(TrainingPlanInput)
+
+
+# Ids name the output file and checkpoint thread, so no path separators or
+# leading dots
+ATHLETE_ID = re.compile(r"[A-Za-z0-9_][A-Za-z0-9._-]*")
+
+
+@dataclass
+class AthleteJob:
+    athlete_id: str
+    plan_input: TrainingPlanInput
+
+
+@dataclass
+class AthleteResult:
+    athlete_id: str
+    output_path: Path
+    latency_seconds: float
+    error: str | None = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def load_jobs(path: str | Path) -> list[AthleteJob]:
+    """Read the input file, raising ValueError on unusable or repeated ids"""
+    jobs = []
+    seen: dict[str, int] = {}
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            athlete_id = str(record.pop("athlete_id", line_number))
+            if not ATHLETE_ID.fullmatch(athlete_id):
+                raise ValueError(
+                    f"{path}:{line_number}: athlete_id {athlete_id!r} may "
+                    "only use letters, digits, '.', '_' and '-', and can't "
+                    "start with '.' or '-'"
+                )
+            if athlete_id in seen:
+                raise ValueError(
+                    f"{path}:{line_number}: athlete_id {athlete_id!r} "
+                    f"repeats line {seen[athlete_id]}"
+                )
+            seen[athlete_id] = line_number
+            jobs.append(
+                AthleteJob(
+                    athlete_id=athlete_id,
+                    plan_input=training_plan_input_adapter.validate_python(
+                        record
+                    ),
+                )
+            )
+    return jobs
+
+
+async def run_athlete(
+    graph: CompiledStateGraph,
+    job: AthleteJob,
+    batch_id: str,
+    output_dir: Path,
+    in_flight: asyncio.Semaphore,
+) -> AthleteResult:
+    output_path = output_dir / f"{job.athlete_id}.json"
+    config = {
+        "configurable": {
+            "thread_id": f"{batch_id}-{job.athlete_id}",
+            "output_path": str(output_path),
+        }
+    }
+
+    async with in_flight:
+        start = time.perf_counter()
+        try:
+            snapshot = await graph.aget_state(config)
+            if not snapshot.values or snapshot.next:
+                # Streaming None resumes a plan from an earlier attempt
+                graph_input = None if snapshot.values else job.plan_input
+                await graph.ainvoke(graph_input, config)
+        except Exception as error:
+            return AthleteResult(
+                athlete_id=job.athlete_id,
+                output_path=output_path,
+                latency_seconds=time.perf_counter() - start,
+                error=repr(error),
+            )
+
+        return AthleteResult(
+            athlete_id=job.athlete_id,
+            output_path=output_path,
+            latency_seconds=time.perf_counter() - start,
+        )
+
+
+async def run_batch(
+    jobs: list[AthleteJob],
+    deps: Dependencies,
+    output_dir: str | Path,
+    max_in_flight: int = 8,
+    batch_id: str | None = None,
+    checkpoint_path: str = ".coach_cache/checkpoints.sqlite",
+    workout_batches: int | None = None,
+    rule_based_easy_days: bool = False,
+) -> list[AthleteResult]:
+    batch_id = batch_id or uuid.uuid4().hex
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    Path(checkpoint_path).parent.mkdir(parents=True, exist_ok=True)
+
+    training_plan_builder = build_training_plan_graph(
+        deps=deps,
+        weekly_graph=build_weekly_workout_graph(
+            deps=deps,
+            workout_batches=workout_batches,
+            rule_based_easy_days=rule_based_easy_days,
+        ),
+    )
+    in_flight = asyncio.Semaphore(max_in_flight)
+
+    async with AsyncSqliteSaver.from_conn_string(
+        checkpoint_path
+    ) as checkpointer:
+        graph = training_plan_builder.compile(checkpointer=checkpointer)
+        return await asyncio.gather(
+            *[
+                run_athlete(graph, job, batch_id, output_dir, in_flight)
+                for job in jobs
+            ]
+        )
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+def print_summary(
+    results: list[AthleteResult], deps: Dependencies, wall_seconds: float
+) -> None:
+    succeeded = [r for r in results if r.succeeded]
+    latencies = [r.latency_seconds for r in succeeded]
+
+    print(f"Plans: {len(succeeded)}/{len(results)} succeeded")
+    print(f"Wall time: {wall_seconds:.1f}s")
+    if wall_seconds > 0:
+        print(
+            f"Throughput: {len(succeeded) / wall_seconds * 3600:.1f} plans/h"
+        )
+    print(
+        "Plan latency: "
+        f"p50 {percentile(latencies, 50):.1f}s, "
+        f"p90 {percentile(latencies, 90):.1f}s, "
+        f"p99 {percentile(latencies, 99):.1f}s, "
+        f"max {max(latencies, default=0.0):.1f}s"
+    )
+
+    schedulers = [deps.scheduler, *deps.tier_schedulers.values()]
+    calls = sum(scheduler.stats.calls for scheduler in schedulers)
+    retries = sum(scheduler.stats.retries for scheduler in schedulers)
+    throttled = sum(scheduler.stats.throttled for scheduler in schedulers)
+    wait = sum(scheduler.stats.total_wait_seconds for scheduler in schedulers)
+    print(
+        f"Model calls: {calls} ({retries} retries, {throttled} throttled), "
+        f"scheduler wait {wait:.1f}s total"
+    )
+    if deps.cache is not None:
+        print(
+            f"LLM cache: {deps.cache.stats.hits} hits, "
+            f"{deps.cache.stats.misses} misses"
+        )
+    repairs = deps.repair_stats
+    print(
+        f"Model output: {repairs.clean} clean, {repairs.repaired} repaired "
+        f"locally, {repairs.regenerated} regenerated"
+    )
+
+    if deps.templates is not None:
+        stats = deps.templates.stats
+        print(
+            f"Templates: {stats.hits.get('week', 0)} weeks and "
+            f"{stats.hits.get('workout', 0)} workouts reused "
+            f"({stats.reuse_rate('week'):.0%} of weeks), "
+            f"{stats.stored} stored"
+        )
+    if deps.tiers:
+        print_routing_summary(
+            deps.tiers,
+            {
+                name: scheduler.stats
+                for name, scheduler in deps.tier_schedulers.items()
+            },
+            deps.escalations,
+        )
+
+    for result in results:
+        if not result.succeeded:
+            print(f"FAILED {result.athlete_id}: {result.error}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    jobs = load_jobs(args.input)
+    deps = Dependencies(
+        model_name=args.model_name,
+        provider=args.provider,
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_concurrency=args.max_concurrency,
+        tiers=DEFAULT_TIERS if args.routing == "tiered" else None,
+        routes=DEFAULT_ROUTES if args.routing == "tiered" else None,
+        template_path=args.templates,
+        cache_path=args.cache,
+    )
+
+    start = time.perf_counter()
+    results = await run_batch(
+        jobs,
+        deps=deps,
+        output_dir=args.output_dir,
+        max_in_flight=args.max_in_flight,
+        batch_id=args.batch_id,
+        workout_batches=args.workout_batches,
+        rule_based_easy_days=args.rule_based_easy_days,
+    )
+    print_summary(results, deps, time.perf_counter() - start)
+
+    if args.export_dir:
+        start = time.perf_counter()
+        exports = await postprocess_plans(
+            [result.output_path for result in results if result.succeeded],
+            args.export_dir,
+            workers=args.export_workers,
+        )
+        print_export_summary(exports, time.perf_counter() - start)
+
+
+def build_parser(prog: str | None = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog=prog, description=__doc__.splitlines()[0]
+    )
+    parser.add_argument("input", help="JSONL file of athlete plan inputs")
+    parser.add_argument("--output-dir", default="plans")
+    parser.add_argument(
+        "--batch-id",
+        help="Reuse a previous batch id to resume its unfinished plans",
+    )
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--model-name", default="claude-3-5-haiku-latest")
+    parser.add_argument(
+        "--provider", choices=["anthropic", "fake"], default="anthropic"
+    )
+    parser.add_argument("--requests-per-minute", type=float, default=50)
+    parser.add_argument("--tokens-per-minute", type=float, default=40_000)
+    parser.add_argument("--max-concurrency", type=int, default=10)
+    parser.add_argument("--workout-batches", type=int, default=None)
+    parser.add_argument(
+        "--rule-based-easy-days",
+        action="store_true",
+        help="Build easy and recovery days from rules instead of the model",
+    )
+    parser.add_argument(
+        "--routing",
+        choices=["single", "tiered"],
+        default="single",
+        help="Use --model-name for every call, or per call type tiers",
+    )
+    parser.add_argument(
+        "--templates",
+        help="Template store to reuse weeks and workouts from, e.g. "
+        ".coach_cache/templates.sqlite",
+    )
+    parser.add_argument(
+        "--cache",
+        help="Response cache to replay identical model calls from, e.g. "
+        ".coach_cache/llm_cache.sqlite",
+    )
+    parser.add_argument(
+        "--export-dir",
+        help="Validate, enrich and export the finished plans here, on a "
+        "process pool",
+    )
+    parser.add_argument(
+        "--export-workers",
+        type=int,
+        default=None,
+        help="Export processes, defaults to one per core",
+    )
+    return parser
+
+
+if __name__ == "__main__":
+    args = build_parser().parse_args()
+
+    load_dotenv()
+    asyncio.run(main(args))
@@ -0,0 +1,89 @@
+"""Micro-benchmark of per-call setup overhead in the weekly node.
+
+Compares rebuilding structured-output runnables, the `Workout` parser, its
+format instructions and the prompt template on every call (the previous
+behaviour) against the memoized objects built once per node.
+
+    python -m coach.benchmarks.call_overhead
+"""
+
+import argparse
+import timeit
+
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from coach.models.dependencies import Dependencies
+from coach.models.schema import WeeklyWorkout, Workout
+from coach.nodes.weekly import WeeklyWorkoutNode
+from coach.prompts import PLAN_CONTEXT, PLAN_INDIVDUAL_WORKOUT
+
+PROMPT_VALUES = {
+    "week_index": 3,
+    "plan_duration_weeks": 10,
+    "weekly_workout_description": "Aerobic base with one threshold session",
+    "weekly_focus": "Aerobic development",
+    "plan_description": "Ten week endurance plan for swimming and running",
+    "progression_strategy": "Add 10% volume per week, deload every fourth",
+    "total_weekly_volume": 240,
+    "rest_days": [3, 7],
+    "day": 2,
+    "sports": "SWIMMING, RUNNING",
+    "available_time_per_session": "45 minutes",
+    "injuries_or_limitations": "None",
+}
+QUERY = "Generate an individual workout that fits with the overall training plan and placement within this training week."
+
+
+def per_call_setup(deps: Dependencies) -> None:
+    """Setup previously repeated on every workout + weekly call"""
+    deps.llm_client.with_structured_output(WeeklyWorkout)
+    parser = PydanticOutputParser(pydantic_object=Workout)
+    system_instructions = PLAN_INDIVDUAL_WORKOUT.format(
+        **PROMPT_VALUES,
+        format_instructions=parser.get_format_instructions(),
+    )
+    prompt = ChatPromptTemplate.from_messages(
+        [SystemMessage(content=system_instructions)]
+        + [HumanMessage(content="{query}")]
+    )
+    prompt | deps.llm_client | parser
+    prompt.invoke({"query": QUERY})
+
+
+def memoized_setup(node: WeeklyWorkoutNode) -> None:
+    """Setup left per call once runnables are built once per node"""
+    node.weekly_plan_llm
+    node.workout_chain
+    node.workout_prompt.invoke(
+        {
+            **PROMPT_VALUES,
+            "plan_context": PLAN_CONTEXT.format(**PROMPT_VALUES),
+            "query": QUERY,
+        }
+    )
+
+
+def main(iterations: int) -> None:
+    deps = Dependencies(provider="fake", cache_path=None)
+    node = WeeklyWorkoutNode(deps=deps)
+
+    results = {
+        "per call": timeit.timeit(
+            lambda: per_call_setup(deps), number=iterations
+        ),
+        "memoized": timeit.timeit(
+            lambda: memoized_setup(node), number=iterations
+        ),
+    }
+
+    for name, seconds in results.items():
+        print(f"{name:>9}: {seconds / iterations * 1e6:8.1f} us/call")
+    print(f"  speedup: {results['per call'] / results['memoized']:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    main(parser.parse_args().iterations)
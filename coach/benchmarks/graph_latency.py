@@ -0,0 +1,394 @@
+"""End-to-end latency benchmark for the training plan graph.
+
+Runs the full graph against the offline `FakeCoachChatModel` for a range of
+programme lengths and reports wall-clock time, model call count, peak
+concurrency and scheduler queueing. `--repeat` runs each length several
+times and adds plan latency percentiles, e.g. to compare tail latency with
+and without hedging:
+
+    python -m coach.benchmarks.graph_latency --weeks 8 --repeat 20 \
+        --straggler-rate 0.02 --hedge-percentile none
+
+    python -m coach.benchmarks.graph_latency --weeks 1-12
+
+`--routing tiered` routes call types to two fake model tiers, a fast one
+for weekly plans and workouts and a slower one for the plan outline and
+escalations, and prints per tier calls, latency and token cost.
+
+`--templates` shares one template library across every run, so repeats
+after the first reuse weeks and workouts instead of generating them:
+
+    python -m coach.benchmarks.graph_latency --weeks 8 --repeat 5 \
+        --templates
+
+`--rule-based-easy-days` builds the weekly outline's easy days from rules
+instead of sending them to the model, to compare call counts and wall time
+under a request budget:
+
+    python -m coach.benchmarks.graph_latency --weeks 8 \
+        --requests-per-minute 600 --rule-based-easy-days
+"""
+
+import argparse
+import asyncio
+import contextlib
+import tempfile
+import time
+from dataclasses import dataclass, replace
+
+from coach.batch import percentile
+from coach.main import build_training_plan_graph, build_weekly_workout_graph
+from coach.models.dependencies import Dependencies
+from coach.models.enums import Experience, Goal, Sport
+from coach.models.fake import LatencyProfile
+from coach.models.routing import (
+    DEFAULT_ROUTES,
+    DEFAULT_TIERS,
+    ModelTier,
+    print_routing_summary,
+)
+from coach.models.scheduler import CallPriority, LatencyTracker, SchedulerStats
+from coach.models.states import TrainingPlanInput
+from coach.storage.templates import TemplateStore
+
+
+@dataclass
+class BenchmarkResult:
+    weeks: int
+    wall_seconds: float
+    calls: int
+    max_concurrency: int
+    scheduler_wait_seconds: float
+    scheduler_max_wait_seconds: float
+    max_queue_depth: int
+    errors: int
+    hedges: int
+    deadline_timeouts: int
+    repaired: int
+    regenerated: int
+    reused: int
+    succeeded: bool
+    tier_stats: dict[str, SchedulerStats] | None = None
+    escalations: dict[str, int] | None = None
+
+
+def fake_tiers(latency: LatencyProfile) -> dict[str, ModelTier]:
+    """Default tiers with the fast one at half and the strong one at twice
+    the benchmark latency"""
+    factors = {"haiku": 0.5, "sonnet": 2.0}
+    return {
+        name: replace(
+            tier,
+            fake_options={
+                "latency": replace(latency, mean=latency.mean * factors[name])
+            },
+        )
+        for name, tier in DEFAULT_TIERS.items()
+    }
+
+
+def benchmark_input(programme_length: int) -> TrainingPlanInput:
+    return TrainingPlanInput(
+        workouts_per_week=4,
+        training_goal=Goal.ENDURANCE,
+        sports=(Sport.SWIMMING, Sport.RUNNING),
+        experience=Experience.INTERMEDIATE,
+        available_time_per_session=45,
+        current_weekly_volume=120,
+        programme_length=programme_length,
+        injuries_or_limitations=None,
+    )
+
+
+async def run_once(
+    weeks: int,
+    requests_per_minute: float,
+    tokens_per_minute: float,
+    max_concurrency: int,
+    workout_batches: int | None,
+    stream_plan: bool,
+    hedge_percentile: float | None,
+    workout_deadline: float | None,
+    latency: LatencyProfile,
+    error_rate: float,
+    malformed_rate: float,
+    seed: int,
+    latency_tracker: LatencyTracker | None = None,
+    routing: str = "single",
+    templates: TemplateStore | None = None,
+    rule_based_easy_days: bool = False,
+) -> BenchmarkResult:
+    deps = Dependencies(
+        model_name="fake-coach",
+        provider="fake",
+        cache_path=None,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        max_concurrency=max_concurrency,
+        hedge_percentile=hedge_percentile,
+        call_deadlines=(
+            {CallPriority.WORKOUT: workout_deadline}
+            if workout_deadline
+            else {}
+        ),
+        fake_options={
+            "latency": latency,
+            "error_rate": error_rate,
+            "malformed_rate": malformed_rate,
+            "seed": seed,
+        },
+        tiers=fake_tiers(latency) if routing == "tiered" else None,
+        routes=DEFAULT_ROUTES if routing == "tiered" else None,
+        templates=templates,
+    )
+    if latency_tracker is not None:
+        # Hedge thresholds learned by earlier runs, as in a long-lived process
+        deps.scheduler.latency = latency_tracker
+    graph = build_training_plan_graph(
+        deps=deps,
+        weekly_graph=build_weekly_workout_graph(
+            deps=deps,
+            workout_batches=workout_batches,
+            rule_based_easy_days=rule_based_easy_days,
+        ),
+        stream_plan=stream_plan,
+    ).compile()
+
+    succeeded = True
+    start = time.perf_counter()
+    try:
+        await graph.ainvoke(benchmark_input(weeks))
+    except Exception:
+        succeeded = False
+    wall_seconds = time.perf_counter() - start
+    reused = sum(templates.stats.hits.values()) if templates else 0
+    if templates is not None:
+        # Shared across runs, count each run's hits on their own
+        templates.stats.hits.clear()
+
+    # Routed calls never touch the default client, count every tier
+    clients = [deps.llm_client, *deps.tier_clients.values()]
+    schedulers = [deps.scheduler, *deps.tier_schedulers.values()]
+    return BenchmarkResult(
+        weeks=weeks,
+        wall_seconds=wall_seconds,
+        calls=sum(client.stats.calls for client in clients),
+        max_concurrency=sum(client.stats.max_in_flight for client in clients),
+        scheduler_wait_seconds=sum(
+            scheduler.stats.total_wait_seconds for scheduler in schedulers
+        ),
+        scheduler_max_wait_seconds=max(
+            scheduler.stats.max_wait_seconds for scheduler in schedulers
+        ),
+        max_queue_depth=max(
+            scheduler.stats.max_queue_depth for scheduler in schedulers
+        ),
+        errors=sum(client.stats.errors for client in clients),
+        hedges=sum(scheduler.stats.hedges for scheduler in schedulers),
+        deadline_timeouts=sum(
+            scheduler.stats.deadline_timeouts for scheduler in schedulers
+        ),
+        repaired=deps.repair_stats.repaired,
+        regenerated=deps.repair_stats.regenerated,
+        reused=reused,
+        succeeded=succeeded,
+        tier_stats={
+            name: scheduler.stats
+            for name, scheduler in deps.tier_schedulers.items()
+        },
+        escalations=deps.escalations,
+    )
+
+
+def print_results(results: list[BenchmarkResult]) -> None:
+    header = (
+        f"{'weeks':>5} {'wall_s':>8} {'calls':>6} {'max_conc':>8} "
+        f"{'wait_s':>8} {'max_wait_s':>10} {'max_queue':>9} "
+        f"{'errors':>6} {'hedges':>6} {'timeouts':>8} {'repaired':>8} "
+        f"{'regen':>5} {'reused':>6} {'ok':>3}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r.weeks:>5} {r.wall_seconds:>8.2f} {r.calls:>6} "
+            f"{r.max_concurrency:>8} {r.scheduler_wait_seconds:>8.2f} "
+            f"{r.scheduler_max_wait_seconds:>10.2f} "
+            f"{r.max_queue_depth:>9} {r.errors:>6} {r.hedges:>6} "
+            f"{r.deadline_timeouts:>8} {r.repaired:>8} {r.regenerated:>5} "
+            f"{r.reused:>6} {'y' if r.succeeded else 'n':>3}"
+        )
+
+
+def print_percentiles(results: list[BenchmarkResult]) -> None:
+    print()
+    for weeks in sorted({r.weeks for r in results}):
+        runs = [r for r in results if r.weeks == weeks]
+        wall = [r.wall_seconds for r in runs]
+        calls = sum(r.calls for r in runs)
+        hedges = sum(r.hedges for r in runs)
+        print(
+            f"{weeks} weeks x{len(runs)}: "
+            f"p50 {percentile(wall, 50):.2f}s, "
+            f"p90 {percentile(wall, 90):.2f}s, "
+            f"p99 {percentile(wall, 99):.2f}s, "
+            f"{calls / len(runs):.1f} calls/plan "
+            f"({hedges / max(calls, 1):.1%} hedges)"
+        )
+
+
+def parse_weeks(value: str) -> list[int]:
+    if "-" in value:
+        first, last = value.split("-")
+        return list(range(int(first), int(last) + 1))
+    return [int(week) for week in value.split(",")]
+
+
+async def main(args: argparse.Namespace) -> None:
+    latency = LatencyProfile(
+        distribution=args.distribution,
+        mean=args.latency_mean,
+        spread=args.latency_spread,
+        straggler_rate=args.straggler_rate,
+        straggler_factor=args.straggler_factor,
+    )
+    latency_tracker = LatencyTracker()
+    results = []
+    # save_to_json writes to the working directory, keep it out of the repo
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+        templates = (
+            TemplateStore(path="templates.sqlite") if args.templates else None
+        )
+        for weeks in parse_weeks(args.weeks):
+            for repeat in range(args.repeat):
+                results.append(
+                    await run_once(
+                        weeks=weeks,
+                        requests_per_minute=args.requests_per_minute,
+                        tokens_per_minute=args.tokens_per_minute,
+                        max_concurrency=args.max_concurrency,
+                        workout_batches=args.workout_batches,
+                        stream_plan=args.stream_plan,
+                        hedge_percentile=args.hedge_percentile,
+                        workout_deadline=args.workout_deadline,
+                        latency=latency,
+                        error_rate=args.error_rate,
+                        malformed_rate=args.malformed_rate,
+                        seed=args.seed + repeat,
+                        latency_tracker=latency_tracker,
+                        routing=args.routing,
+                        templates=templates,
+                        rule_based_easy_days=args.rule_based_easy_days,
+                    )
+                )
+    print_results(results)
+    if args.repeat > 1:
+        print_percentiles(results)
+    if args.routing == "tiered":
+        print()
+        print_routing_summary(
+            fake_tiers(latency),
+            merged_tier_stats(results),
+            merged_counts(result.escalations or {} for result in results),
+        )
+
+
+def merged_tier_stats(
+    results: list[BenchmarkResult],
+) -> dict[str, SchedulerStats]:
+    merged: dict[str, SchedulerStats] = {}
+    for result in results:
+        for name, stats in (result.tier_stats or {}).items():
+            total = merged.setdefault(name, SchedulerStats())
+            total.calls += stats.calls
+            total.completed += stats.completed
+            total.errors += stats.errors
+            total.call_seconds += stats.call_seconds
+            total.input_tokens += stats.input_tokens
+            total.output_tokens += stats.output_tokens
+            total.cache_read_tokens += stats.cache_read_tokens
+            total.cache_creation_tokens += stats.cache_creation_tokens
+    return merged
+
+
+def merged_counts(counts) -> dict[str, int]:
+    merged: dict[str, int] = {}
+    for count in counts:
+        for key, value in count.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def parse_optional_float(value: str) -> float | None:
+    return None if value.lower() == "none" else float(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", default="1-12")
+    parser.add_argument("--requests-per-minute", type=float, default=3000)
+    parser.add_argument("--tokens-per-minute", type=float, default=1e7)
+    parser.add_argument("--max-concurrency", type=int, default=10)
+    parser.add_argument(
+        "--workout-batches",
+        type=int,
+        default=None,
+        help="Generate each week's workouts in N calls instead of per day",
+    )
+    parser.add_argument(
+        "--stream-plan",
+        action="store_true",
+        help="Start weekly planning as soon as the plan fields are final",
+    )
+    parser.add_argument(
+        "--distribution",
+        choices=["constant", "uniform", "exponential", "lognormal"],
+        default="lognormal",
+    )
+    parser.add_argument("--latency-mean", type=float, default=0.05)
+    parser.add_argument("--latency-spread", type=float, default=0.5)
+    parser.add_argument(
+        "--straggler-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of calls that stall for --straggler-factor x latency",
+    )
+    parser.add_argument("--straggler-factor", type=float, default=10.0)
+    parser.add_argument(
+        "--hedge-percentile",
+        type=parse_optional_float,
+        default=95.0,
+        help="Latency percentile that triggers a hedged request, or none",
+    )
+    parser.add_argument(
+        "--workout-deadline",
+        type=float,
+        default=None,
+        help="Seconds before a workout call attempt is abandoned and retried",
+    )
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--malformed-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of workout responses returned as broken JSON",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--routing",
+        choices=["single", "tiered"],
+        default="single",
+        help="One model for every call, or per call type model tiers",
+    )
+    parser.add_argument(
+        "--templates",
+        action="store_true",
+        help="Reuse weeks and workouts from earlier runs via a template store",
+    )
+    parser.add_argument(
+        "--rule-based-easy-days",
+        action="store_true",
+        help="Build easy and recovery days from rules instead of the model",
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,149 @@
+"""Benchmark graph state overhead with the SQLite checkpointer enabled.
+
+Runs the full plan graph against the offline model with zero latency, so
+what's left is LangGraph's own work: copying and serialising state into
+`Send` payloads, channel updates and checkpoints. Reports wall time, peak
+Python allocations (tracemalloc) and the bytes written to the checkpoint
+database, split into checkpoints and pending writes.
+
+    python -m coach.benchmarks.graph_state --weeks 12 --repeat 5
+    python -m coach.benchmarks.graph_state --checkpointer none
+"""
+
+import argparse
+import asyncio
+import contextlib
+import sqlite3
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+from dataclasses import dataclass
+
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from coach.benchmarks.graph_latency import benchmark_input
+from coach.main import build_training_plan_graph, build_weekly_workout_graph
+from coach.models.dependencies import Dependencies
+from coach.models.fake import LatencyProfile
+
+
+@dataclass
+class StateResult:
+    wall_seconds: float
+    peak_bytes: int
+    checkpoints: int = 0
+    checkpoint_bytes: int = 0
+    write_bytes: int = 0
+
+
+def checkpoint_sizes(path: str, thread_id: str) -> tuple[int, int, int]:
+    with contextlib.closing(sqlite3.connect(path)) as conn:
+        checkpoints, checkpoint_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(checkpoint) + "
+            "LENGTH(metadata)), 0) FROM checkpoints WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()
+        (write_bytes,) = conn.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes "
+            "WHERE thread_id = ?",
+            (thread_id,),
+        ).fetchone()
+    return checkpoints, checkpoint_bytes, write_bytes
+
+
+async def run_once(
+    weeks: int, workouts_per_week: int, checkpoint_path: str | None
+) -> StateResult:
+    deps = Dependencies(
+        model_name="fake-coach",
+        provider="fake",
+        cache_path=None,
+        # No rate limiting or hedging, only graph overhead is left
+        requests_per_minute=1e6,
+        tokens_per_minute=1e9,
+        hedge_percentile=None,
+        fake_options={
+            "latency": LatencyProfile(distribution="constant", mean=0)
+        },
+    )
+    builder = build_training_plan_graph(
+        deps=deps, weekly_graph=build_weekly_workout_graph(deps=deps)
+    )
+    plan_input = {
+        **benchmark_input(weeks),
+        "workouts_per_week": workouts_per_week,
+    }
+    thread_id = uuid.uuid4().hex
+
+    async with contextlib.AsyncExitStack() as stack:
+        if checkpoint_path is None:
+            graph = builder.compile()
+        else:
+            checkpointer = await stack.enter_async_context(
+                AsyncSqliteSaver.from_conn_string(checkpoint_path)
+            )
+            graph = builder.compile(checkpointer=checkpointer)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        await graph.ainvoke(
+            plan_input, {"configurable": {"thread_id": thread_id}}
+        )
+        wall_seconds = time.perf_counter() - start
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    result = StateResult(wall_seconds=wall_seconds, peak_bytes=peak_bytes)
+    if checkpoint_path is not None:
+        (
+            result.checkpoints,
+            result.checkpoint_bytes,
+            result.write_bytes,
+        ) = checkpoint_sizes(checkpoint_path, thread_id)
+    return result
+
+
+async def main(args: argparse.Namespace) -> None:
+    results = []
+    # Plans and run chunks are written to the working directory
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+        checkpoint_path = (
+            "checkpoints.sqlite" if args.checkpointer == "sqlite" else None
+        )
+        for _ in range(args.repeat):
+            results.append(
+                await run_once(
+                    args.weeks, args.workouts_per_week, checkpoint_path
+                )
+            )
+
+    def median(values: list[float]) -> float:
+        return statistics.median(values)
+
+    print(
+        f"{args.weeks} weeks x {args.workouts_per_week} workouts, "
+        f"checkpointer {args.checkpointer}, median of {args.repeat}"
+    )
+    print(f"wall time       {median([r.wall_seconds for r in results]):.3f}s")
+    print(
+        f"peak allocated  "
+        f"{median([r.peak_bytes for r in results]) / 2**20:.1f} MiB"
+    )
+    if args.checkpointer == "sqlite":
+        last = results[-1]
+        print(f"checkpoints     {last.checkpoints}")
+        print(f"checkpoint data {last.checkpoint_bytes / 1024:.1f} KiB")
+        print(f"pending writes  {last.write_bytes / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--workouts-per-week", type=int, default=6)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--checkpointer", choices=["sqlite", "none"], default="sqlite"
+    )
+    asyncio.run(main(parser.parse_args()))
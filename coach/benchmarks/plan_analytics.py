@@ -0,0 +1,109 @@
+"""Benchmark vectorized training load analytics against a per-object loop.
+
+Builds `--plans` synthetic plans, then computes weekly load for the batch
+with a plain Python loop over the validated `TrainingPlan` objects and with
+`analytics.load`, both from the models and from decoded JSON. The metrics
+step alone (everything after flattening) is timed separately.
+
+    python -m coach.benchmarks.plan_analytics --plans 2000
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from coach.analytics.load import (
+    DEFAULT_PACE,
+    DEFAULT_ZONE_WEIGHTS,
+    METERS_PER_UNIT,
+    SPORT_CODES,
+    analyse_plans,
+    flatten_plans,
+    training_load,
+)
+from coach.benchmarks.plan_reader import synthetic_plan
+from coach.models.schema import TrainingPlan
+
+
+def loop_weekly_load(plans: list[TrainingPlan]) -> list[list[float]]:
+    """Reference implementation walking the Pydantic objects"""
+    loads = []
+    for plan in plans:
+        weekly = []
+        for week in plan.weekly_workouts:
+            load = 0.0
+            for workout in week.workouts:
+                sport = SPORT_CODES[workout.sport.value]
+                for segment in (
+                    workout.warmup,
+                    *workout.intervals,
+                    workout.cooldown,
+                ):
+                    zone = segment.effort.value
+                    minutes = segment.duration_estimate
+                    if minutes is None:
+                        kilometers = (
+                            segment.distance
+                            * METERS_PER_UNIT[segment.distance_unit.value]
+                            / 1000
+                        )
+                        minutes = kilometers * DEFAULT_PACE[sport, zone - 1]
+                    load += minutes * DEFAULT_ZONE_WEIGHTS[zone - 1]
+            weekly.append(load)
+        loads.append(weekly)
+    return loads
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main(args: argparse.Namespace) -> None:
+    plans = [
+        synthetic_plan(args.weeks, seed) for seed in range(args.plans)
+    ]
+    decoded = [plan.model_dump(mode="json") for plan in plans]
+
+    expected, loop_seconds = timed(loop_weekly_load, plans)
+    from_models, model_seconds = timed(analyse_plans, plans)
+    from_json, json_seconds = timed(analyse_plans, decoded)
+    assert np.allclose(from_models.load, np.array(expected))
+    assert np.allclose(from_json.load, from_models.load)
+    columns = flatten_plans(decoded)
+    _, metrics_seconds = timed(training_load, columns)
+
+    rows = sum(
+        len(workout.intervals) + 2
+        for plan in plans
+        for week in plan.weekly_workouts
+        for workout in week.workouts
+    )
+    print(f"{args.plans} plans x {args.weeks} weeks, {rows} intervals")
+    print(f"{'path':<28} {'ms':>9}")
+    print(f"{'loop (weekly load only)':<28} {loop_seconds * 1e3:>9.1f}")
+    print(f"{'analytics from models':<28} {model_seconds * 1e3:>9.1f}")
+    print(f"{'analytics from json':<28} {json_seconds * 1e3:>9.1f}")
+    print(f"{'metrics on columns':<28} {metrics_seconds * 1e3:>9.1f}")
+
+    summary = from_json.summary()
+    riskiest = from_json.rank()[-1]
+    print(
+        "riskiest plan:",
+        json.dumps(
+            {
+                key: float(values[riskiest])
+                for key, values in summary.items()
+            }
+        ),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=2000)
+    parser.add_argument("--weeks", type=int, default=12)
+    main(parser.parse_args())
@@ -0,0 +1,126 @@
+"""Benchmark `PlanReader` lookups against loading the whole plan.
+
+Writes a synthetic plan of `--weeks` weeks, then compares looking up a
+single (week, day) workout via `TrainingPlan.model_validate_json` on the
+full document with `PlanReader`, both on first open (index built) and on
+later opens (sidecar index reused). Peak Python allocations are measured
+with tracemalloc.
+
+    python -m coach.benchmarks.plan_reader --weeks 52
+"""
+
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+from coach.models.fake import PAYLOAD_BUILDERS
+from coach.models.schema import TrainingPlan, WeeklyWorkout, Workout
+from coach.storage.reader import PlanReader, training_days
+from coach.storage.writer import atomic_write
+
+
+def synthetic_plan(weeks: int, seed: int) -> TrainingPlan:
+    rng = random.Random(seed)
+    prompt = "Sports: RUNNING, SWIMMING, CYCLING"
+    weekly_workouts = []
+    for week_index in range(1, weeks + 1):
+        week = PAYLOAD_BUILDERS["WeeklyWorkout"](
+            rng, f"Week Index: {week_index}"
+        )
+        week["workouts"] = [
+            PAYLOAD_BUILDERS["Workout"](rng, prompt)
+            for _ in training_days(week["rest_days"])
+        ]
+        weekly_workouts.append(WeeklyWorkout.model_validate(week))
+    return TrainingPlan(
+        weekly_workouts=weekly_workouts,
+        plan_duration_weeks=weeks,
+        plan_description=f"Synthetic {weeks} week plan",
+        progression_strategy="Add 10% volume per week",
+    )
+
+
+def lookup_full(path: Path, week_index: int, day: int) -> Workout | None:
+    plan = TrainingPlan.model_validate_json(path.read_bytes())
+    week = plan.weekly_workouts[week_index - 1]
+    days = training_days(week.rest_days)
+    return week.workouts[days.index(day)] if day in days else None
+
+
+def lookup_reader(path: Path, week_index: int, day: int) -> Workout | None:
+    with PlanReader(path, write_index=True) as plan:
+        return plan.workout(week_index, day)
+
+
+def measure(
+    lookup: Callable[[], Any], repeats: int, before: Callable[[], Any]
+) -> tuple[float, int]:
+    timings = []
+    for _ in range(repeats):
+        before()
+        start = time.perf_counter()
+        lookup()
+        timings.append(time.perf_counter() - start)
+
+    before()
+    tracemalloc.start()
+    lookup()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(timings), peak
+
+
+def main(args: argparse.Namespace) -> None:
+    plan = synthetic_plan(args.weeks, args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = Path(workdir) / "training_plan.json"
+        atomic_write(path, [plan.model_dump_json()])
+        index_path = path.with_name(path.name + ".idx")
+
+        week_index = args.weeks
+        day = training_days(plan.weekly_workouts[-1].rest_days)[-1]
+        expected = lookup_full(path, week_index, day)
+        assert lookup_reader(path, week_index, day) == expected
+
+        def drop_index() -> None:
+            index_path.unlink(missing_ok=True)
+
+        def keep_index() -> None:
+            PlanReader(path, write_index=True).close()
+
+        results = {
+            "model_validate_json": measure(
+                lambda: lookup_full(path, week_index, day),
+                args.repeats,
+                lambda: None,
+            ),
+            "reader (cold index)": measure(
+                lambda: lookup_reader(path, week_index, day),
+                args.repeats,
+                drop_index,
+            ),
+            "reader (warm index)": measure(
+                lambda: lookup_reader(path, week_index, day),
+                args.repeats,
+                keep_index,
+            ),
+        }
+
+        size_kib = path.stat().st_size / 1024
+        print(f"{args.weeks} weeks, {size_kib:.0f} KiB plan")
+        print(f"{'lookup':<20} {'ms':>9} {'peak_kib':>9}")
+        for name, (seconds, peak) in results.items():
+            print(f"{name:<20} {seconds * 1e3:>9.3f} {peak / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=52)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
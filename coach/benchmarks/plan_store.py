@@ -0,0 +1,92 @@
+"""Benchmark the binary plan format against JSON for size and speed.
+
+Encodes `--plans` synthetic plans with `model_dump_json` (optionally
+zlib compressed) and with `storage.binary.encode_plan`, checks every
+binary round trip is exact, and reports total size plus median encode and
+decode time per plan. JSON decodes with `model_validate_json`.
+
+    python -m coach.benchmarks.plan_store --plans 200 --weeks 10
+"""
+
+import argparse
+import statistics
+import time
+import zlib
+from collections.abc import Callable
+
+from coach.benchmarks.plan_reader import synthetic_plan
+from coach.models.schema import TrainingPlan
+from coach.storage.binary import decode_plan, encode_plan
+
+
+def json_encode(plan: TrainingPlan) -> bytes:
+    return plan.model_dump_json().encode()
+
+
+def json_decode(data: bytes) -> TrainingPlan:
+    return TrainingPlan.model_validate_json(data)
+
+
+FORMATS: dict[
+    str,
+    tuple[Callable[[TrainingPlan], bytes], Callable[[bytes], TrainingPlan]],
+] = {
+    "json": (json_encode, json_decode),
+    "json + zlib": (
+        lambda plan: zlib.compress(json_encode(plan)),
+        lambda data: json_decode(zlib.decompress(data)),
+    ),
+    "binary": (
+        lambda plan: encode_plan(plan, compress=False),
+        decode_plan,
+    ),
+    "binary + zlib": (encode_plan, decode_plan),
+}
+
+
+def median_seconds(fn: Callable, arg, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(args: argparse.Namespace) -> None:
+    plans = [synthetic_plan(args.weeks, seed) for seed in range(args.plans)]
+
+    print(f"{args.plans} plans x {args.weeks} weeks")
+    print(
+        f"{'format':<14} {'KiB':>9} {'ratio':>6} "
+        f"{'encode ms':>10} {'decode ms':>10}"
+    )
+    json_bytes = None
+    for name, (encode, decode) in FORMATS.items():
+        encoded = [encode(plan) for plan in plans]
+        if name.startswith("binary"):
+            for plan, data in zip(plans, encoded):
+                decoded = decode(data)
+                assert decoded == plan, "binary round trip changed the plan"
+                assert decoded.model_dump_json() == plan.model_dump_json()
+
+        size = sum(map(len, encoded))
+        json_bytes = json_bytes or size
+        encode_seconds = statistics.median(
+            median_seconds(encode, plan, args.repeat) for plan in plans
+        )
+        decode_seconds = statistics.median(
+            median_seconds(decode, data, args.repeat) for data in encoded
+        )
+        print(
+            f"{name:<14} {size / 1024:>9.1f} {json_bytes / size:>5.1f}x "
+            f"{encode_seconds * 1e3:>10.3f} {decode_seconds * 1e3:>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=200)
+    parser.add_argument("--weeks", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
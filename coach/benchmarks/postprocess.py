@@ -0,0 +1,125 @@
+"""Benchmark plan post-processing on the event loop against the process pool.
+
+Writes `--plans` synthetic plans to a temporary directory, then validates,
+enriches and exports them twice: inline on the event loop, one chunk at a
+time, and through `postprocess.postprocess_plans`. A ticker coroutine runs
+alongside both and reports the worst event loop stall, which is what the
+network side of a batch would see.
+
+    python -m coach.benchmarks.postprocess --plans 2000
+    python -m coach.benchmarks.postprocess --workers 4 --chunk-size 32
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from pathlib import Path
+
+from coach.benchmarks.plan_reader import synthetic_plan
+from coach.models.schema import TrainingPlan
+from coach.postprocess import (
+    available_cores,
+    export_chunk,
+    postprocess_plans,
+    stage_chunk,
+)
+from coach.storage.writer import atomic_write
+
+
+async def inline_postprocess(
+    paths: list[Path], export_dir: Path, chunk_size: int
+) -> None:
+    """Same work as the pool, run on the event loop between awaits"""
+    export_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(0, len(paths), chunk_size):
+        shm, entries = stage_chunk(paths[i : i + chunk_size])
+        try:
+            export_chunk(shm.name, entries, str(export_dir))
+        finally:
+            shm.close()
+            shm.unlink()
+        await asyncio.sleep(0)
+
+
+async def max_loop_lag(
+    stop: asyncio.Event, interval: float = 0.005
+) -> float:
+    """Longest delay past `interval` of a sleeping coroutine, seconds"""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def timed(work) -> tuple[float, float]:
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(max_loop_lag(stop))
+    # Let the ticker start its first sleep, or inline work that doesn't
+    # yield straight away would run before it and go unmeasured
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await work
+    seconds = time.perf_counter() - start
+    stop.set()
+    return seconds, await ticker
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        plan_dir = Path(workdir) / "plans"
+        paths = [
+            atomic_write(
+                plan_dir / f"athlete-{seed}.json",
+                [synthetic_plan(args.weeks, seed).model_dump_json()],
+            )
+            for seed in range(args.plans)
+        ]
+        megabytes = sum(path.stat().st_size for path in paths) / 2**20
+
+        inline_seconds, inline_lag = await timed(
+            inline_postprocess(
+                paths, Path(workdir) / "inline", args.chunk_size
+            )
+        )
+        pool_seconds, pool_lag = await timed(
+            postprocess_plans(
+                paths,
+                Path(workdir) / "pool",
+                workers=args.workers,
+                chunk_size=args.chunk_size,
+            )
+        )
+
+        # Both paths must export the same documents
+        for path in paths[:: max(len(paths) // 20, 1)]:
+            inline = (Path(workdir) / "inline" / path.name).read_bytes()
+            pooled = (Path(workdir) / "pool" / path.name).read_bytes()
+            assert inline == pooled, path.name
+        TrainingPlan.model_validate_json(paths[0].read_bytes())
+
+    workers = args.workers or available_cores()
+    print(
+        f"{args.plans} plans x {args.weeks} weeks ({megabytes:.1f} MiB), "
+        f"chunks of {args.chunk_size}"
+    )
+    print(f"{'path':<16} {'seconds':>8} {'plans/s':>8} {'max loop lag':>13}")
+    for label, seconds, lag in (
+        ("event loop", inline_seconds, inline_lag),
+        (f"pool x{workers}", pool_seconds, pool_lag),
+    ):
+        print(
+            f"{label:<16} {seconds:>8.2f} {args.plans / seconds:>8.0f} "
+            f"{lag * 1e3:>10.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=2000)
+    parser.add_argument("--weeks", type=int, default=12)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,111 @@
+"""Check that prompt cache prefixes are byte-identical across a run.
+
+Generates `--plans` plans for different athletes against the offline
+`FakeCoachChatModel`, which records the request prefix up to every
+`cache_control` breakpoint and simulates the provider's prompt cache.
+Fails if any call type sends more than one distinct prefix within a plan,
+or if the first (instructions) block differs between plans, and reports
+how much of the input was served from the cache.
+
+    python -m coach.benchmarks.prompt_prefix --weeks 8
+    python -m coach.benchmarks.prompt_prefix --workout-batches 2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import tempfile
+
+from coach.benchmarks.graph_latency import benchmark_input
+from coach.main import build_training_plan_graph, build_weekly_workout_graph
+from coach.models.dependencies import Dependencies
+from coach.models.enums import Goal, Sport
+
+# Athletes differ in everything that ends up in the plan context
+ATHLETES = [
+    {
+        "training_goal": Goal.ENDURANCE,
+        "sports": (Sport.SWIMMING, Sport.RUNNING),
+    },
+    {"training_goal": Goal.SPEED, "sports": (Sport.CYCLING,)},
+    {"training_goal": Goal.BASE, "sports": (Sport.RUNNING,)},
+]
+
+
+async def run_plans(args: argparse.Namespace) -> list[str]:
+    """Run the plans, returning every prefix mismatch found"""
+    deps = Dependencies(
+        model_name="fake-coach",
+        provider="fake",
+        cache_path=None,
+        fake_options={"seed": args.seed},
+    )
+    graph = build_training_plan_graph(
+        deps=deps,
+        weekly_graph=build_weekly_workout_graph(
+            deps=deps, workout_batches=args.workout_batches
+        ),
+        stream_plan=args.stream_plan,
+    ).compile()
+    model = deps.llm_client
+
+    problems = []
+    instructions: dict[str, set[str]] = {}
+    for plan in range(args.plans):
+        # The simulated prompt cache survives, only the counters reset
+        model.reset_stats()
+        await graph.ainvoke(
+            {**benchmark_input(args.weeks), **ATHLETES[plan % len(ATHLETES)]}
+        )
+
+        stats = model.stats
+        print(f"plan {plan + 1}: {stats.calls} calls")
+        for schema, prefixes in sorted(stats.cache_prefixes.items()):
+            calls = stats.calls_by_schema.get(schema, 0)
+            print(
+                f"  {schema:<14} {calls:>3} calls, {len(prefixes)} distinct "
+                f"prefix, {len(next(iter(prefixes)))} breakpoints"
+            )
+            if len(prefixes) != 1:
+                problems.append(
+                    f"plan {plan + 1}: {schema} sent {len(prefixes)} "
+                    "different cached prefixes"
+                )
+            instructions.setdefault(schema, set()).update(
+                prefix[0] for prefix in prefixes
+            )
+        share = stats.cache_read_tokens / max(stats.input_tokens, 1)
+        print(
+            f"  cache read {stats.cache_read_tokens} of {stats.input_tokens} "
+            f"input tokens ({share:.0%}), "
+            f"written {stats.cache_creation_tokens}"
+        )
+
+    for schema, prefixes in sorted(instructions.items()):
+        if len(prefixes) != 1:
+            problems.append(
+                f"{schema} instructions differ between plans "
+                f"({len(prefixes)} variants)"
+            )
+    return problems
+
+
+async def main(args: argparse.Namespace) -> None:
+    # save_to_json writes to the working directory, keep it out of the repo
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+        problems = await run_plans(args)
+    for problem in problems:
+        print(f"MISMATCH {problem}")
+    if problems:
+        raise SystemExit(1)
+    print("Cached prefixes are byte-identical")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--plans", type=int, default=2)
+    parser.add_argument("--workout-batches", type=int, default=None)
+    parser.add_argument("--stream-plan", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
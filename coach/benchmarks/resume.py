@@ -0,0 +1,110 @@
+"""Check that a checkpointed run resumes after its first model call failed.
+
+Runs the training plan graph against the offline `FakeCoachChatModel`
+with every call failing and retries off, so the run stops at
+`generate_high_level_plan` with only its input checkpointed. The faults
+are then switched off and the run is resumed by streaming None under the
+same thread id, as `run_coach --run-id` and `coach batch --batch-id` do.
+Both the default input (no injuries or limitations) and one with
+limitations are checked. Exits 1 when a resume fails or writes no plan.
+
+    python -m coach.benchmarks.resume --weeks 4
+"""
+
+import argparse
+import asyncio
+import contextlib
+import sys
+import tempfile
+from pathlib import Path
+
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from coach.benchmarks.graph_latency import benchmark_input
+from coach.main import build_training_plan_graph, build_weekly_workout_graph
+from coach.models.dependencies import Dependencies
+from coach.models.schema import TrainingPlan
+from coach.models.scheduler import CallScheduler
+from coach.models.states import TrainingPlanInput
+
+CASES = {
+    "no limitations": None,
+    "with limitations": ["Sore left knee"],
+}
+
+
+async def check_resume(
+    weeks: int, injuries_or_limitations: list[str] | None, thread_id: str
+) -> str | None:
+    """Why the resumed run failed, None when it wrote a complete plan"""
+    deps = Dependencies(
+        model_name="fake-coach",
+        provider="fake",
+        cache_path=None,
+        scheduler=CallScheduler(
+            requests_per_minute=1e6, tokens_per_minute=1e9, max_retries=0
+        ),
+        fake_options={"error_rate": 1.0, "seed": 0},
+    )
+    builder = build_training_plan_graph(
+        deps=deps, weekly_graph=build_weekly_workout_graph(deps=deps)
+    )
+    plan_input = TrainingPlanInput(
+        **{
+            **benchmark_input(weeks),
+            "injuries_or_limitations": injuries_or_limitations,
+        }
+    )
+    output_path = Path(f"{thread_id}.json")
+    config = {
+        "configurable": {
+            "thread_id": thread_id,
+            "output_path": str(output_path),
+        }
+    }
+
+    async with AsyncSqliteSaver.from_conn_string(
+        "checkpoints.sqlite"
+    ) as checkpointer:
+        graph = builder.compile(checkpointer=checkpointer)
+        try:
+            await graph.ainvoke(plan_input, config)
+        except Exception:
+            pass
+        else:
+            return "the first attempt didn't fail"
+        snapshot = await graph.aget_state(config)
+        if snapshot.next != ("generate_high_level_plan",):
+            return f"first attempt stopped at {snapshot.next}"
+
+        deps.llm_client.error_rate = 0.0
+        try:
+            await graph.ainvoke(None, config)
+        except Exception as error:
+            return f"resume failed: {error!r}"
+
+    if not output_path.exists():
+        return "resume wrote no plan"
+    plan = TrainingPlan.model_validate_json(output_path.read_bytes())
+    if len(plan.weekly_workouts) != weeks:
+        return f"resumed plan has {len(plan.weekly_workouts)} weeks"
+    return None
+
+
+async def main(args: argparse.Namespace) -> int:
+    failures = 0
+    # save_to_json and the checkpointer write to the working directory
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+        for index, (label, limitations) in enumerate(CASES.items()):
+            problem = await check_resume(
+                args.weeks, limitations, f"resume-{index}"
+            )
+            failures += problem is not None
+            print(f"{label:<18} {problem or 'ok'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--weeks", type=int, default=4)
+    sys.exit(asyncio.run(main(parser.parse_args())))
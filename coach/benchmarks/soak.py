@@ -0,0 +1,512 @@
+"""Soak test the training plan graph with many plans in flight.
+
+Drives `build_training_plan_graph` against the offline
+`FakeCoachChatModel` with `--plans` plans, `--concurrency` of them in
+flight at a time, all sharing one `Dependencies` as a batch run does. The
+fake model can inject latency spikes (stragglers), 429 / 529 errors,
+client timeouts and malformed workout JSON, and a per-call deadline turns
+spikes into scheduler timeouts.
+
+While the plans run, a monitor task on the same event loop samples loop
+lag, RSS, scheduler queue depth and calls in flight. The report covers
+throughput, plan latency percentiles, memory growth, and how failures
+propagated: the exception each failed plan surfaced, and model calls that
+kept running (or started) after their plan had already failed.
+
+    python -m coach.benchmarks.soak --plans 500 --concurrency 100 \
+        --error-rate 0.05 --malformed-rate 0.1 --straggler-rate 0.02 \
+        --report soak.json
+
+Runs are seeded, so the same arguments give the same calls and faults.
+`--baseline` compares against an earlier `--report` and exits 1 when a
+metric regressed by more than `--tolerance`, for gating changes in CI:
+
+    python -m coach.benchmarks.soak --baseline soak.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langgraph.checkpoint.memory import MemorySaver
+
+from coach.batch import percentile
+from coach.benchmarks.graph_latency import benchmark_input
+from coach.main import build_training_plan_graph, build_weekly_workout_graph
+from coach.models.dependencies import Dependencies
+from coach.models.fake import LatencyProfile
+from coach.models.scheduler import CallPriority, CallScheduler
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+# Metric, and whether higher values are better, checked by --baseline
+GATED_METRICS = {
+    "throughput_plans_per_second": True,
+    "success_rate": True,
+    "plan_latency_p50_seconds": False,
+    "plan_latency_p99_seconds": False,
+    "loop_lag_p99_ms": False,
+    "rss_growth_mib": False,
+    "orphaned_calls": False,
+}
+
+
+def rss_bytes() -> int:
+    """Current resident set size, peak RSS where /proc isn't available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # ru_maxrss is KiB on Linux and bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+class PlanCalls(AsyncCallbackHandler):
+    """Model calls made on behalf of one plan, and when they ran.
+
+    Passed as a run callback, so calls in tasks the graph's nodes spawn
+    are attributed to the plan too.
+    """
+
+    def __init__(self) -> None:
+        self.open: set[Any] = set()
+        self.failed_at: float | None = None
+        # Calls in flight when the plan failed, those of them that still
+        # ran to completion, and calls started after it failed
+        self.in_flight_at_failure = 0
+        self.finished_after_failure = 0
+        self.started_after_failure = 0
+
+    async def on_chat_model_start(
+        self, serialized: Any, messages: Any, *, run_id: Any, **kwargs: Any
+    ) -> None:
+        if self.failed_at is not None:
+            self.started_after_failure += 1
+        self.open.add(run_id)
+
+    async def on_llm_end(self, response: Any, *, run_id: Any, **kwargs: Any):
+        self.open.discard(run_id)
+        if self.failed_at is not None:
+            self.finished_after_failure += 1
+
+    async def on_llm_error(
+        self, error: BaseException, *, run_id: Any, **kwargs: Any
+    ) -> None:
+        self.open.discard(run_id)
+        if self.failed_at is not None:
+            self.finished_after_failure += 1
+
+    def failed(self) -> None:
+        self.failed_at = time.perf_counter()
+        self.in_flight_at_failure = len(self.open)
+
+    @property
+    def orphaned(self) -> int:
+        """Calls that kept using model capacity after the plan failed"""
+        return self.finished_after_failure + self.started_after_failure
+
+    @property
+    def cancelled(self) -> int:
+        # Cancelled calls never report an end or error, once everything has
+        # drained they are the ones still open
+        return len(self.open)
+
+
+@dataclass
+class PlanResult:
+    latency_seconds: float
+    error: str | None = None
+    calls: PlanCalls | None = None
+
+
+@dataclass
+class Samples:
+    loop_lag_ms: list[float] = field(default_factory=list)
+    rss: list[int] = field(default_factory=list)
+    queue_depth: list[int] = field(default_factory=list)
+    scheduler_in_flight: list[int] = field(default_factory=list)
+    plans_in_flight: list[int] = field(default_factory=list)
+
+
+async def monitor(
+    samples: Samples,
+    scheduler: CallScheduler,
+    plans_in_flight: list[int],
+    interval: float,
+) -> None:
+    """Sample the loop and process state until cancelled"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        # Anything past the requested sleep is time the loop was busy
+        samples.loop_lag_ms.append(
+            max(0.0, time.perf_counter() - start - interval) * 1e3
+        )
+        samples.rss.append(rss_bytes())
+        samples.queue_depth.append(scheduler.queue_depth)
+        samples.scheduler_in_flight.append(scheduler.in_flight)
+        samples.plans_in_flight.append(plans_in_flight[0])
+
+
+def root_cause(error: BaseException) -> BaseException:
+    """The first leaf of exception groups, as reported per failed plan"""
+    while isinstance(error, BaseExceptionGroup):
+        error = error.exceptions[0]
+    return error
+
+
+async def run_plan(
+    graph: Any,
+    weeks: int,
+    plan_index: int,
+    in_flight: asyncio.Semaphore,
+    plans_in_flight: list[int],
+) -> PlanResult:
+    async with in_flight:
+        calls = PlanCalls()
+        config = {
+            "callbacks": [calls],
+            "configurable": {"thread_id": f"soak-{plan_index}"},
+        }
+        plans_in_flight[0] += 1
+        start = time.perf_counter()
+        try:
+            await graph.ainvoke(benchmark_input(weeks), config)
+        except Exception as error:
+            calls.failed()
+            cause = root_cause(error)
+            return PlanResult(
+                latency_seconds=time.perf_counter() - start,
+                error=type(cause).__name__,
+                calls=calls,
+            )
+        finally:
+            plans_in_flight[0] -= 1
+        return PlanResult(latency_seconds=time.perf_counter() - start)
+
+
+async def drain(deps: Dependencies, timeout: float) -> float:
+    """Seconds until no model call is left running, capped at `timeout`"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if not deps.scheduler.in_flight and not deps.scheduler.queue_depth:
+            break
+        await asyncio.sleep(0.01)
+    return time.perf_counter() - start
+
+
+def build_deps(args: argparse.Namespace) -> Dependencies:
+    scheduler = CallScheduler(
+        requests_per_minute=args.requests_per_minute,
+        tokens_per_minute=args.tokens_per_minute,
+        max_concurrency=args.max_concurrency,
+        max_retries=args.max_retries,
+        base_backoff_seconds=args.backoff,
+        max_backoff_seconds=args.backoff * 8,
+        deadlines=(
+            {CallPriority.WORKOUT: args.workout_deadline}
+            if args.workout_deadline
+            else {}
+        ),
+        hedge_percentile=None,
+    )
+    return Dependencies(
+        model_name="fake-coach",
+        provider="fake",
+        cache_path=None,
+        scheduler=scheduler,
+        fake_options={
+            "latency": LatencyProfile(
+                distribution="lognormal",
+                mean=args.latency_mean,
+                spread=0.5,
+                straggler_rate=args.straggler_rate,
+                straggler_factor=args.straggler_factor,
+            ),
+            "error_rate": args.error_rate,
+            "error_kinds": args.error_kinds,
+            "malformed_rate": args.malformed_rate,
+            "seed": args.seed,
+        },
+    )
+
+
+async def soak(args: argparse.Namespace) -> dict[str, Any]:
+    deps = build_deps(args)
+    builder = build_training_plan_graph(
+        deps=deps,
+        weekly_graph=build_weekly_workout_graph(
+            deps=deps, workout_batches=args.workout_batches
+        ),
+    )
+    # A checkpointer keeps every plan's state for the life of the process,
+    # as a long-running service would
+    graph = builder.compile(
+        checkpointer=MemorySaver() if args.checkpointer == "memory" else None
+    )
+
+    samples = Samples()
+    plans_in_flight = [0]
+    in_flight = asyncio.Semaphore(args.concurrency)
+    rss_start = rss_bytes()
+    monitor_task = asyncio.create_task(
+        monitor(samples, deps.scheduler, plans_in_flight, args.sample_interval)
+    )
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[
+            run_plan(graph, args.weeks, index, in_flight, plans_in_flight)
+            for index in range(args.plans)
+        ]
+    )
+    wall_seconds = time.perf_counter() - start
+    # Calls orphaned by failed plans may still be running
+    drain_seconds = await drain(deps, timeout=60)
+    rss_end = rss_bytes()
+    monitor_task.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await monitor_task
+
+    succeeded = [r for r in results if r.error is None]
+    failed = [r for r in results if r.error is not None]
+    latencies = [r.latency_seconds for r in succeeded]
+    errors: dict[str, int] = {}
+    for result in failed:
+        errors[result.error] = errors.get(result.error, 0) + 1
+    stats = deps.scheduler.stats
+    fake_stats = deps.llm_client.stats
+    rss_peak = max(samples.rss, default=rss_end)
+
+    return {
+        "config": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("report", "baseline", "tolerance")
+        },
+        "plans": args.plans,
+        "succeeded": len(succeeded),
+        "success_rate": len(succeeded) / args.plans,
+        "wall_seconds": wall_seconds,
+        "throughput_plans_per_second": len(succeeded) / wall_seconds,
+        "plan_latency_p50_seconds": percentile(latencies, 50),
+        "plan_latency_p90_seconds": percentile(latencies, 90),
+        "plan_latency_p99_seconds": percentile(latencies, 99),
+        "plan_latency_max_seconds": max(latencies, default=0.0),
+        "loop_lag_p50_ms": percentile(samples.loop_lag_ms, 50),
+        "loop_lag_p99_ms": percentile(samples.loop_lag_ms, 99),
+        "loop_lag_max_ms": max(samples.loop_lag_ms, default=0.0),
+        "rss_start_mib": rss_start / 2**20,
+        "rss_peak_mib": rss_peak / 2**20,
+        "rss_end_mib": rss_end / 2**20,
+        "rss_growth_mib": (rss_peak - rss_start) / 2**20,
+        "queue_depth_max": stats.max_queue_depth,
+        "queue_depth_mean": (
+            statistics.fmean(samples.queue_depth) if samples.queue_depth else 0
+        ),
+        "scheduler_in_flight_max": stats.max_in_flight,
+        "plans_in_flight_max": max(samples.plans_in_flight, default=0),
+        "model_calls": fake_stats.calls,
+        "injected_errors": fake_stats.errors,
+        "retries": stats.retries,
+        "deadline_timeouts": stats.deadline_timeouts,
+        "repaired": deps.repair_stats.repaired,
+        "regenerated": deps.repair_stats.regenerated,
+        "plan_errors": errors,
+        "orphaned_calls": sum(r.calls.orphaned for r in failed),
+        "in_flight_at_failure": sum(
+            r.calls.in_flight_at_failure for r in failed
+        ),
+        "cancelled_after_failure": sum(r.calls.cancelled for r in failed),
+        "finished_after_failure": sum(
+            r.calls.finished_after_failure for r in failed
+        ),
+        "started_after_failure": sum(
+            r.calls.started_after_failure for r in failed
+        ),
+        "drain_seconds": drain_seconds,
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(
+        f"Plans: {report['succeeded']}/{report['plans']} succeeded "
+        f"in {report['wall_seconds']:.1f}s "
+        f"({report['throughput_plans_per_second']:.2f} plans/s)"
+    )
+    print(
+        "Plan latency: "
+        f"p50 {report['plan_latency_p50_seconds']:.2f}s, "
+        f"p90 {report['plan_latency_p90_seconds']:.2f}s, "
+        f"p99 {report['plan_latency_p99_seconds']:.2f}s, "
+        f"max {report['plan_latency_max_seconds']:.2f}s"
+    )
+    print(
+        "Loop lag: "
+        f"p50 {report['loop_lag_p50_ms']:.1f}ms, "
+        f"p99 {report['loop_lag_p99_ms']:.1f}ms, "
+        f"max {report['loop_lag_max_ms']:.1f}ms"
+    )
+    print(
+        f"RSS: {report['rss_start_mib']:.1f} MiB start, "
+        f"{report['rss_peak_mib']:.1f} peak, "
+        f"{report['rss_end_mib']:.1f} end "
+        f"(+{report['rss_growth_mib']:.1f} MiB)"
+    )
+    print(
+        f"Scheduler: queue max {report['queue_depth_max']}, "
+        f"mean {report['queue_depth_mean']:.1f}, "
+        f"in flight max {report['scheduler_in_flight_max']}"
+    )
+    print(
+        f"Model calls: {report['model_calls']}, "
+        f"{report['injected_errors']} injected errors, "
+        f"{report['retries']} retries, "
+        f"{report['deadline_timeouts']} deadline timeouts, "
+        f"{report['repaired']} repaired, "
+        f"{report['regenerated']} regenerated"
+    )
+    errors = ", ".join(
+        f"{name} x{count}" for name, count in report["plan_errors"].items()
+    )
+    print(f"Plan errors: {errors or '-'}")
+    print(
+        f"Calls in flight when their plan failed: "
+        f"{report['in_flight_at_failure']}, "
+        f"{report['cancelled_after_failure']} cancelled, "
+        f"{report['finished_after_failure']} ran to completion"
+    )
+    print(
+        f"Orphaned calls: {report['orphaned_calls']} "
+        f"({report['started_after_failure']} started after the failure), "
+        f"drained in {report['drain_seconds']:.2f}s"
+    )
+
+
+def regressions(
+    report: dict[str, Any], baseline: dict[str, Any], tolerance: float
+) -> list[str]:
+    """Gated metrics that are worse than the baseline beyond `tolerance`"""
+    failures = []
+    for metric, higher_is_better in GATED_METRICS.items():
+        current, previous = report[metric], baseline[metric]
+        if higher_is_better:
+            worse = current < previous * (1 - tolerance)
+        else:
+            # Small absolute slack, so near-zero baselines don't gate on noise
+            worse = current > previous * (1 + tolerance) + 1e-3
+        if worse:
+            failures.append(f"{metric}: {previous:.4g} -> {current:.4g}")
+    return failures
+
+
+async def main(args: argparse.Namespace) -> int:
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Rerun the baseline's workload, so the comparison is like for like
+        args = argparse.Namespace(
+            **{**vars(args), **baseline["config"]},
+        )
+
+    # save_to_json writes to the working directory, keep it out of the repo
+    with tempfile.TemporaryDirectory() as workdir, contextlib.chdir(workdir):
+        report = await soak(args)
+    print_report(report)
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
+    if baseline is None:
+        return 0
+
+    failures = regressions(report, baseline, args.tolerance)
+    print()
+    if failures:
+        print(f"Regressed beyond {args.tolerance:.0%}:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print(f"No regressions beyond {args.tolerance:.0%} of {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--plans", type=int, default=500)
+    parser.add_argument(
+        "--concurrency", type=int, default=100, help="Plans in flight at once"
+    )
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument(
+        "--workout-batches",
+        type=int,
+        default=None,
+        help="Generate each week's workouts in N calls instead of per day",
+    )
+    parser.add_argument(
+        "--checkpointer",
+        choices=["none", "memory"],
+        default="none",
+        help="Keep every plan's state in memory, as a long-lived service",
+    )
+    parser.add_argument("--requests-per-minute", type=float, default=1e6)
+    parser.add_argument("--tokens-per-minute", type=float, default=1e9)
+    parser.add_argument(
+        "--max-concurrency", type=int, default=64, help="Model calls at once"
+    )
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument(
+        "--backoff",
+        type=float,
+        default=0.05,
+        help="Base retry backoff in seconds, capped at 8x",
+    )
+    parser.add_argument(
+        "--workout-deadline",
+        type=float,
+        default=None,
+        help="Seconds before a workout call attempt is abandoned and retried",
+    )
+    parser.add_argument("--latency-mean", type=float, default=0.05)
+    parser.add_argument(
+        "--straggler-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of calls that stall for --straggler-factor x latency",
+    )
+    parser.add_argument("--straggler-factor", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--error-kinds",
+        type=lambda value: value.split(","),
+        default=["rate_limit", "overloaded", "timeout"],
+        help="Comma separated: rate_limit, overloaded, timeout",
+    )
+    parser.add_argument(
+        "--malformed-rate",
+        type=float,
+        default=0.0,
+        help="Fraction of workout responses returned as broken JSON",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sample-interval", type=float, default=0.01)
+    parser.add_argument("--report", help="Write the report as JSON here")
+    parser.add_argument(
+        "--baseline",
+        help="Earlier --report to rerun and compare against",
+    )
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,107 @@
+"""Benchmark `coach` CLI startup time and what each subcommand imports.
+
+Runs each command `--repeat` times in a fresh interpreter and reports the
+median wall time, next to a bare interpreter and a full import of the
+graph stack for reference. Each command also runs once under
+`-X importtime`, to list which heavy packages it loaded.
+
+    python -m coach.benchmarks.startup --repeat 10
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from coach.benchmarks.plan_reader import synthetic_plan
+
+# Run from the directory holding the `coach` package, as an installed
+# `coach` script would import it
+ROOT_DIR = Path(__file__).resolve().parents[2]
+HEAVY_PACKAGES = ("pydantic", "langchain_core", "langgraph", "anthropic")
+
+ATHLETE = {
+    "athlete_id": "a-1",
+    "workouts_per_week": 4,
+    "training_goal": "BASE",
+    "sports": ["RUNNING"],
+    "experience": "BEGINNER",
+    "available_time_per_session": 45,
+    "current_weekly_volume": 120,
+    "programme_length": 8,
+    "injuries_or_limitations": None,
+}
+
+
+def wall_time(command: list[str]) -> float:
+    start = time.perf_counter()
+    subprocess.run(
+        command,
+        cwd=ROOT_DIR,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return time.perf_counter() - start
+
+
+def imported_packages(command: list[str]) -> list[str]:
+    result = subprocess.run(
+        [command[0], "-X", "importtime", *command[1:]],
+        cwd=ROOT_DIR,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    # Lines look like "import time:   self |   cumulative | package.module"
+    modules = {
+        line.rsplit("|", 1)[-1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    return [package for package in HEAVY_PACKAGES if package in modules]
+
+
+def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as workdir:
+        plan_path = Path(workdir) / "plan.json"
+        plan_path.write_text(synthetic_plan(args.weeks, 0).model_dump_json())
+        inputs_path = Path(workdir) / "athletes.jsonl"
+        inputs_path.write_text(json.dumps(ATHLETE) + "\n")
+
+        python = sys.executable
+        cli = [python, "-m", "coach.cli"]
+        commands = {
+            "python -c pass": [python, "-c", "pass"],
+            "coach --help": [*cli, "--help"],
+            "coach inspect": [*cli, "inspect", str(plan_path)],
+            "coach inspect --week": [
+                *cli, "inspect", str(plan_path), "--week", "1",
+            ],
+            "coach validate inputs": [*cli, "validate", str(inputs_path)],
+            "coach validate plan": [*cli, "validate", str(plan_path)],
+            "coach.main (graph stack)": [
+                python, "-c", "import coach.main",
+            ],
+        }
+
+        print(f"median of {args.repeat} runs")
+        print(f"{'command':<28} {'ms':>8}  heavy imports")
+        for label, command in commands.items():
+            seconds = statistics.median(
+                wall_time(command) for _ in range(args.repeat)
+            )
+            packages = ", ".join(imported_packages(command)) or "-"
+            print(f"{label:<28} {seconds * 1e3:>8.1f}  {packages}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--weeks", type=int, default=12)
+    main(parser.parse_args())
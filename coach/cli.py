@@ -0,0 +1,191 @@
+"""The `coach` command: generate, batch, inspect and validate.
+
+Only the standard library is imported up front. Each subcommand imports
+what it needs when it runs, so `inspect` never loads Pydantic and
+`validate` never loads LangGraph or a provider SDK.
+
+    coach generate --output plan.json
+    coach batch athletes.jsonl --export-dir exports/
+    coach inspect plan.json --week 3
+    coach validate athletes.jsonl plan.json
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+
+def run_generate(args: argparse.Namespace, rest: list[str]) -> int:
+    import asyncio
+
+    from dotenv import load_dotenv
+
+    from coach import main as generate
+
+    generate_args = generate.build_parser(prog="coach generate").parse_args(
+        rest
+    )
+    load_dotenv()
+    asyncio.run(generate.main(generate_args))
+    return 0
+
+
+def run_batch(args: argparse.Namespace, rest: list[str]) -> int:
+    import asyncio
+
+    from dotenv import load_dotenv
+
+    from coach import batch
+
+    batch_args = batch.build_parser(prog="coach batch").parse_args(rest)
+    load_dotenv()
+    asyncio.run(batch.main(batch_args))
+    return 0
+
+
+def run_inspect(args: argparse.Namespace, rest: list[str]) -> int:
+    from coach.storage.reader import PlanReader
+
+    try:
+        # Inspecting shouldn't write beside a plan that may be read-only
+        reader = PlanReader(args.plan, write_index=False)
+    except (OSError, ValueError) as error:
+        # ValueError includes PlanFormatError
+        print(f"Can't read {args.plan}: {error}", file=sys.stderr)
+        return 1
+
+    with reader:
+        header = reader.header()
+        print(f"{args.plan}: {reader.week_count} weeks")
+        for field in ("plan_description", "progression_strategy"):
+            if header.get(field):
+                print(f"  {field}: {header[field]}")
+
+        if args.week is None:
+            print(
+                f"{'week':>4}  {'workouts':>8}  {'volume':>6}  "
+                f"{'rest days':<13}  name"
+            )
+            for week_index, entry in enumerate(reader.weeks, start=1):
+                week = reader.week_header(week_index)
+                rest_days = ",".join(str(day) for day in entry.rest_days)
+                print(
+                    f"{week_index:>4}  {len(entry.workouts):>8}  "
+                    f"{week.get('total_weekly_volume') or '-':>6}  "
+                    f"{rest_days or '-':<13}  "
+                    f"{week.get('workout_week_name', '')}"
+                )
+            return 0
+
+        try:
+            week = reader.week_header(args.week)
+        except IndexError as error:
+            print(error, file=sys.stderr)
+            return 1
+        print(f"Week {args.week}: {week.get('workout_week_name', '')}")
+        if week.get("weekly_focus"):
+            print(f"  focus: {week['weekly_focus']}")
+        for day, day_name in enumerate(DAY_NAMES, start=1):
+            workout = reader.workout_header(args.week, day)
+            if workout is None:
+                print(f"  {day_name}  rest")
+                continue
+            minutes = workout.get("estimated_duration")
+            print(
+                f"  {day_name}  {workout.get('sport', ''):<9} "
+                f"{f'{minutes} min' if minutes else '-':>8}  "
+                f"{workout.get('name', '')}"
+            )
+    return 0
+
+
+def run_validate(args: argparse.Namespace, rest: list[str]) -> int:
+    from pydantic import TypeAdapter, ValidationError
+
+    from coach.models.schema import TrainingPlan
+    from coach.models.states import TrainingPlanInput
+
+    input_adapter = TypeAdapter(TrainingPlanInput)
+    failures = 0
+    for path in map(Path, args.files):
+        # JSONL files hold athlete inputs as `coach batch` reads them,
+        # anything else is a saved training plan
+        try:
+            if path.suffix == ".jsonl":
+                records = 0
+                with open(path) as f:
+                    for line_number, line in enumerate(f, start=1):
+                        if not line.strip():
+                            continue
+                        records += 1
+                        record = json.loads(line)
+                        record.pop("athlete_id", None)
+                        try:
+                            input_adapter.validate_python(record)
+                        except ValidationError as error:
+                            failures += 1
+                            print(f"{path}:{line_number}: {error}")
+                print(f"{path}: {records} athlete inputs checked")
+            else:
+                plan = TrainingPlan.model_validate_json(path.read_bytes())
+                print(
+                    f"{path}: valid plan, "
+                    f"{len(plan.weekly_workouts)} weeks"
+                )
+        except (OSError, ValueError) as error:
+            # ValidationError and JSONDecodeError are both ValueErrors
+            failures += 1
+            print(f"{path}: {error}")
+    return 1 if failures else 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="coach", description=__doc__.splitlines()[0]
+    )
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    # Arguments of the heavy subcommands are left unparsed here and
+    # handed to their own module's parser, after the import
+    generate = subcommands.add_parser(
+        "generate", help="Generate a training plan", add_help=False
+    )
+    generate.set_defaults(run=run_generate, forward=True)
+
+    batch = subcommands.add_parser(
+        "batch",
+        help="Generate plans for a JSONL file of athletes",
+        add_help=False,
+    )
+    batch.set_defaults(run=run_batch, forward=True)
+
+    inspect = subcommands.add_parser(
+        "inspect", help="Summarise a saved plan without validating it"
+    )
+    inspect.add_argument("plan", help="Training plan JSON")
+    inspect.add_argument(
+        "--week", type=int, help="Show one week's workouts day by day"
+    )
+    inspect.set_defaults(run=run_inspect)
+
+    validate = subcommands.add_parser(
+        "validate", help="Check athlete inputs (.jsonl) or saved plans"
+    )
+    validate.add_argument("files", nargs="+")
+    validate.set_defaults(run=run_validate)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = build_parser()
+    args, rest = parser.parse_known_args(argv)
+    if rest and not getattr(args, "forward", False):
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    sys.exit(args.run(args, rest))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
+import argparse
 import asyncio
+import uuid
+from pathlib import Path
 
 from dotenv import load_dotenv
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.graph import END, START, StateGraph
-from models.dependencies import Dependencies
-from models.enums import Experience, Goal, Sport
-from models.states import (
+
+from coach.models.dependencies import Dependencies
+from coach.models.enums import Experience, Goal, Sport
+from coach.models.states import (
     TrainingPlanInput,
     TrainingPlanOutput,
     TrainingPlanState,
@@ -12,8 +17,14 @@ from models.states import (
     WeeklyWorkoutOutput,
     WeeklyWorkoutState,
 )
-from nodes.training_plan import TrainingPlanNode
-from nodes.weekly import WeeklyWorkoutNode
+from coach.nodes.training_plan import TrainingPlanNode
+from coach.nodes.weekly import WeeklyWorkoutNode
+from coach.telemetry.export import (
+    print_summary,
+    serve_prometheus,
+    write_otlp_json,
+)
+from coach.telemetry.spans import InstrumentationHandler
 
 """
 - Describe trainging plan requirements: length, aim, sports, frequency
@@ -25,8 +36,16 @@ from nodes.weekly import WeeklyWorkoutNode
 """
 
 
-def build_weekly_workout_graph(deps: Dependencies) -> StateGraph:
-    node = WeeklyWorkoutNode(deps=deps)
+def build_weekly_workout_graph(
+    deps: Dependencies,
+    workout_batches: int | None = None,
+    rule_based_easy_days: bool = False,
+) -> StateGraph:
+    node = WeeklyWorkoutNode(
+        deps=deps,
+        workout_batches=workout_batches,
+        rule_based_easy_days=rule_based_easy_days,
+    )
 
     weekly_workout_builder = StateGraph(
         WeeklyWorkoutState,
@@ -38,15 +57,20 @@ def build_weekly_workout_graph(deps: Dependencies) -> StateGraph:
         "generate_weekly_workout_plan", node.generate_high_level_weekly_plan
     )
 
+    weekly_workout_builder.add_node("persist_week", node.persist_week)
+
     weekly_workout_builder.add_edge(START, "generate_weekly_workout_plan")
+    weekly_workout_builder.add_edge(
+        "generate_weekly_workout_plan", "persist_week"
+    )
 
     return weekly_workout_builder
 
 
 def build_training_plan_graph(
-    deps: Dependencies, weekly_graph: StateGraph
+    deps: Dependencies, weekly_graph: StateGraph, stream_plan: bool = False
 ) -> StateGraph:
-    training_node = TrainingPlanNode(deps=deps)
+    training_node = TrainingPlanNode(deps=deps, stream_plan=stream_plan)
 
     training_plan_builder = StateGraph(
         TrainingPlanState,
@@ -76,18 +100,28 @@ def build_training_plan_graph(
     return training_plan_builder
 
 
-async def run_coach():
-    deps = Dependencies(model_name="claude-3-5-haiku-latest")
+async def run_coach(
+    run_id: str | None = None,
+    checkpoint_path: str = ".coach_cache/checkpoints.sqlite",
+    output_path: str = "training_plan.json",
+    trace_path: str | None = None,
+    metrics_port: int | None = None,
+    rule_based_easy_days: bool = False,
+    cache_path: str | None = None,
+):
+    deps = Dependencies(
+        model_name="claude-3-5-haiku-latest", cache_path=cache_path
+    )
 
-    weekly_graph = build_weekly_workout_graph(deps=deps)
+    weekly_graph = build_weekly_workout_graph(
+        deps=deps, rule_based_easy_days=rule_based_easy_days
+    )
 
     training_plan_builder = build_training_plan_graph(
         deps=deps,
         weekly_graph=weekly_graph,
     )
 
-    graph = training_plan_builder.compile()
-
     input = TrainingPlanInput(
         workouts_per_week=4,
         training_goal=Goal.ENDURANCE,
@@ -102,11 +136,109 @@ async def run_coach():
         injuries_or_limitations=None,
     )
 
-    async for event in graph.astream_events(input, version="v1"):
-        kind = event["event"]
-        print(f"{kind}: {event['name']}")
+    run_id = run_id or uuid.uuid4().hex
+    instrumentation = InstrumentationHandler(run_id=run_id)
+    config = {
+        "configurable": {"thread_id": run_id, "output_path": output_path},
+        "callbacks": [instrumentation],
+    }
+    Path(checkpoint_path).parent.mkdir(parents=True, exist_ok=True)
+
+    # Every completed step (and every finished weekly branch) is persisted
+    # under the run id, so a crashed or cancelled run can pick up from there
+    async with AsyncSqliteSaver.from_conn_string(
+        checkpoint_path
+    ) as checkpointer:
+        graph = training_plan_builder.compile(checkpointer=checkpointer)
+
+        snapshot = await graph.aget_state(config)
+        if snapshot.values and not snapshot.next:
+            print(f"Run {run_id} already completed")
+            return
+
+        # Passing None continues the run from its last checkpoint
+        graph_input = None if snapshot.values else input
+        print(
+            f"{'Resuming' if graph_input is None else 'Starting'} "
+            f"run {run_id}"
+        )
+
+        metrics_server = None
+        if metrics_port is not None:
+            metrics_server = serve_prometheus(instrumentation, metrics_port)
+        try:
+            await graph.ainvoke(graph_input, config)
+        finally:
+            print_summary(instrumentation)
+            if trace_path is not None:
+                write_otlp_json(instrumentation, trace_path)
+            if metrics_server is not None:
+                metrics_server.shutdown()
+
+    if deps.cache is not None:
+        stats = deps.cache.stats
+        print(
+            f"LLM cache: {stats.hits} hits, {stats.misses} misses "
+            f"({stats.hit_rate:.0%} hit rate), {stats.evictions} evictions"
+        )
+
+    repairs = deps.repair_stats
+    print(
+        f"Model output: {repairs.clean} clean, {repairs.repaired} repaired "
+        f"locally, {repairs.regenerated} regenerated"
+    )
+    for fix, count in sorted(repairs.fixes.items()):
+        print(f"  {fix}: {count}")
+
+
+def build_parser(prog: str | None = None) -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog=prog, description="Generate a training plan"
+    )
+    parser.add_argument(
+        "--run-id",
+        help="Run id to checkpoint under, pass an existing id to resume it",
+    )
+    parser.add_argument(
+        "--output",
+        default="training_plan.json",
+        help="Where to write the assembled training plan",
+    )
+    parser.add_argument(
+        "--trace-file",
+        help="Append the run's spans to this file as OTLP/JSON",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on this port while the run is going",
+    )
+    parser.add_argument(
+        "--rule-based-easy-days",
+        action="store_true",
+        help="Build easy and recovery days from rules instead of the model",
+    )
+    parser.add_argument(
+        "--cache",
+        help="Response cache to replay identical model calls from, e.g. "
+        ".coach_cache/llm_cache.sqlite",
+    )
+    return parser
+
+
+async def main(args: argparse.Namespace) -> None:
+    await run_coach(
+        run_id=args.run_id,
+        output_path=args.output,
+        trace_path=args.trace_file,
+        metrics_port=args.metrics_port,
+        rule_based_easy_days=args.rule_based_easy_days,
+        cache_path=args.cache,
+    )
 
 
 if __name__ == "__main__":
+    args = build_parser().parse_args()
+
     load_dotenv()
-    asyncio.run(run_coach())
+    asyncio.run(main(args))
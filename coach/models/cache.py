@@ -0,0 +1,184 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from langchain_core.caches import RETURN_VAL_TYPE, BaseCache
+from langchain_core.load import dumps, loads
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class SQLiteResponseCache(BaseCache):
+    """Content-addressed LLM response cache persisted to a local SQLite file.
+
+    Entries are keyed on a hash of the model configuration (model name, bound
+    tools / output schema, invocation params) and the rendered messages, so a
+    structured-output call only hits when both the prompt and the schema match.
+    Least recently used entries are evicted past `max_entries`, and entries
+    older than `ttl_seconds` are treated as misses.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = ".coach_cache/llm_cache.sqlite",
+        max_entries: int | None = 10_000,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.stats = CacheStats()
+
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                llm_string TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(prompt: str, llm_string: str) -> str:
+        digest = hashlib.sha256()
+        digest.update(llm_string.encode())
+        digest.update(b"\x00")
+        digest.update(prompt.encode())
+        return digest.hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> RETURN_VAL_TYPE | None:
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None:
+                self.stats.misses += 1
+                return None
+
+            response, created_at = row
+            if (
+                self.ttl_seconds is not None
+                and now - created_at > self.ttl_seconds
+            ):
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key = ?", (key,)
+                )
+                self._conn.commit()
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                (now, key),
+            )
+            self._conn.commit()
+            self.stats.hits += 1
+
+        return loads(response)
+
+    def update(
+        self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE
+    ) -> None:
+        key = self.make_key(prompt, llm_string)
+        now = time.time()
+        response = dumps(list(return_val))
+
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT OR REPLACE INTO responses
+                    (key, llm_string, response, created_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (key, llm_string, response, now, now),
+            )
+            self._evict()
+            self._conn.commit()
+
+    async def alookup(
+        self, prompt: str, llm_string: str
+    ) -> RETURN_VAL_TYPE | None:
+        # Local SQLite reads are sub-millisecond, cheaper than an executor hop
+        return self.lookup(prompt, llm_string)
+
+    async def aupdate(
+        self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE
+    ) -> None:
+        self.update(prompt, llm_string, return_val)
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    async def aclear(self, **kwargs: Any) -> None:
+        self.clear(**kwargs)
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    def _evict(self) -> None:
+        # Caller holds the lock
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute(
+                "DELETE FROM responses WHERE created_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+            self.stats.expired += cursor.rowcount
+
+        if self.max_entries is None:
+            return
+
+        (count,) = self._conn.execute(
+            "SELECT COUNT(*) FROM responses"
+        ).fetchone()
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self._conn.execute(
+                """
+                DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY accessed_at ASC LIMIT ?
+                )
+                """,
+                (overflow,),
+            )
+            self.stats.evictions += overflow
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,26 +1,240 @@
 # Create a dependency container
-from langchain_anthropic.chat_models import ChatAnthropic
-from langchain_core.rate_limiters import InMemoryRateLimiter
+import functools
+from typing import Any, Literal
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+from pydantic import BaseModel, ValidationError
+
+from coach.models.cache import SQLiteResponseCache
+from coach.models.repair import RepairStats
+from coach.models.routing import ModelRoute, ModelTier
+from coach.models.scheduler import (
+    CallPriority,
+    CallScheduler,
+    ScheduledChatModel,
+)
+from coach.storage.templates import TemplateStore
+from coach.storage.writer import PlanWriter
+
+# Per call type, a single attempt running longer than this is abandoned
+# and retried. `model_timeout` stays as the HTTP-level ceiling.
+DEFAULT_CALL_DEADLINES = {
+    CallPriority.TRAINING_PLAN: 90.0,
+    CallPriority.WEEKLY_PLAN: 60.0,
+    CallPriority.WORKOUT: 45.0,
+}
 
 # from search.client import TavilySearch
 # from tavily import AsyncTavilyClient
 
 
+@functools.cache
+def scheduled_chat_model(provider: str) -> type[BaseChatModel]:
+    """Scheduled chat model class for `provider`, imported on first use.
+
+    Provider integrations are slow to import, so a run only loads the one
+    it talks to.
+    """
+    if provider == "fake":
+        from coach.models.fake import FakeCoachChatModel
+
+        class ScheduledFakeCoachChatModel(
+            ScheduledChatModel, FakeCoachChatModel
+        ):
+            pass
+
+        return ScheduledFakeCoachChatModel
+
+    from langchain_anthropic.chat_models import ChatAnthropic
+
+    class ScheduledChatAnthropic(ScheduledChatModel, ChatAnthropic):
+        pass
+
+    return ScheduledChatAnthropic
+
+
 class Dependencies:
     def __init__(
         self,
         model_name: str = "claude-3-5-sonnet-20240620",
         model_timeout: int = 100,
-        requests_per_second: float = 0.6,
+        requests_per_minute: float = 50,
+        tokens_per_minute: float = 40_000,
+        max_concurrency: int = 10,
+        call_deadlines: dict[CallPriority, float] | None = None,
+        hedge_percentile: float | None = 95,
+        scheduler: CallScheduler | None = None,
+        cache: SQLiteResponseCache | None = None,
+        cache_path: str | None = None,
+        cache_max_entries: int | None = 10_000,
+        cache_ttl_seconds: float | None = None,
+        provider: Literal["anthropic", "fake"] = "anthropic",
+        fake_options: dict[str, Any] | None = None,
+        runs_dir: str = ".coach_cache/runs",
+        tiers: dict[str, ModelTier] | None = None,
+        routes: dict[CallPriority, ModelRoute] | None = None,
+        templates: TemplateStore | None = None,
+        template_path: str | None = None,
     ):
-        self.llm_client = ChatAnthropic(
+        # Identical prompts + schema are served from disk, skipping the
+        # scheduler and the API round-trip entirely
+        if cache is None and cache_path is not None:
+            cache = SQLiteResponseCache(
+                path=cache_path,
+                max_entries=cache_max_entries,
+                ttl_seconds=cache_ttl_seconds,
+            )
+        self.cache = cache
+
+        self.provider = provider
+        self.fake_options = fake_options or {}
+        self.routes = routes or {}
+        deadlines = dict(
+            DEFAULT_CALL_DEADLINES if call_deadlines is None else call_deadlines
+        )
+        for call_type, route in self.routes.items():
+            if route.deadline is not None:
+                deadlines[call_type] = route.deadline
+
+        # One scheduler for the whole graph: request/token budgets, a
+        # concurrency cap and priority ordering across every model call
+        self.scheduler = scheduler or CallScheduler(
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            max_concurrency=max_concurrency,
+            deadlines=deadlines,
+            hedge_percentile=hedge_percentile,
+        )
+        self.llm_client = self._chat_model(
+            model_name, model_timeout, self.scheduler, self.fake_options
+        )
+
+        # Routed call types run on their tier's model, each tier with its
+        # own scheduler since rate limits and concurrency are per model
+        self.tiers = tiers or {}
+        self.tier_schedulers: dict[str, CallScheduler] = {}
+        self.tier_clients: dict[str, BaseChatModel] = {}
+        for name, tier in self.tiers.items():
+            self.tier_schedulers[name] = CallScheduler(
+                requests_per_minute=(
+                    tier.requests_per_minute or requests_per_minute
+                ),
+                tokens_per_minute=tier.tokens_per_minute or tokens_per_minute,
+                max_concurrency=tier.max_concurrency or max_concurrency,
+                deadlines=deadlines,
+                hedge_percentile=hedge_percentile,
+            )
+            self.tier_clients[name] = self._chat_model(
+                tier.model_name,
+                tier.model_timeout or model_timeout,
+                self.tier_schedulers[name],
+                {**self.fake_options, **tier.fake_options},
+            )
+        # Calls that failed validation on their tier and were re-run on
+        # the stronger one, by call type
+        self.escalations: dict[str, int] = {}
+
+        # Completed weeks are streamed to per-run chunk files
+        self.plan_writer = PlanWriter(root=runs_dir)
+
+        # Workouts accepted as generated, fixed locally or sent back to the
+        # model, across every node sharing these dependencies
+        self.repair_stats = RepairStats()
+
+        # Weeks and workouts generated for earlier athletes, reused for
+        # close matches instead of calling the model. Off unless a store
+        # or path is given, since reuse trades variety for throughput
+        if templates is None and template_path is not None:
+            templates = TemplateStore(path=template_path)
+        self.templates = templates
+
+        self._structured_llms: dict[
+            tuple[type[BaseModel], bool, CallPriority | None], Runnable
+        ] = {}
+        # self.search_client = TavilySearch(client=AsyncTavilyClient())
+
+    def _chat_model(
+        self,
+        model_name: str,
+        model_timeout: int,
+        scheduler: CallScheduler,
+        fake_options: dict[str, Any],
+    ) -> BaseChatModel:
+        if self.provider == "fake":
+            # Offline stand-in returning schema-valid payloads
+            return scheduled_chat_model("fake")(
+                model_name=model_name,
+                cache=self.cache if self.cache is not None else False,
+                scheduler=scheduler,
+                **fake_options,
+            )
+        return scheduled_chat_model("anthropic")(
             model_name=model_name,
             timeout=model_timeout,
             stop=None,
-            rate_limiter=InMemoryRateLimiter(
-                requests_per_second=requests_per_second,
-                check_every_n_seconds=0.1,
-                max_bucket_size=10,
-            ),
+            cache=self.cache if self.cache is not None else False,
+            # Retries and backoff are owned by the scheduler
+            max_retries=0,
+            scheduler=scheduler,
         )
-        # self.search_client = TavilySearch(client=AsyncTavilyClient())
+
+    def llm_for(
+        self, call_type: CallPriority | None, escalated: bool = False
+    ) -> BaseChatModel:
+        """Model a call type is routed to, `llm_client` when unrouted"""
+        route = self.routes.get(call_type) if call_type is not None else None
+        if route is None:
+            return self.llm_client
+        if escalated and route.escalate_to is not None:
+            return self.tier_clients[route.escalate_to]
+        return self.tier_clients[route.tier]
+
+    def escalates(self, call_type: CallPriority) -> bool:
+        route = self.routes.get(call_type)
+        return route is not None and route.escalate_to is not None
+
+    def record_escalation(self, call_type: CallPriority) -> None:
+        name = call_type.name.lower()
+        self.escalations[name] = self.escalations.get(name, 0) + 1
+
+    def structured_llm(
+        self,
+        schema: type[BaseModel],
+        include_raw: bool = False,
+        call_type: CallPriority | None = None,
+    ) -> Runnable:
+        """`with_structured_output(schema)` on the call type's model.
+
+        Built once per schema and call type. Routes with an escalation
+        tier fall back to it when the output fails validation.
+        """
+        key = (schema, include_raw, call_type)
+        if key not in self._structured_llms:
+            runnable = self.llm_for(call_type).with_structured_output(
+                schema, include_raw=include_raw
+            )
+            if call_type is not None and self.escalates(call_type):
+                escalated = self.llm_for(
+                    call_type, escalated=True
+                ).with_structured_output(schema, include_raw=include_raw)
+
+                async def escalate(
+                    input: Any,
+                    config: RunnableConfig,
+                    call_type: CallPriority = call_type,
+                    escalated: Runnable = escalated,
+                ) -> Any:
+                    self.record_escalation(call_type)
+                    return await escalated.ainvoke(input, config)
+
+                runnable = runnable.with_fallbacks(
+                    [RunnableLambda(escalate)],
+                    exceptions_to_handle=(
+                        OutputParserException,
+                        ValidationError,
+                    ),
+                )
+            self._structured_llms[key] = runnable
+        return self._structured_llms[key]
@@ -0,0 +1,143 @@
+# Rule-based easy and recovery sessions, so only a week's key workouts
+# need a model call
+from collections.abc import Sequence
+
+from coach.models.enums import (
+    DistanceUnit,
+    EffortZone,
+    Experience,
+    Goal,
+    Sport,
+)
+from coach.models.schema import Interval, Workout
+
+# Minutes per kilometre at zones 1 and 2 for an intermediate athlete, as
+# the analytics defaults. Triathlon sessions are paced as running.
+EASY_PACE = {
+    Sport.CYCLING: (2.4, 2.0),
+    Sport.RUNNING: (7.0, 6.0),
+    Sport.SWIMMING: (25.0, 22.0),
+    Sport.TRIATHLON: (7.0, 6.0),
+}
+PACE_FACTOR = {
+    Experience.BEGINNER: 1.15,
+    Experience.INTERMEDIATE: 1.0,
+    Experience.ADVANCED: 0.92,
+    Experience.ELITE: 0.85,
+}
+# Session length when the athlete gave no time limit
+DEFAULT_MINUTES = {
+    Experience.BEGINNER: 40,
+    Experience.INTERMEDIATE: 50,
+    Experience.ADVANCED: 60,
+    Experience.ELITE: 75,
+}
+# Share of the available time a session takes, by effort
+EFFORT_SHARE = {EffortZone.ZONE1: 0.6, EffortZone.ZONE2: 0.8}
+SESSION_NAMES = {
+    Sport.CYCLING: "Ride",
+    Sport.RUNNING: "Run",
+    Sport.SWIMMING: "Swim",
+    Sport.TRIATHLON: "Session",
+}
+MIN_SESSION_MINUTES = 20
+MIN_SEGMENT_MINUTES = 5
+SWIM_ROUNDING_METERS = 50
+
+
+def easy_effort(
+    day: int, training_days: Sequence[int], easy_days: Sequence[int]
+) -> EffortZone:
+    """Zone 1 the day after a key session, Zone 2 otherwise"""
+    previous = day - 1
+    if previous in training_days and previous not in easy_days:
+        return EffortZone.ZONE1
+    return EffortZone.ZONE2
+
+
+def easy_sport(
+    sports: Sequence[Sport], week_index: int, position: int
+) -> Sport:
+    """Rotate the athlete's sports over a plan's easy sessions"""
+    if not sports:
+        return Sport.RUNNING
+    return sports[(week_index + position) % len(sports)]
+
+
+def week_load(week_index: int, plan_weeks: int) -> float:
+    """Session length factor for the week's place in the plan.
+
+    Builds from 0.9 to 1.0 over the plan, every fourth week is a lighter
+    recovery week and the last week of a plan of four or more tapers.
+    """
+    if plan_weeks >= 4 and week_index == plan_weeks:
+        return 0.75
+    if week_index % 4 == 0:
+        return 0.8
+    return 0.9 + 0.1 * (week_index - 1) / max(plan_weeks - 1, 1)
+
+
+def _segment(
+    sport: Sport, effort: EffortZone, minutes: float, pace_factor: float
+) -> Interval:
+    km = minutes / (EASY_PACE[sport][effort.value - 1] * pace_factor)
+    if sport == Sport.SWIMMING:
+        lengths = max(round(km * 1000 / SWIM_ROUNDING_METERS), 1)
+        distance, unit = lengths * SWIM_ROUNDING_METERS, DistanceUnit.M
+    else:
+        distance, unit = max(round(km), 1), DistanceUnit.KM
+    return Interval(
+        distance=distance,
+        distance_unit=unit,
+        effort=effort,
+        duration_estimate=float(minutes),
+    )
+
+
+def easy_workout(
+    sport: Sport,
+    effort: EffortZone,
+    experience: Experience | None = None,
+    available_minutes: int | None = None,
+    week_index: int = 1,
+    plan_weeks: int = 1,
+) -> Workout:
+    """A warmup, one steady interval at `effort` and a cooldown.
+
+    Zone 1 sessions are recovery workouts, anything harder is an easy
+    aerobic base session. The session fits in `available_minutes`.
+    """
+    experience = experience or Experience.INTERMEDIATE
+    limit = available_minutes or DEFAULT_MINUTES[experience]
+    share = EFFORT_SHARE.get(effort, EFFORT_SHARE[EffortZone.ZONE2])
+    minutes = round(limit * share * week_load(week_index, plan_weeks) / 5) * 5
+    # At least the minimum session, but never over the limit
+    minutes = min(max(minutes, MIN_SESSION_MINUTES), limit)
+
+    # Warmup and cooldown take 15% each, at least 5 minutes when there's
+    # time for it. Sessions under 3 minutes split into fractional thirds.
+    warmup_minutes = min(
+        max(MIN_SEGMENT_MINUTES, round(minutes * 0.15)),
+        minutes // 3 if minutes >= 3 else minutes / 3,
+    )
+    main_minutes = minutes - 2 * warmup_minutes
+    pace_factor = PACE_FACTOR[experience]
+    warmup = _segment(sport, EffortZone.ZONE1, warmup_minutes, pace_factor)
+    main = _segment(sport, effort, main_minutes, pace_factor)
+    cooldown = _segment(sport, EffortZone.ZONE1, warmup_minutes, pace_factor)
+
+    recovery = effort == EffortZone.ZONE1
+    return Workout(
+        name=(
+            f"{'Recovery' if recovery else 'Easy Aerobic'} "
+            f"{SESSION_NAMES[sport]}"
+        ),
+        sport=sport,
+        warmup=warmup,
+        intervals=[main],
+        cooldown=cooldown,
+        workout_goal=Goal.RECOVERY if recovery else Goal.BASE,
+        total_distance=warmup.distance + main.distance + cooldown.distance,
+        estimated_duration=minutes,
+        intensity_focus="Recovery" if recovery else "Endurance",
+    )
@@ -0,0 +1,467 @@
+# Offline stand-in for the Anthropic chat model, used for benchmarks and
+# local runs of the plan graph without network access or API spend
+import asyncio
+import json
+import random
+import re
+import uuid
+from dataclasses import dataclass, field
+from collections.abc import AsyncIterator
+from typing import Any, Callable, Literal, Sequence
+
+import anthropic
+import httpx
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.messages.tool import tool_call_chunk
+from langchain_core.outputs import (
+    ChatGeneration,
+    ChatGenerationChunk,
+    ChatResult,
+)
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import PrivateAttr
+
+from coach.models.enums import DistanceUnit, EffortZone, Goal, Sport
+
+LatencyDistribution = Literal[
+    "constant", "uniform", "exponential", "lognormal"
+]
+FakeErrorKind = Literal["rate_limit", "overloaded", "timeout"]
+
+
+@dataclass
+class LatencyProfile:
+    """Distribution that simulated call latencies (in seconds) are drawn from"""
+
+    distribution: LatencyDistribution = "lognormal"
+    mean: float = 0.05
+    spread: float = 0.5  # uniform: +/- fraction of mean, lognormal: sigma
+    # Fraction of calls that stall for `straggler_factor` times as long
+    straggler_rate: float = 0.0
+    straggler_factor: float = 10.0
+
+    def sample(self, rng: random.Random) -> float:
+        latency = self._sample_base(rng)
+        if self.straggler_rate and rng.random() < self.straggler_rate:
+            latency *= self.straggler_factor
+        return latency
+
+    def _sample_base(self, rng: random.Random) -> float:
+        if self.distribution == "constant":
+            return self.mean
+        if self.distribution == "uniform":
+            return rng.uniform(
+                self.mean * (1 - self.spread), self.mean * (1 + self.spread)
+            )
+        if self.distribution == "exponential":
+            return rng.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        # Lognormal with the requested mean
+        mu = -(self.spread**2) / 2
+        return self.mean * rng.lognormvariate(mu, self.spread)
+
+
+@dataclass
+class FakeCallStats:
+    calls: int = 0
+    errors: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    calls_by_schema: dict[str, int] = field(default_factory=dict)
+    # Simulated prompt caching: input tokens read from and written to the
+    # cache, and the distinct cached prefixes seen for each schema
+    input_tokens: int = 0
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+    cache_prefixes: dict[str, set[tuple[str, ...]]] = field(
+        default_factory=dict
+    )
+
+
+def _fake_api_error(kind: FakeErrorKind) -> Exception:
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    if kind == "rate_limit":
+        return anthropic.RateLimitError(
+            "Simulated rate limit",
+            response=httpx.Response(429, request=request),
+            body=None,
+        )
+    if kind == "overloaded":
+        return anthropic.InternalServerError(
+            "Simulated overload",
+            response=httpx.Response(529, request=request),
+            body=None,
+        )
+    return anthropic.APITimeoutError(request=request)
+
+
+class FakeCoachChatModel(BaseChatModel):
+    """Chat model that returns schema-valid coaching payloads offline.
+
+    Structured-output calls (`with_structured_output`) are answered with a
+    tool call for the bound schema, plain calls (the `PydanticOutputParser`
+    chain) with a fenced JSON `Workout`. Latency and failures are drawn from
+    configurable distributions so the graph can be benchmarked end to end.
+    """
+
+    model_name: str = "fake-coach"
+    latency: LatencyProfile = LatencyProfile()
+    latency_by_schema: dict[str, LatencyProfile] = {}
+    error_rate: float = 0.0
+    error_kinds: Sequence[FakeErrorKind] = ("rate_limit",)
+    # Fraction of plain (fenced JSON) responses that come back malformed
+    malformed_rate: float = 0.0
+    text_schema: str = "Workout"
+    seed: int | None = None
+    stream_chunk_chars: int = 64
+
+    _rng: random.Random = PrivateAttr()
+    _stats: FakeCallStats = PrivateAttr(default_factory=FakeCallStats)
+    # Prefixes written by earlier calls, as the provider's prompt cache
+    _prompt_cache: set[str] = PrivateAttr(default_factory=set)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._rng = random.Random(self.seed)
+
+    @property
+    def stats(self) -> FakeCallStats:
+        return self._stats
+
+    def reset_stats(self) -> None:
+        self._stats = FakeCallStats()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-coach"
+
+    @property
+    def _identifying_params(self) -> dict[str, Any]:
+        return {"model_name": self.model_name}
+
+    def bind_tools(self, tools: Sequence[Any], **kwargs: Any):
+        formatted_tools = [convert_to_openai_tool(tool) for tool in tools]
+        return self.bind(tools=formatted_tools, **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        schema_name, tool_call = self._schema_name(kwargs)
+        self._record_call(schema_name)
+        try:
+            self._maybe_fail()
+            message = self._message(
+                messages, schema_name, tool_call, kwargs.get("tools")
+            )
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        finally:
+            self._stats.in_flight -= 1
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        schema_name, tool_call = self._schema_name(kwargs)
+        self._record_call(schema_name)
+        try:
+            profile = self.latency_by_schema.get(schema_name, self.latency)
+            await asyncio.sleep(profile.sample(self._rng))
+            self._maybe_fail()
+            message = self._message(
+                messages, schema_name, tool_call, kwargs.get("tools")
+            )
+            return ChatResult(generations=[ChatGeneration(message=message)])
+        finally:
+            self._stats.in_flight -= 1
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        schema_name, tool_call = self._schema_name(kwargs)
+        self._record_call(schema_name)
+        try:
+            profile = self.latency_by_schema.get(schema_name, self.latency)
+            latency = profile.sample(self._rng)
+            self._maybe_fail()
+            message = self._message(
+                messages, schema_name, tool_call, kwargs.get("tools")
+            )
+
+            # Spread the sampled latency evenly over the streamed chunks
+            if tool_call:
+                tool = message.tool_calls[0]
+                text = json.dumps(tool["args"])
+            else:
+                text = str(message.content)
+            pieces = [
+                text[i : i + self.stream_chunk_chars]
+                for i in range(0, len(text), self.stream_chunk_chars)
+            ]
+            for position, piece in enumerate(pieces):
+                await asyncio.sleep(latency / len(pieces))
+                if tool_call:
+                    chunk = AIMessageChunk(
+                        content="",
+                        tool_call_chunks=[
+                            tool_call_chunk(
+                                name=tool["name"] if position == 0 else None,
+                                args=piece,
+                                id=tool["id"] if position == 0 else None,
+                                index=0,
+                            )
+                        ],
+                    )
+                else:
+                    chunk = AIMessageChunk(content=piece)
+                yield ChatGenerationChunk(message=chunk)
+
+            yield ChatGenerationChunk(
+                message=AIMessageChunk(
+                    content="", usage_metadata=message.usage_metadata
+                )
+            )
+        finally:
+            self._stats.in_flight -= 1
+
+    def _schema_name(self, kwargs: dict[str, Any]) -> tuple[str, bool]:
+        # Bound tools mean a structured-output call, otherwise the caller
+        # parses fenced JSON out of the text response
+        tools = kwargs.get("tools") or []
+        if tools:
+            return tools[0]["function"]["name"], True
+        return self.text_schema, False
+
+    def _record_call(self, schema_name: str) -> None:
+        self._stats.calls += 1
+        self._stats.in_flight += 1
+        self._stats.max_in_flight = max(
+            self._stats.max_in_flight, self._stats.in_flight
+        )
+        self._stats.calls_by_schema[schema_name] = (
+            self._stats.calls_by_schema.get(schema_name, 0) + 1
+        )
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and self._rng.random() < self.error_rate:
+            self._stats.errors += 1
+            raise _fake_api_error(self._rng.choice(list(self.error_kinds)))
+
+    def _message(
+        self,
+        messages: list[BaseMessage],
+        schema_name: str,
+        tool_call: bool,
+        tools: list[dict[str, Any]] | None = None,
+    ) -> AIMessage:
+        prompt = "\n".join(message.text() for message in messages)
+        payload = PAYLOAD_BUILDERS[schema_name](self._rng, prompt)
+        cache_read, cache_creation = self._prompt_cache_usage(
+            schema_name, messages, tools
+        )
+        usage = {
+            # Total input, tool definitions and cached tokens included
+            "input_tokens": (len(prompt) + len(json.dumps(tools or []))) // 4,
+            "output_tokens": len(json.dumps(payload)) // 4,
+            "input_token_details": {
+                "cache_read": cache_read,
+                "cache_creation": cache_creation,
+            },
+        }
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        self._stats.input_tokens += usage["input_tokens"]
+
+        if not tool_call:
+            text = f"```json\n{json.dumps(payload)}\n```"
+            if self.malformed_rate and self._rng.random() < self.malformed_rate:
+                text = _malformed(self._rng, payload)
+            message = AIMessage(content=text, usage_metadata=usage)
+        else:
+            message = AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": schema_name,
+                        "args": payload,
+                        "id": f"toolu_{uuid.uuid4().hex[:24]}",
+                    }
+                ],
+                usage_metadata=usage,
+            )
+        return message
+
+    def _prompt_cache_usage(
+        self,
+        schema_name: str,
+        messages: list[BaseMessage],
+        tools: list[dict[str, Any]] | None,
+    ) -> tuple[int, int]:
+        """Tokens read from and written to the simulated prompt cache"""
+        prefixes = cache_prefixes(messages, tools)
+        if not prefixes:
+            return 0, 0
+        self._stats.cache_prefixes.setdefault(schema_name, set()).add(
+            tuple(prefixes)
+        )
+        hit = max(
+            (len(prefix) for prefix in prefixes if prefix in self._prompt_cache),
+            default=0,
+        )
+        self._prompt_cache.update(prefixes)
+        # Treated as in the Anthropic API: a miss writes the prefix up to the
+        # last breakpoint, a hit reads the longest prefix already written
+        cache_read = hit // 4
+        cache_creation = len(prefixes[-1]) // 4 - cache_read
+        self._stats.cache_read_tokens += cache_read
+        self._stats.cache_creation_tokens += cache_creation
+        return cache_read, cache_creation
+
+
+def cache_prefixes(
+    messages: list[BaseMessage], tools: list[dict[str, Any]] | None = None
+) -> list[str]:
+    """Request prefix up to each `cache_control` breakpoint.
+
+    The provider caches tools, then system, then messages, so the tool
+    definitions lead every prefix.
+    """
+    request = json.dumps(tools or [], sort_keys=True)
+    prefixes = []
+    for message in messages:
+        request += f"\n{message.type}:"
+        blocks = (
+            message.content
+            if isinstance(message.content, list)
+            else [message.content]
+        )
+        for block in blocks:
+            if isinstance(block, str):
+                request += block
+                continue
+            request += block.get("text", "")
+            if block.get("cache_control"):
+                prefixes.append(request)
+    return prefixes
+
+
+def _malformed(rng: random.Random, payload: dict[str, Any]) -> str:
+    """Payload JSON with one of the mistakes models tend to make"""
+    kind = rng.choice(["lowercase", "trailing_comma", "prose", "truncated"])
+    if kind == "lowercase":
+        payload = {
+            **payload,
+            "sport": payload["sport"].lower(),
+            "workout_goal": payload["workout_goal"].lower(),
+        }
+    text = json.dumps(payload)
+    if kind == "trailing_comma":
+        text = text[:-1] + ",}"
+    elif kind == "prose":
+        return f"Here is the workout you asked for:\n{text}\nEnjoy!"
+    elif kind == "truncated":
+        text = text[: rng.randint(len(text) // 4, len(text) - 1)]
+    return f"```json\n{text}\n```"
+
+
+def _interval(
+    rng: random.Random, sport: Sport, effort: EffortZone
+) -> dict[str, Any]:
+    if sport == Sport.SWIMMING:
+        distance, unit = rng.choice([50, 100, 200, 400]), DistanceUnit.M
+    else:
+        distance, unit = rng.randint(1, 10), DistanceUnit.KM
+    return {
+        "distance": distance,
+        "distance_unit": unit.value,
+        "effort": effort.value,
+        "duration_estimate": None,
+        "recovery_time": None,
+    }
+
+
+def _build_workout(rng: random.Random, prompt: str) -> dict[str, Any]:
+    # Prefer the prompt's "Sports:" line, the schema lists every sport
+    match = re.search(r"Sports: ([A-Z, ]+)", prompt)
+    allowed = match.group(1) if match else prompt
+    sports = [sport for sport in Sport if sport.value in allowed] or list(Sport)
+    sport = rng.choice(sports)
+    intervals = [
+        _interval(rng, sport, rng.choice(list(EffortZone)))
+        for _ in range(rng.randint(2, 6))
+    ]
+    warmup = _interval(rng, sport, EffortZone.ZONE1)
+    cooldown = _interval(rng, sport, EffortZone.ZONE1)
+    return {
+        "name": f"Simulated {sport.value.title()} Session",
+        "sport": sport.value,
+        "warmup": warmup,
+        "intervals": intervals,
+        "cooldown": cooldown,
+        "workout_goal": rng.choice(list(Goal)).value,
+        "total_distance": None,
+        "estimated_duration": rng.randint(30, 90),
+        "intensity_focus": "Endurance",
+    }
+
+
+def _build_weekly_workout(rng: random.Random, prompt: str) -> dict[str, Any]:
+    match = re.search(r"Week Index: (\d+)", prompt)
+    week = match.group(1) if match else "1"
+    rest_days = sorted(rng.sample(range(1, 8), k=rng.randint(2, 4)))
+    training_days = [day for day in range(1, 8) if day not in rest_days]
+    return {
+        "workouts": [],
+        "weekly_workout_description": f"Simulated description for week {week}",
+        "workout_week_name": f"Week {week}",
+        "total_weekly_volume": rng.randint(120, 600),
+        "rest_days": rest_days,
+        # About half the training days easy, as in a typical week
+        "easy_days": sorted(
+            rng.sample(training_days, k=len(training_days) // 2)
+        ),
+        "weekly_focus": "Aerobic development",
+    }
+
+
+def _build_workout_batch(rng: random.Random, prompt: str) -> dict[str, Any]:
+    match = re.search(r"Workout Days: \[([\d, ]*)\]", prompt)
+    days = (
+        [int(day) for day in match.group(1).split(",") if day.strip()]
+        if match
+        else [1]
+    )
+    return {
+        "workouts": [
+            {"day": day, "workout": _build_workout(rng, prompt)}
+            for day in days
+        ]
+    }
+
+
+def _build_training_plan(rng: random.Random, prompt: str) -> dict[str, Any]:
+    match = re.search(r"should be (\d+) weeks long", prompt)
+    weeks = int(match.group(1)) if match else 1
+    # Fields in the order HIGH_LEVEL_PLAN_INSTRUCTIONS asks for them
+    return {
+        "plan_description": f"Simulated {weeks} week plan",
+        "progression_strategy": "Increase volume by 10% per week, deload every fourth week",
+        "plan_duration_weeks": weeks,
+        "weekly_workouts": [],
+    }
+
+
+PAYLOAD_BUILDERS: dict[str, Callable[[random.Random, str], dict[str, Any]]] = {
+    "TrainingPlan": _build_training_plan,
+    "WeeklyWorkout": _build_weekly_workout,
+    "Workout": _build_workout,
+    "WorkoutBatch": _build_workout_batch,
+}
@@ -0,0 +1,427 @@
+# Local fix-ups for model output, so only what can't be repaired costs
+# another round-trip to the model
+import json
+import math
+import re
+from collections.abc import Iterable, Sequence
+from dataclasses import dataclass, field
+from typing import Any, TypeVar
+
+from pydantic import ValidationError
+
+from coach.models.enums import DistanceUnit, EffortZone, Sport
+from coach.models.schema import Workout
+
+_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PYTHON_LITERALS = re.compile(r"\b(None|True|False)\b")
+_ZONE_NUMBER = re.compile(r"(\d+)")
+
+UNIT_ALIASES = {
+    "KILOMETERS": DistanceUnit.KM.value,
+    "KILOMETRES": DistanceUnit.KM.value,
+    "KILOMETER": DistanceUnit.KM.value,
+    "KILOMETRE": DistanceUnit.KM.value,
+    "KM": DistanceUnit.KM.value,
+    "METERS": DistanceUnit.M.value,
+    "METRES": DistanceUnit.M.value,
+    "METER": DistanceUnit.M.value,
+    "METRE": DistanceUnit.M.value,
+    "M": DistanceUnit.M.value,
+}
+SPORT_VALUES = {sport.value for sport in Sport}
+# Longest plausible single segment in kilometres, anything above it is
+# taken to be meters given the wrong unit
+MAX_SEGMENT_KM = {
+    Sport.SWIMMING.value: 10,
+    Sport.RUNNING.value: 50,
+    Sport.TRIATHLON.value: 50,
+    Sport.CYCLING.value: 250,
+}
+
+
+# Workouts that would have to shrink below this share of their length to
+# fit the time limit are regenerated instead
+MIN_DURATION_SCALE = 0.5
+
+T = TypeVar("T")
+
+
+class UnrepairableOutput(ValueError):
+    pass
+
+
+@dataclass
+class WorkoutConstraints:
+    """Athlete limits every generated workout has to respect"""
+
+    sports: Sequence[Sport] = ()
+    available_time_per_session: int | None = None
+    # Only passed on to the model, nothing can be checked against it
+    injuries_or_limitations: Sequence[str] | None = None
+
+    def prompt_values(self) -> dict[str, str]:
+        return {
+            "sports": ", ".join(sport.value for sport in self.sports) or "Any",
+            "available_time_per_session": (
+                f"{self.available_time_per_session} minutes"
+                if self.available_time_per_session
+                else "No limit"
+            ),
+            "injuries_or_limitations": (
+                ", ".join(self.injuries_or_limitations)
+                if self.injuries_or_limitations
+                else "None"
+            ),
+        }
+
+
+@dataclass
+class RepairStats:
+    clean: int = 0
+    repaired: int = 0
+    regenerated: int = 0
+    fixes: dict[str, int] = field(default_factory=dict)
+
+    def record(self, fixes: list[str]) -> None:
+        if not fixes:
+            self.clean += 1
+            return
+        self.repaired += 1
+        for fix in fixes:
+            self.fixes[fix] = self.fixes.get(fix, 0) + 1
+
+
+def repair_json(text: str) -> Any:
+    """Decode JSON a model wrapped, truncated or decorated.
+
+    Handles markdown fences and surrounding prose, trailing commas, Python
+    literals and unclosed brackets from a cut off response.
+    """
+    match = _FENCE.search(text)
+    if match:
+        text = match.group(1)
+    start = min(
+        (index for index in (text.find("{"), text.find("[")) if index >= 0),
+        default=-1,
+    )
+    if start < 0:
+        raise UnrepairableOutput("No JSON object in output")
+    text = text[start:]
+
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+        return value
+    except ValueError:
+        pass
+
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    text = _PYTHON_LITERALS.sub(
+        lambda m: {"None": "null", "True": "true", "False": "false"}[
+            m.group(1)
+        ],
+        text,
+    )
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text)
+        return value
+    except ValueError:
+        pass
+
+    closed = _close_brackets(text)
+    try:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", closed))
+    except ValueError as error:
+        raise UnrepairableOutput(f"Invalid JSON: {error}") from error
+
+
+def _close_brackets(text: str) -> str:
+    """Terminate a truncated document, dropping a dangling key or value"""
+    stack: list[str] = []
+    in_string = escaped = False
+    # Last point the document could be cut at, and what was open there
+    cut, cut_stack = 0, []
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+            cut, cut_stack = index + 1, list(stack)
+        elif char == ",":
+            cut, cut_stack = index, list(stack)
+
+    if not stack and not in_string:
+        return text
+    return text[:cut] + "".join(reversed(cut_stack))
+
+
+def _enum_value(value: Any) -> Any:
+    return value.strip().upper() if isinstance(value, str) else value
+
+
+def _repair_segment(
+    segment: Any, sport: str, fixes: list[str]
+) -> dict[str, Any]:
+    if not isinstance(segment, dict):
+        raise UnrepairableOutput("Interval is not an object")
+    segment = dict(segment)
+
+    unit = _enum_value(segment.get("distance_unit"))
+    unit = UNIT_ALIASES.get(unit, unit)
+    if unit != segment.get("distance_unit"):
+        fixes.append("unit_alias")
+    segment["distance_unit"] = unit
+
+    distance = segment.get("distance")
+    if isinstance(distance, str):
+        try:
+            distance = float(distance)
+        except ValueError:
+            raise UnrepairableOutput(f"Distance {distance!r} is not a number")
+    if not isinstance(distance, (int, float)) or distance <= 0:
+        raise UnrepairableOutput(f"Distance {distance!r} is not positive")
+
+    # Fractions of a kilometre become meters, meters given as kilometres
+    # (a 400 KM swim) go back to meters
+    if unit == DistanceUnit.KM.value and distance != int(distance):
+        distance, unit = distance * 1000, DistanceUnit.M.value
+        fixes.append("unit_normalised")
+    elif unit == DistanceUnit.KM.value and distance > MAX_SEGMENT_KM.get(
+        sport, MAX_SEGMENT_KM["CYCLING"]
+    ):
+        unit = DistanceUnit.M.value
+        fixes.append("unit_normalised")
+    if abs(distance - round(distance)) > 1e-6:
+        fixes.append("distance_rounded")
+    segment["distance"] = max(1, round(distance))
+    segment["distance_unit"] = unit
+
+    effort = segment.get("effort")
+    if isinstance(effort, str):
+        match = _ZONE_NUMBER.search(effort)
+        effort = int(match.group(1)) if match else None
+        fixes.append("zone_parsed")
+    if not isinstance(effort, (int, float)):
+        raise UnrepairableOutput(f"Effort {segment.get('effort')!r} unknown")
+    zone = min(
+        max(round(effort), EffortZone.ZONE1.value), EffortZone.ZONE5.value
+    )
+    if zone != effort:
+        fixes.append("zone_clamped")
+    segment["effort"] = zone
+
+    for key in ("duration_estimate", "recovery_time"):
+        value = segment.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, (int, float)) or value <= 0:
+            segment[key] = None
+            fixes.append("duration_dropped")
+    return segment
+
+
+def session_minutes(
+    estimated_duration: float | None,
+    segment_minutes: Iterable[float | None],
+) -> float:
+    """A workout's length, its estimate or its segments' total if longer"""
+    return max(
+        estimated_duration or 0,
+        sum(minutes or 0 for minutes in segment_minutes),
+    )
+
+
+def _fit_time_limit(
+    data: dict[str, Any], max_minutes: int | None, fixes: list[str]
+) -> None:
+    """Shrink a workout that runs over `max_minutes`, keeping its shape.
+
+    Every segment's distance and duration is scaled by the same factor,
+    so the session is shorter rather than just relabelled. Raises
+    `UnrepairableOutput` when it would have to lose more than half.
+    """
+    segments = [data["warmup"], *data["intervals"], data["cooldown"]]
+    minutes = session_minutes(
+        data.get("estimated_duration"),
+        (segment.get("duration_estimate") for segment in segments),
+    )
+    if not max_minutes or minutes <= max_minutes:
+        return
+    scale = max_minutes / minutes
+    if scale < MIN_DURATION_SCALE:
+        raise UnrepairableOutput(
+            f"Workout takes {minutes:g} minutes, the limit is {max_minutes}"
+        )
+
+    for segment in segments:
+        segment["distance"] = max(1, math.floor(segment["distance"] * scale))
+        if segment.get("duration_estimate"):
+            # Rounded down, so the scaled segments can't add up to more
+            # than the limit
+            segment["duration_estimate"] = max(
+                0.1, math.floor(segment["duration_estimate"] * scale * 10) / 10
+            )
+    if data.get("total_distance"):
+        data["total_distance"] = max(
+            1, math.floor(data["total_distance"] * scale)
+        )
+    if data.get("estimated_duration"):
+        data["estimated_duration"] = min(
+            max(1, math.floor(data["estimated_duration"] * scale)),
+            max_minutes,
+        )
+    fixes.append("duration_scaled")
+
+
+def repair_workout(
+    data: Any, constraints: WorkoutConstraints
+) -> tuple[Workout, list[str]]:
+    """Validate a workout payload, fixing what can be fixed locally.
+
+    Returns the workout and the fixes applied, an empty list when the
+    payload was already valid. Raises `UnrepairableOutput` for problems
+    only the model can fix, such as a sport outside the plan.
+    """
+    if not isinstance(data, dict):
+        raise UnrepairableOutput("Workout is not an object")
+    fixes: list[str] = []
+    data = dict(data)
+
+    sport = _enum_value(data.get("sport"))
+    if sport != data.get("sport"):
+        fixes.append("enum_case")
+    if sport not in SPORT_VALUES:
+        raise UnrepairableOutput(f"Unknown sport {data.get('sport')!r}")
+    allowed = {allowed.value for allowed in constraints.sports}
+    if allowed and sport not in allowed:
+        raise UnrepairableOutput(
+            f"Sport {sport} is not one of {sorted(allowed)}"
+        )
+    data["sport"] = sport
+
+    goal = _enum_value(data.get("workout_goal"))
+    if goal != data.get("workout_goal"):
+        fixes.append("enum_case")
+    data["workout_goal"] = goal
+
+    max_minutes = constraints.available_time_per_session
+    for key in ("warmup", "cooldown"):
+        data[key] = _repair_segment(data.get(key), sport, fixes)
+    intervals = data.get("intervals")
+    if intervals is None:
+        intervals = []
+        fixes.append("intervals_defaulted")
+    if not isinstance(intervals, list):
+        raise UnrepairableOutput("Intervals are not a list")
+    data["intervals"] = [
+        _repair_segment(interval, sport, fixes)
+        for interval in intervals
+    ]
+
+    for key in ("total_distance", "estimated_duration"):
+        value = data.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, (int, float)) or value <= 0:
+            data[key] = None
+            fixes.append("duration_dropped")
+            continue
+        if value != int(value):
+            fixes.append("distance_rounded")
+        data[key] = max(1, round(value))
+    _fit_time_limit(data, max_minutes, fixes)
+
+    try:
+        workout = Workout.model_validate(data)
+    except ValidationError as error:
+        problems = "; ".join(
+            f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}"
+            for detail in error.errors()[:3]
+        )
+        raise UnrepairableOutput(problems) from error
+    return workout, list(dict.fromkeys(fixes))
+
+
+def violates_constraints(
+    workout: Workout, constraints: WorkoutConstraints
+) -> bool:
+    """Whether a schema-valid workout still breaks the athlete's limits"""
+    allowed = set(constraints.sports)
+    if allowed and workout.sport not in allowed:
+        return True
+    max_minutes = constraints.available_time_per_session
+    if not max_minutes:
+        return False
+    return (
+        session_minutes(
+            workout.estimated_duration,
+            (
+                segment.duration_estimate
+                for segment in (
+                    workout.warmup,
+                    *workout.intervals,
+                    workout.cooldown,
+                )
+            ),
+        )
+        > max_minutes
+    )
+
+
+def reconcile_rest_days(
+    rest_days: list[int], workouts_per_week: int | None = None
+) -> list[int]:
+    """Rest days within 1-7, deduplicated, matching `workouts_per_week`.
+
+    When the count is off the training days are spread evenly over the
+    week instead, so no rest day is left holding a workout.
+    """
+    days = sorted({day for day in rest_days if 1 <= day <= 7})
+    if workouts_per_week is None or 7 - len(days) == workouts_per_week:
+        return days
+    count = min(max(workouts_per_week, 0), 7)
+    training = (
+        {round(i * 7 / count) + 1 for i in range(count)} if count else set()
+    )
+    return [day for day in range(1, 8) if day not in training]
+
+
+def reconcile_easy_days(
+    easy_days: list[int], rest_days: list[int]
+) -> list[int]:
+    """Easy days within 1-7, deduplicated, that are still training days"""
+    return sorted(
+        {day for day in easy_days if 1 <= day <= 7 and day not in rest_days}
+    )
+
+
+def assign_batch_days(
+    items: list[tuple[Any, T]], days: list[int]
+) -> tuple[dict[int, T], list[int]]:
+    """Place batch items on the requested days.
+
+    Items tagged with a requested day keep it, the rest (tagged with a rest
+    day, a duplicate day or no day) fill the requested days still open, in
+    order. Returns the assignment and the days filled by moved items.
+    """
+    assigned: dict[int, T] = {}
+    leftovers = []
+    for day, item in items:
+        if day in days and day not in assigned:
+            assigned[day] = item
+        else:
+            leftovers.append(item)
+
+    open_days = [day for day in days if day not in assigned]
+    moved = dict(zip(open_days, leftovers))
+    assigned.update(moved)
+    return assigned, list(moved)
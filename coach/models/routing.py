@@ -0,0 +1,108 @@
+# Per call type model routing: which model tier each call site uses, and
+# which stronger tier it escalates to when the output fails validation
+from dataclasses import dataclass, field
+from typing import Any
+
+from coach.models.scheduler import CallPriority, SchedulerStats
+
+# Anthropic prompt caching prices cache reads at 10% of the input price
+# and cache writes at 125%
+CACHE_READ_MULTIPLIER = 0.1
+CACHE_WRITE_MULTIPLIER = 1.25
+
+
+@dataclass
+class ModelTier:
+    """A model with its own concurrency cap, timeout and price"""
+
+    model_name: str
+    # USD per million tokens
+    input_cost_per_mtok: float = 0.0
+    output_cost_per_mtok: float = 0.0
+    max_concurrency: int | None = None
+    model_timeout: int | None = None
+    # Anthropic rate limits are per model, None uses the Dependencies ones
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+    # Merged into `fake_options` when the fake provider stands in for it
+    fake_options: dict[str, Any] = field(default_factory=dict)
+
+    def cost(self, stats: SchedulerStats) -> float:
+        uncached = (
+            stats.input_tokens
+            - stats.cache_read_tokens
+            - stats.cache_creation_tokens
+        )
+        input_tokens = (
+            uncached
+            + stats.cache_read_tokens * CACHE_READ_MULTIPLIER
+            + stats.cache_creation_tokens * CACHE_WRITE_MULTIPLIER
+        )
+        return (
+            input_tokens * self.input_cost_per_mtok
+            + stats.output_tokens * self.output_cost_per_mtok
+        ) / 1e6
+
+
+@dataclass
+class ModelRoute:
+    tier: str
+    # Tier used again when this tier's output fails validation
+    escalate_to: str | None = None
+    # Per attempt deadline, overrides the Dependencies default
+    deadline: float | None = None
+
+
+DEFAULT_TIERS = {
+    "haiku": ModelTier(
+        model_name="claude-3-5-haiku-latest",
+        input_cost_per_mtok=0.8,
+        output_cost_per_mtok=4.0,
+        max_concurrency=10,
+        model_timeout=60,
+    ),
+    "sonnet": ModelTier(
+        model_name="claude-3-5-sonnet-20241022",
+        input_cost_per_mtok=3.0,
+        output_cost_per_mtok=15.0,
+        max_concurrency=4,
+        model_timeout=120,
+    ),
+}
+
+# The plan outline gates every week, so it gets the strong model. Weekly
+# outlines and leaf workouts are most of the volume and start on the fast
+# one.
+DEFAULT_ROUTES = {
+    CallPriority.TRAINING_PLAN: ModelRoute(tier="sonnet", deadline=90.0),
+    CallPriority.WEEKLY_PLAN: ModelRoute(
+        tier="haiku", escalate_to="sonnet", deadline=45.0
+    ),
+    CallPriority.WORKOUT: ModelRoute(
+        tier="haiku", escalate_to="sonnet", deadline=30.0
+    ),
+}
+
+
+def print_routing_summary(
+    tiers: dict[str, ModelTier],
+    stats: dict[str, SchedulerStats],
+    escalations: dict[str, int],
+) -> None:
+    header = (
+        f"{'tier':<10} {'model':<28} {'calls':>5} {'errors':>6} "
+        f"{'mean_s':>7} {'in_tok':>8} {'out_tok':>8} {'cost_usd':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, tier in tiers.items():
+        tier_stats = stats[name]
+        mean = tier_stats.call_seconds / max(tier_stats.completed, 1)
+        print(
+            f"{name:<10} {tier.model_name[:28]:<28} {tier_stats.calls:>5} "
+            f"{tier_stats.errors:>6} {mean:>7.2f} "
+            f"{tier_stats.input_tokens:>8} {tier_stats.output_tokens:>8} "
+            f"{tier.cost(tier_stats):>9.4f}"
+        )
+    for call_type, count in sorted(escalations.items()):
+        print(f"Escalated {call_type}: {count}")
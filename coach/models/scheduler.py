@@ -0,0 +1,627 @@
+import asyncio
+import contextlib
+import contextvars
+import heapq
+import itertools
+import random
+import time
+from collections import deque
+from collections.abc import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Collection,
+    Iterator,
+)
+from dataclasses import asdict, dataclass
+from enum import IntEnum
+from typing import Any, TypeVar, cast
+
+import anthropic
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from pydantic import Field
+
+T = TypeVar("T")
+
+
+class CallPriority(IntEnum):
+    """Lower values are dispatched first when calls queue for capacity"""
+
+    TRAINING_PLAN = 0  # Blocks every week of the plan
+    WEEKLY_PLAN = 1  # Blocks every workout of its week
+    WORKOUT = 2  # Leaf call
+
+
+_call_priority: contextvars.ContextVar[CallPriority] = contextvars.ContextVar(
+    "call_priority", default=CallPriority.WORKOUT
+)
+
+
+@contextlib.contextmanager
+def call_priority(priority: CallPriority) -> Iterator[None]:
+    """Tag model calls made inside the block with a scheduling priority"""
+    token = _call_priority.set(priority)
+    try:
+        yield
+    finally:
+        _call_priority.reset(token)
+
+
+@dataclass
+class CallRecord:
+    """What the scheduler did for one model call, surfaced to callbacks"""
+
+    call_type: str = ""
+    queue_wait_seconds: float = 0.0
+    attempts: int = 0
+    retries: int = 0
+    deadline_timeouts: int = 0
+    hedged: bool = False
+
+
+_call_record: contextvars.ContextVar[CallRecord | None] = (
+    contextvars.ContextVar("call_record", default=None)
+)
+
+
+@dataclass
+class SchedulerStats:
+    calls: int = 0
+    retries: int = 0
+    throttled: int = 0
+    total_wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    max_queue_depth: int = 0
+    max_in_flight: int = 0
+    deadline_timeouts: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    # Attempts that returned / raised, their time in flight and token usage
+    completed: int = 0
+    errors: int = 0
+    call_seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    # Input tokens read from / written to the provider's prompt cache
+    cache_read_tokens: int = 0
+    cache_creation_tokens: int = 0
+
+
+class LatencyTracker:
+    """Rolling window of recent call latencies for each call type"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20) -> None:
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: dict[CallPriority, deque[float]] = {}
+
+    def record(self, priority: CallPriority, seconds: float) -> None:
+        samples = self._samples.setdefault(
+            priority, deque(maxlen=self.window)
+        )
+        samples.append(seconds)
+
+    def percentile(self, priority: CallPriority, q: float) -> float | None:
+        """The q-th percentile latency, None until enough calls are seen"""
+        samples = self._samples.get(priority)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(q / 100 * len(ordered)))
+        return ordered[index]
+
+
+class _TokenBucket:
+    """Continuously refilling budget of `capacity` units per minute"""
+
+    def __init__(self, per_minute: float) -> None:
+        self.capacity = per_minute
+        self.available = per_minute
+        self.rate = per_minute / 60
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.available = min(
+            self.capacity, self.available + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def seconds_until(self, amount: float) -> float:
+        # Oversized requests only wait for a full bucket
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate
+
+
+def is_overload_error(error: BaseException) -> bool:
+    if isinstance(error, anthropic.RateLimitError):
+        return True
+    return (
+        isinstance(error, anthropic.APIStatusError)
+        and error.status_code == 529
+    )
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    if is_overload_error(error):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code >= 500
+    return isinstance(
+        error,
+        (
+            TimeoutError,
+            anthropic.APITimeoutError,
+            anthropic.APIConnectionError,
+        ),
+    )
+
+
+def _retry_after(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(messages: list[BaseMessage], **kwargs: Any) -> int:
+    """Rough input token estimate (~4 characters per token)"""
+    characters = sum(len(str(message.content)) for message in messages)
+    characters += len(str(kwargs.get("tools", "")))
+    return characters // 4 + 1
+
+
+class CallScheduler:
+    """Graph-wide admission control for model calls.
+
+    Enforces requests-per-minute and tokens-per-minute budgets and a
+    concurrency cap, dispatching queued calls strictly by `CallPriority` so
+    that calls on the critical path (the plan, then each week's outline)
+    overtake leaf workout calls. Overload responses (429/529) halve the
+    concurrency cap and pause dispatch, successes grow it back one slot at a
+    time (AIMD).
+
+    Each call type (priority) can be given a deadline, after which the
+    attempt is abandoned and retried. Calls still running past the
+    `hedge_percentile` of their type's recent latencies get a duplicate
+    request when there is spare capacity, and whichever finishes first wins
+    while the other is cancelled. Hedges go through the same budgets and
+    are capped at `max_hedge_fraction` of calls.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 50,
+        tokens_per_minute: float = 40_000,
+        max_concurrency: int = 10,
+        min_concurrency: int = 1,
+        max_retries: int = 5,
+        base_backoff_seconds: float = 1.0,
+        max_backoff_seconds: float = 60.0,
+        deadlines: dict[CallPriority, float] | None = None,
+        hedge_percentile: float | None = None,
+        hedge_priorities: Collection[CallPriority] = (
+            CallPriority.WEEKLY_PLAN,
+            CallPriority.WORKOUT,
+        ),
+        max_hedge_fraction: float = 0.1,
+    ) -> None:
+        self.requests = _TokenBucket(requests_per_minute)
+        self.tokens = _TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.concurrency_limit = max_concurrency
+        self.max_retries = max_retries
+        self.base_backoff_seconds = base_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.deadlines = deadlines or {}
+        self.hedge_percentile = hedge_percentile
+        self.hedge_priorities = frozenset(hedge_priorities)
+        self.max_hedge_fraction = max_hedge_fraction
+        self.latency = LatencyTracker()
+        self.stats = SchedulerStats()
+
+        self._in_flight = 0
+        self._successes_since_increase = 0
+        self._paused_until = 0.0
+        self._queue: list[tuple[int, int, float, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._wakeup: asyncio.TimerHandle | None = None
+        self._runs = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 0,
+        priority: CallPriority | None = None,
+    ) -> T:
+        """Run `call` once capacity allows, retrying transient API errors"""
+        if priority is None:
+            priority = _call_priority.get()
+        self._runs += 1
+
+        hedge_after = None
+        if (
+            self.hedge_percentile is not None
+            and priority in self.hedge_priorities
+        ):
+            hedge_after = self.latency.percentile(
+                priority, self.hedge_percentile
+            )
+        if hedge_after is None:
+            return await self._run_with_retries(
+                call, estimated_tokens, priority
+            )
+        return await self._run_hedged(
+            call, estimated_tokens, priority, hedge_after
+        )
+
+    async def _run_with_retries(
+        self,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int,
+        priority: CallPriority,
+        dispatched: asyncio.Event | None = None,
+    ) -> T:
+        deadline = self.deadlines.get(priority)
+
+        attempt = 0
+        while True:
+            async with self.slot(estimated_tokens, priority):
+                if dispatched is not None:
+                    dispatched.set()
+                start = time.monotonic()
+                try:
+                    result = await asyncio.wait_for(call(), deadline)
+                except Exception as error:
+                    self.stats.errors += 1
+                    if isinstance(error, TimeoutError):
+                        self.stats.deadline_timeouts += 1
+                        record = _call_record.get()
+                        if record is not None:
+                            record.deadline_timeouts += 1
+                    if not is_retryable_error(error) or (
+                        attempt >= self.max_retries
+                    ):
+                        raise
+                    delay = self._on_failure(error, attempt)
+                else:
+                    self._record_success(priority, time.monotonic() - start)
+                    return result
+
+            attempt += 1
+            self.stats.retries += 1
+            record = _call_record.get()
+            if record is not None:
+                record.retries += 1
+            await asyncio.sleep(delay)
+
+    async def _run_hedged(
+        self,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int,
+        priority: CallPriority,
+        hedge_after: float,
+    ) -> T:
+        dispatched = asyncio.Event()
+        primary = asyncio.ensure_future(
+            self._run_with_retries(
+                call, estimated_tokens, priority, dispatched
+            )
+        )
+        tasks = [primary]
+        try:
+            # The hedge timer starts once the primary leaves the queue, time
+            # spent waiting for capacity is not the call being slow
+            dispatch_wait = asyncio.ensure_future(dispatched.wait())
+            tasks.append(dispatch_wait)
+            await asyncio.wait(
+                [primary, dispatch_wait],
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not primary.done():
+                await asyncio.wait([primary], timeout=hedge_after)
+            if primary.done() or not self._can_hedge():
+                return await primary
+
+            self.stats.hedges += 1
+            record = _call_record.get()
+            if record is not None:
+                record.hedged = True
+            hedge = asyncio.ensure_future(
+                self._run_with_retries(call, estimated_tokens, priority)
+            )
+            tasks.append(hedge)
+
+            pending = {primary, hedge}
+            first_error: BaseException | None = None
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is hedge:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+                    first_error = first_error or error
+            raise cast(BaseException, first_error)
+        finally:
+            # Cancel the loser, its slot is released as it unwinds
+            for task in tasks:
+                task.cancel()
+
+    def _can_hedge(self) -> bool:
+        # Only duplicate work when nothing is waiting for the capacity, and
+        # keep hedges to a bounded share of the request budget
+        return (
+            not self._queue
+            and self._in_flight < self.concurrency_limit
+            and self.stats.hedges < self.max_hedge_fraction * self._runs
+        )
+
+    async def stream(
+        self,
+        open_stream: Callable[[], AsyncIterator[T]],
+        estimated_tokens: int = 0,
+        priority: CallPriority | None = None,
+    ) -> AsyncIterator[T]:
+        """Streaming variant of `run`, retried only before the first chunk"""
+        if priority is None:
+            priority = _call_priority.get()
+
+        attempt = 0
+        while True:
+            started = False
+            async with self.slot(estimated_tokens, priority):
+                start = time.monotonic()
+                try:
+                    async for chunk in open_stream():
+                        started = True
+                        yield chunk
+                except Exception as error:
+                    self.stats.errors += 1
+                    if (
+                        started
+                        or not is_retryable_error(error)
+                        or attempt >= self.max_retries
+                    ):
+                        raise
+                    delay = self._on_failure(error, attempt)
+                else:
+                    self._record_success(priority, time.monotonic() - start)
+                    return
+
+            attempt += 1
+            self.stats.retries += 1
+            record = _call_record.get()
+            if record is not None:
+                record.retries += 1
+            await asyncio.sleep(delay)
+
+    @contextlib.asynccontextmanager
+    async def slot(
+        self, estimated_tokens: int, priority: CallPriority
+    ) -> AsyncIterator[None]:
+        """Hold one unit of concurrency for the duration of the block"""
+        await self._acquire(estimated_tokens, priority)
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def refund_tokens(self, amount: float) -> None:
+        """Return over-estimated tokens once the real usage is known"""
+        self.tokens.available = min(
+            self.tokens.capacity, self.tokens.available + amount
+        )
+        self._dispatch()
+
+    async def _acquire(
+        self, estimated_tokens: int, priority: CallPriority
+    ) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(
+            self._queue,
+            (int(priority), next(self._sequence), estimated_tokens, future),
+        )
+        self.stats.max_queue_depth = max(
+            self.stats.max_queue_depth, len(self._queue)
+        )
+
+        start = time.perf_counter()
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted just before cancellation, hand the slot back
+                self._in_flight -= 1
+                self._dispatch()
+            raise
+
+        waited = time.perf_counter() - start
+        record = _call_record.get()
+        if record is not None:
+            record.queue_wait_seconds += waited
+            record.attempts += 1
+        self.stats.calls += 1
+        self.stats.total_wait_seconds += waited
+        self.stats.max_wait_seconds = max(self.stats.max_wait_seconds, waited)
+
+    def _dispatch(self) -> None:
+        now = time.monotonic()
+        self.requests.refill(now)
+        self.tokens.refill(now)
+
+        while self._queue:
+            _, _, estimated_tokens, future = self._queue[0]
+            if future.done():
+                heapq.heappop(self._queue)
+                continue
+
+            if self._in_flight >= self.concurrency_limit:
+                return
+
+            # Strict priority: the head of the queue waits for budget rather
+            # than letting lower priority calls jump ahead of it
+            delay = max(
+                self._paused_until - now,
+                self.requests.seconds_until(1),
+                self.tokens.seconds_until(estimated_tokens),
+            )
+            if delay > 0:
+                self._schedule_wakeup(delay)
+                return
+
+            heapq.heappop(self._queue)
+            self.requests.available -= 1
+            self.tokens.available -= estimated_tokens
+            self._in_flight += 1
+            self.stats.max_in_flight = max(
+                self.stats.max_in_flight, self._in_flight
+            )
+            future.set_result(None)
+
+    def _schedule_wakeup(self, delay: float) -> None:
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+        self._wakeup = asyncio.get_running_loop().call_later(
+            delay, self._dispatch
+        )
+
+    def record_usage(self, usage: dict[str, Any]) -> None:
+        self.stats.input_tokens += usage.get("input_tokens", 0)
+        self.stats.output_tokens += usage.get("output_tokens", 0)
+        details = usage.get("input_token_details") or {}
+        self.stats.cache_read_tokens += details.get("cache_read", 0)
+        self.stats.cache_creation_tokens += details.get("cache_creation", 0)
+
+    def _record_success(self, priority: CallPriority, seconds: float) -> None:
+        self.latency.record(priority, seconds)
+        self.stats.completed += 1
+        self.stats.call_seconds += seconds
+        self._on_success()
+
+    def _on_success(self) -> None:
+        self._successes_since_increase += 1
+        if (
+            self.concurrency_limit < self.max_concurrency
+            and self._successes_since_increase >= self.concurrency_limit
+        ):
+            self.concurrency_limit += 1
+            self._successes_since_increase = 0
+
+    def _on_failure(self, error: BaseException, attempt: int) -> float:
+        # Full jitter exponential backoff, unless the API says otherwise
+        delay = random.uniform(
+            0,
+            min(
+                self.max_backoff_seconds,
+                self.base_backoff_seconds * 2**attempt,
+            ),
+        )
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+
+        if is_overload_error(error):
+            self.stats.throttled += 1
+            self.concurrency_limit = max(
+                self.min_concurrency, self.concurrency_limit // 2
+            )
+            self._successes_since_increase = 0
+            self._paused_until = max(
+                self._paused_until, time.monotonic() + delay
+            )
+        return delay
+
+
+class ScheduledChatModel(BaseChatModel):
+    """Chat model base that sends cache misses through a `CallScheduler`.
+
+    Combine with a concrete model, e.g.
+    `class ScheduledChatAnthropic(ScheduledChatModel, ChatAnthropic)`. Cache
+    hits are resolved by `BaseChatModel` before `_agenerate` / `_astream`, so
+    they never consume scheduler budget.
+    """
+
+    scheduler: CallScheduler | None = Field(default=None, exclude=True)
+
+    def _estimate(self, messages: list[BaseMessage], **kwargs: Any) -> int:
+        max_tokens = getattr(self, "max_tokens", None) or 0
+        return estimate_tokens(messages, **kwargs) + max_tokens
+
+    def _reconcile(self, estimated: int, message: BaseMessage) -> None:
+        usage = getattr(message, "usage_metadata", None)
+        if self.scheduler is not None and usage:
+            self.scheduler.refund_tokens(estimated - usage["total_tokens"])
+            self.scheduler.record_usage(usage)
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        parent = super()._agenerate
+        if self.scheduler is None:
+            return await parent(messages, stop, run_manager, **kwargs)
+
+        estimated = self._estimate(messages, **kwargs)
+        record = CallRecord(call_type=_call_priority.get().name.lower())
+        token = _call_record.set(record)
+        try:
+            result = await self.scheduler.run(
+                lambda: parent(messages, stop, run_manager, **kwargs),
+                estimated_tokens=estimated,
+            )
+        finally:
+            _call_record.reset(token)
+        self._reconcile(estimated, result.generations[0].message)
+        # Reaches callback handlers through LLMResult.llm_output
+        result.llm_output = {
+            **(result.llm_output or {}),
+            "scheduler": asdict(record),
+        }
+        return result
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        parent = super()._astream
+        if self.scheduler is None:
+            async for chunk in parent(messages, stop, run_manager, **kwargs):
+                yield chunk
+            return
+
+        estimated = self._estimate(messages, **kwargs)
+        async for chunk in self.scheduler.stream(
+            lambda: parent(messages, stop, run_manager, **kwargs),
+            estimated_tokens=estimated,
+        ):
+            if chunk.message.usage_metadata:
+                self._reconcile(estimated, chunk.message)
+            yield chunk
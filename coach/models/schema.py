@@ -1,8 +1,9 @@
 from typing import Union
 
-from models.enums import DistanceUnit, EffortZone, Goal, Sport
 from pydantic import BaseModel, Field, PositiveFloat, PositiveInt
 
+from coach.models.enums import DistanceUnit, EffortZone, Goal, Sport
+
 
 class Interval(BaseModel):
     """Represents a single training interval with distance and intensity parameters"""
@@ -67,6 +68,23 @@ class Workout(BaseModel):
     )
 
 
+class ScheduledWorkout(BaseModel):
+    """Workout assigned to a specific day of the training week"""
+
+    day: int = Field(
+        description="Day of the week (1-7) this workout is scheduled on"
+    )
+    workout: Workout = Field(description="Workout session for this day")
+
+
+class WorkoutBatch(BaseModel):
+    """Several days of a training week generated in a single call"""
+
+    workouts: list[ScheduledWorkout] = Field(
+        description="One scheduled workout for each requested training day"
+    )
+
+
 # class WorkoutPlan(BaseModel):
 #     workout_plan = str
 #     number_of_intervals = int
@@ -90,6 +108,10 @@ class WeeklyWorkout(BaseModel):
     rest_days: list[int] = Field(
         description="List of rest days (1-7) in this week", default_factory=list
     )
+    easy_days: list[int] = Field(
+        description="Training days (1-7) for easy aerobic or recovery sessions, the other training days are key sessions",
+        default_factory=list,
+    )
     weekly_focus: str | None = Field(
         description="Primary training focus for this week", default=None
     )
@@ -1,11 +1,39 @@
-import operator
-from collections.abc import Sequence
+from collections.abc import Mapping, Sequence
 from typing import Annotated
 
-from models.enums import Experience, Goal, Sport
-from models.schema import TrainingPlan, WeeklyWorkout, Workout
 from pydantic import Field, PositiveInt
-from typing_extensions import TypedDict
+from typing_extensions import NotRequired, TypedDict
+
+from coach.models.enums import Experience, Goal, Sport
+from coach.models.schema import TrainingPlan, WeeklyWorkout, Workout
+
+
+def fill_week_slots(
+    slots: list[WeeklyWorkout | None],
+    update: list[WeeklyWorkout | None] | Mapping[int, WeeklyWorkout],
+) -> list[WeeklyWorkout | None]:
+    """Reducer for planned weeks, one slot per week of the plan.
+
+    A list replaces the slots, which is how they're sized before the
+    weekly branches start. A `{week_index: week}` mapping fills in single
+    slots, so weeks end up in plan order whichever branch finishes first.
+    """
+    if not isinstance(update, Mapping):
+        return list(update)
+    slots = list(slots)
+    for week_index, week in update.items():
+        if week_index > len(slots):
+            slots.extend([None] * (week_index - len(slots)))
+        slots[week_index - 1] = week
+    return slots
+
+
+class PlanOutline(TypedDict):
+    """The plan fields weekly planning reads, sent instead of the plan"""
+
+    plan_duration_weeks: int
+    plan_description: str
+    progression_strategy: str
 
 
 class TrainingPlanInput(TypedDict):
@@ -61,24 +89,66 @@ class TrainingPlanState(TypedDict):
         str
     ]  # Any physical limitations to consider
     training_plan: TrainingPlan
-    planned_workouts: Annotated[list, operator.add]
+    # Filled by week index, None until that week's branch returns it. Weeks
+    # streamed to disk by a checkpointed run never fill their slot
+    planned_weeks: Annotated[list[WeeklyWorkout | None], fill_week_slots]
 
 
 class WeeklyWorkoutState(TypedDict):
     week_index: int  # Which week in the training plan
-    current_training_plan: TrainingPlan
-    planned_workouts: list[WeeklyWorkout]
+    plan_outline: PlanOutline
+    planned_weeks: dict[int, WeeklyWorkout]  # Week index -> planned week
+    # Athlete limits generated workouts are checked and repaired against
+    sports: NotRequired[Sequence[Sport]]
+    available_time_per_session: NotRequired[int]
+    workouts_per_week: NotRequired[int]
+    injuries_or_limitations: NotRequired[Sequence[str] | None]
+    # Athlete profile weeks and workouts are matched to templates by
+    training_goal: NotRequired[Goal]
+    experience: NotRequired[Experience]
+    current_weekly_volume: NotRequired[PositiveInt]
+    # Identifies the plan, so its weeks don't reuse the same template
+    plan_id: NotRequired[str]
+    # Re-planning: keep this week's outline and other days, only
+    # regenerating the workouts on `replan_days`
+    existing_week: NotRequired[WeeklyWorkout]
+    replan_days: NotRequired[list[int]]
 
 
 class WeeklyWorkoutInput(TypedDict):
     week_index: int  # Which week in the training plan
-    current_training_plan: TrainingPlan
+    plan_outline: PlanOutline
+    sports: NotRequired[Sequence[Sport]]
+    available_time_per_session: NotRequired[int]
+    workouts_per_week: NotRequired[int]
+    injuries_or_limitations: NotRequired[Sequence[str] | None]
+    training_goal: NotRequired[Goal]
+    experience: NotRequired[Experience]
+    current_weekly_volume: NotRequired[PositiveInt]
+    plan_id: NotRequired[str]
+    existing_week: NotRequired[WeeklyWorkout]
+    replan_days: NotRequired[list[int]]
 
 
 class WeeklyWorkoutOutput(TypedDict):
-    planned_workouts: list[WeeklyWorkout]
+    planned_weeks: dict[int, WeeklyWorkout]
 
 
 class WorkoutState(TypedDict):
     workout: Workout
     completed_workouts: list[Workout]
+
+
+class ReplanInput(TrainingPlanInput):
+    """Updated athlete input plus what an earlier plan needs regenerated"""
+
+    previous_plan: TrainingPlan  # Resized to the new length, repairs applied
+    replan_weeks: dict[
+        int, list[int] | None
+    ]  # Week -> days to regenerate, None for the whole week
+    regenerate_outline: bool  # Plan level fields are stale too
+
+
+class ReplanState(ReplanInput):
+    training_plan: TrainingPlan
+    planned_weeks: Annotated[list[WeeklyWorkout | None], fill_week_slots]
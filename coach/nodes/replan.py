@@ -0,0 +1,204 @@
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.types import Send
+
+from coach.models.dependencies import Dependencies
+from coach.models.repair import (
+    UnrepairableOutput,
+    WorkoutConstraints,
+    repair_workout,
+    violates_constraints,
+)
+from coach.models.schema import TrainingPlan
+from coach.models.states import ReplanState, TrainingPlanInput
+from coach.nodes.training_plan import (
+    TrainingPlanNode,
+    run_plan_id,
+    weekly_input,
+)
+from coach.storage.reader import training_days
+from coach.storage.writer import atomic_write
+
+# Inputs the high-level plan is written from, changing one makes the plan
+# description and progression stale
+PLAN_FIELDS = {"training_goal", "experience", "current_weekly_volume"}
+# Inputs that shape a whole week, its outline and rest days included
+WEEK_FIELDS = {"workouts_per_week", "injuries_or_limitations"}
+# Inputs each workout can be checked against on its own
+DAY_FIELDS = {"sports", "available_time_per_session"}
+
+
+@dataclass
+class ReplanScope:
+    """What an input change invalidates in an existing plan"""
+
+    plan: TrainingPlan
+    weeks: dict[int, list[int] | None]
+    regenerate_outline: bool
+    repaired: int = 0
+
+    @property
+    def whole_weeks(self) -> list[int]:
+        return [week for week, days in self.weeks.items() if days is None]
+
+    @property
+    def days(self) -> int:
+        return sum(len(days) for days in self.weeks.values() if days)
+
+
+def _same(previous: Any, value: Any) -> bool:
+    if isinstance(previous, Sequence) and not isinstance(previous, str):
+        return isinstance(value, Sequence) and list(previous) == list(value)
+    return previous == value
+
+
+def changed_fields(
+    previous_input: Mapping[str, Any], changes: Mapping[str, Any]
+) -> set[str]:
+    return {
+        field
+        for field, value in changes.items()
+        if not _same(previous_input.get(field), value)
+    }
+
+
+def replan_scope(
+    previous_plan: TrainingPlan,
+    previous_input: TrainingPlanInput,
+    changes: Mapping[str, Any],
+    from_week: int = 1,
+) -> ReplanScope:
+    """Work out which weeks and days of `previous_plan` need regenerating.
+
+    Changes apply from `from_week` on, earlier weeks are kept as they are.
+    Plan and week level inputs invalidate every affected week. Sports and
+    session length are checked workout by workout: workouts that can be
+    brought within the new limits locally (a session scaled down by at most
+    half) are repaired in place, only the others are regenerated. Weeks past the
+    old programme length are generated, weeks past the new one dropped.
+    """
+    plan_input = {**previous_input, **changes}
+    changed = changed_fields(previous_input, changes)
+
+    plan = previous_plan.model_copy(deep=True)
+    length = plan_input["programme_length"]
+    kept = min(len(plan.weekly_workouts), length)
+    plan.weekly_workouts = plan.weekly_workouts[:kept]
+    plan.plan_duration_weeks = length
+
+    weeks: dict[int, list[int] | None] = {
+        week: None for week in range(kept + 1, length + 1)
+    }
+    affected = range(max(from_week, 1), kept + 1)
+    repaired = 0
+
+    if changed & (PLAN_FIELDS | WEEK_FIELDS):
+        weeks.update((week, None) for week in affected)
+    elif changed & DAY_FIELDS:
+        constraints = WorkoutConstraints(
+            sports=plan_input["sports"],
+            available_time_per_session=plan_input[
+                "available_time_per_session"
+            ],
+        )
+        for week_index in affected:
+            week = plan.weekly_workouts[week_index - 1]
+            days = []
+            for position, (day, workout) in enumerate(
+                zip(training_days(week.rest_days), week.workouts)
+            ):
+                if not violates_constraints(workout, constraints):
+                    continue
+                try:
+                    repaired_workout, _ = repair_workout(
+                        workout.model_dump(mode="json"), constraints
+                    )
+                except UnrepairableOutput:
+                    days.append(day)
+                    continue
+                # Anything repair couldn't bring within the new limits is
+                # regenerated rather than kept as it was
+                if violates_constraints(repaired_workout, constraints):
+                    days.append(day)
+                    continue
+                week.workouts[position] = repaired_workout
+                repaired += 1
+            if days:
+                weeks[week_index] = days
+
+    return ReplanScope(
+        plan=plan,
+        weeks=dict(sorted(weeks.items())),
+        regenerate_outline=bool(changed & PLAN_FIELDS),
+        repaired=repaired,
+    )
+
+
+class ReplanNode:
+    def __init__(self, deps: Dependencies) -> None:
+        self.deps = deps
+        self.training_node = TrainingPlanNode(deps=deps)
+
+    async def prepare_replan(self, state: ReplanState, config: RunnableConfig):
+        previous_plan = state["previous_plan"]
+        replan_weeks = state["replan_weeks"]
+
+        if state["regenerate_outline"]:
+            result = await self.training_node.generate_high_level_training_plan(
+                state
+            )
+            training_plan = result["training_plan"]
+        else:
+            training_plan = previous_plan.model_copy(
+                update={"weekly_workouts": []}
+            )
+
+        # Kept weeks go straight into the run's chunk files, regenerated
+        # ones land beside them as their branches finish
+        run_id = config.get("configurable", {}).get("thread_id")
+        if run_id is not None:
+            for week_index, week in enumerate(previous_plan.weekly_workouts, 1):
+                if week_index not in replan_weeks:
+                    self.deps.plan_writer.write_week(run_id, week_index, week)
+
+        return {
+            "training_plan": training_plan,
+            "planned_weeks": [None] * state["programme_length"],
+        }
+
+    def initiate_replanning(
+        self, state: ReplanState, config: RunnableConfig
+    ) -> list[Send] | str:
+        previous_weeks = state["previous_plan"].weekly_workouts
+        plan_id = run_plan_id(config)
+        sends = []
+        for week_index, days in state["replan_weeks"].items():
+            payload = weekly_input(state, week_index, plan_id)
+            if days is not None:
+                payload["existing_week"] = previous_weeks[week_index - 1]
+                payload["replan_days"] = days
+            sends.append(Send("plan_weekly_workouts", payload))
+        return sends or "merge_weeks"
+
+    async def merge_weeks(self, state: ReplanState, config: RunnableConfig):
+        training_plan = state["training_plan"]
+        configurable = config.get("configurable", {})
+        run_id = configurable.get("thread_id")
+        output_path = configurable.get("output_path", "training_plan.json")
+
+        planned_weeks = state["planned_weeks"]
+        if run_id is not None and not any(planned_weeks):
+            self.deps.plan_writer.assemble(run_id, training_plan, output_path)
+            return {"training_plan": training_plan}
+
+        # Regenerated weeks fill their slots, the rest are kept
+        previous_weeks = state["previous_plan"].weekly_workouts
+        training_plan.weekly_workouts = [
+            week or previous_weeks[position]
+            for position, week in enumerate(planned_weeks)
+        ]
+        atomic_write(output_path, [training_plan.model_dump_json()])
+        return {"training_plan": training_plan}
@@ -1,23 +1,57 @@
-from typing import cast
+import contextlib
+import json
+import re
+import uuid
+from typing import Any, cast
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableConfig
 from langgraph.types import Send
-from models.dependencies import Dependencies
-from models.schema import TrainingPlan
-from models.states import TrainingPlanState
-from prompts import HIGH_LEVEL_PLAN_INSTRUCTIONS
+
+from coach.models.dependencies import Dependencies
+from coach.models.scheduler import CallPriority, call_priority
+from coach.models.schema import TrainingPlan
+from coach.models.states import (
+    PlanOutline,
+    TrainingPlanState,
+    WeeklyWorkoutInput,
+)
+from coach.prompts import (
+    HIGH_LEVEL_PLAN_ATHLETE,
+    HIGH_LEVEL_PLAN_INSTRUCTIONS,
+    cached_blocks,
+)
+from coach.storage.writer import atomic_write
+
+
+# The only plan fields the weekly branches read
+WEEKLY_PLANNING_FIELDS = (
+    "plan_duration_weeks",
+    "plan_description",
+    "progression_strategy",
+)
 
 
 class TrainingPlanNode:
-    def __init__(self, deps: Dependencies) -> None:
+    def __init__(self, deps: Dependencies, stream_plan: bool = False) -> None:
         self.deps = deps
+        # Stream the plan and return once the fields needed for weekly
+        # planning are final, instead of waiting for the full response
+        self.stream_plan = stream_plan
+        self.training_plan_llm = deps.structured_llm(
+            TrainingPlan, call_type=CallPriority.TRAINING_PLAN
+        )
+        self.training_plan_tool_llm = deps.llm_for(
+            CallPriority.TRAINING_PLAN
+        ).bind_tools(
+            [TrainingPlan], tool_choice="any"
+        )
 
     async def generate_high_level_training_plan(
         self,
         state: TrainingPlanState,
     ):
         # Input
-        claude_3_5_sonnet = self.deps.llm_client
         workouts_per_week = state["workouts_per_week"]
         training_goal = state["training_goal"]
         sports = state["sports"]
@@ -25,13 +59,16 @@ class TrainingPlanNode:
         available_time_per_session = state["available_time_per_session"]
         current_weekly_volume = state["current_weekly_volume"]
         programme_length = state["programme_length"]
-        injuries_or_limitations = state["injuries_or_limitations"]
+        # A None input is never written to its channel, so it's missing
+        # from the state of a run resumed from its first checkpoint
+        injuries_or_limitations = state.get("injuries_or_limitations")
 
         # Generate high level training plan
-        structured_llm = claude_3_5_sonnet.with_structured_output(TrainingPlan)
+        structured_llm = self.training_plan_llm
 
-        # Format system instructions
-        system_instructions = HIGH_LEVEL_PLAN_INSTRUCTIONS.format(
+        # Athlete details go after the cached instructions, so the prefix
+        # is shared by every plan in a batch
+        athlete_details = HIGH_LEVEL_PLAN_ATHLETE.format(
             goal=training_goal.value,
             sports=sports,
             experience=experience,
@@ -42,44 +79,158 @@ class TrainingPlanNode:
             programme_length=programme_length,
         )
 
+        messages = [
+            SystemMessage(content=cached_blocks(HIGH_LEVEL_PLAN_INSTRUCTIONS)),
+            HumanMessage(content=athlete_details),
+        ]
+
         # Generate high-level training plan
-        results = await structured_llm.ainvoke(
-            [SystemMessage(content=system_instructions)]
-            + [
-                HumanMessage(
-                    content="Generate a high level training plan that will help in organising the full schedule"
-                ),
-            ]
-        )
+        with call_priority(CallPriority.TRAINING_PLAN):
+            if self.stream_plan:
+                results = await self.stream_training_plan(messages)
+            else:
+                results = await structured_llm.ainvoke(messages)
 
         structured_results = cast(TrainingPlan, results)
 
-        return {"training_plan": structured_results}
+        # One empty slot per week for the weekly branches to fill
+        return {
+            "training_plan": structured_results,
+            "planned_weeks": [None] * programme_length,
+        }
+
+    async def stream_training_plan(
+        self, messages: list[BaseMessage]
+    ) -> TrainingPlan:
+        """Stream the plan's tool call, stopping once weekly fields are final"""
+        args_json = ""
+        # Returning early doesn't close an async generator, aclosing cancels
+        # the rest of the response as soon as the fields are final
+        async with contextlib.aclosing(
+            self.training_plan_tool_llm.astream(messages)
+        ) as stream:
+            async for chunk in stream:
+                for tool_chunk in chunk.tool_call_chunks:
+                    args_json += tool_chunk.get("args") or ""
+
+                fields = final_plan_fields(args_json)
+                if fields is not None:
+                    return TrainingPlan.model_validate(
+                        {**fields, "weekly_workouts": []}
+                    )
+
+        # No usable tool call in the stream, fall back to a regular call
+        return cast(TrainingPlan, await self.training_plan_llm.ainvoke(messages))
 
     def initiate_weekly_workout_planning(
-        self, state: TrainingPlanState
+        self, state: TrainingPlanState, config: RunnableConfig
     ) -> list:
+        plan_id = run_plan_id(config)
         return [
-            Send(
-                "plan_weekly_workouts",
-                {
-                    "week_index": i,
-                    "current_training_plan": state["training_plan"],
-                },
-            )
+            Send("plan_weekly_workouts", weekly_input(state, i, plan_id))
             for i in range(1, state["programme_length"] + 1)
         ]
 
-    async def save_to_json(self, state: TrainingPlanState):
+    async def save_to_json(
+        self, state: TrainingPlanState, config: RunnableConfig
+    ):
         # Input
         current_plan = state["training_plan"]
-        planned_workouts = state["planned_workouts"]
+        planned_weeks = [week for week in state["planned_weeks"] if week]
+        configurable = config.get("configurable", {})
+        run_id = configurable.get("thread_id")
+        output_path = configurable.get("output_path", "training_plan.json")
+
+        # Weeks were streamed to disk as they finished, stitch them together
+        if run_id is not None and not planned_weeks:
+            self.deps.plan_writer.assemble(run_id, current_plan, output_path)
+            return {"training_plan": current_plan}
 
-        current_plan.weekly_workouts = planned_workouts
+        current_plan.weekly_workouts = planned_weeks
 
         # Save training plan to JSON file
-        with open(r"training_plan.json", "w") as f:
-            json_data = current_plan.model_dump_json()
-            f.write(json_data)
+        atomic_write(output_path, [current_plan.model_dump_json()])
 
         return {"training_plan": current_plan}
+
+
+def run_plan_id(config: RunnableConfig) -> str:
+    """The run's thread id, or a fresh id for runs without a checkpointer"""
+    return config.get("configurable", {}).get("thread_id") or uuid.uuid4().hex
+
+
+def weekly_input(
+    state: TrainingPlanState, week_index: int, plan_id: str
+) -> WeeklyWorkoutInput:
+    """Payload sent to the weekly planning branch for one week.
+
+    Every branch gets its own copy, checkpointed with its task, so only the
+    plan outline goes in rather than the whole plan.
+    """
+    return {
+        "week_index": week_index,
+        "plan_outline": plan_outline(state["training_plan"]),
+        "sports": state["sports"],
+        "available_time_per_session": state["available_time_per_session"],
+        "workouts_per_week": state["workouts_per_week"],
+        "injuries_or_limitations": state.get("injuries_or_limitations"),
+        "training_goal": state["training_goal"],
+        "experience": state["experience"],
+        "current_weekly_volume": state["current_weekly_volume"],
+        "plan_id": plan_id,
+    }
+
+
+def plan_outline(training_plan: TrainingPlan) -> PlanOutline:
+    return cast(
+        PlanOutline,
+        {
+            field: getattr(training_plan, field)
+            for field in WEEKLY_PLANNING_FIELDS
+        },
+    )
+
+
+def final_plan_fields(args_json: str) -> dict[str, Any] | None:
+    """Weekly planning fields from partial tool-call JSON, once all are final
+
+    A value is final once the delimiter after it has arrived, so a number
+    or string still being streamed is never read early.
+    """
+    fields = settled_fields(args_json)
+    if not fields.keys() >= set(WEEKLY_PLANNING_FIELDS):
+        return None
+    return {field: fields[field] for field in WEEKLY_PLANNING_FIELDS}
+
+
+def settled_fields(args_json: str) -> dict[str, Any]:
+    """Top-level fields of a partial JSON object whose values are complete"""
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r"\s*")
+    fields: dict[str, Any] = {}
+
+    index = whitespace.match(args_json).end()
+    if not args_json.startswith("{", index):
+        return fields
+    index += 1
+
+    while True:
+        index = whitespace.match(args_json, index).end()
+        try:
+            key, index = decoder.raw_decode(args_json, index)
+            index = whitespace.match(args_json, index).end()
+            if not args_json.startswith(":", index):
+                return fields
+            index = whitespace.match(args_json, index + 1).end()
+            value, index = decoder.raw_decode(args_json, index)
+        except ValueError:
+            return fields
+
+        index = whitespace.match(args_json, index).end()
+        delimiter = args_json[index : index + 1]
+        if delimiter not in (",", "}"):
+            return fields
+        fields[key] = value
+        if delimiter == "}":
+            return fields
+        index += 1
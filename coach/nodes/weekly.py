@@ -1,120 +1,562 @@
 import asyncio
-from typing import cast
+import dataclasses
+import math
+from collections.abc import Awaitable
+from typing import TypeVar, cast
 
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.prompts import ChatPromptTemplate
-from models.dependencies import Dependencies
-from models.schema import WeeklyWorkout, Workout
-from models.states import WeeklyWorkoutState
-from prompts import HIGH_LEVEL_WEEKLY_PLAN_INSTRUCTIONS, PLAN_INDIVDUAL_WORKOUT
+from langchain_core.runnables import RunnableConfig
+from langgraph.types import StreamWriter
+
+from coach.models.dependencies import Dependencies
+from coach.models.easy_workouts import easy_effort, easy_sport, easy_workout
+from coach.models.repair import (
+    RepairStats,
+    UnrepairableOutput,
+    WorkoutConstraints,
+    assign_batch_days,
+    reconcile_easy_days,
+    reconcile_rest_days,
+    repair_json,
+    repair_workout,
+    violates_constraints,
+)
+from coach.models.scheduler import CallPriority, call_priority
+from coach.models.schema import WeeklyWorkout, Workout, WorkoutBatch
+from coach.models.states import PlanOutline, WeeklyWorkoutState
+from coach.prompts import (
+    HIGH_LEVEL_WEEKLY_PLAN_INSTRUCTIONS,
+    HIGH_LEVEL_WEEKLY_PLAN_WEEK,
+    PLAN_CONTEXT,
+    PLAN_INDIVDUAL_WORKOUT,
+    PLAN_WORKOUT_BATCH,
+    WORKOUT_BATCH_WEEK,
+    WORKOUT_WEEK,
+    cached_blocks,
+)
+from coach.storage.reader import training_days
+from coach.storage.templates import TemplateFeatures
+
+T = TypeVar("T")
+
+WORKOUT_QUERY = "Generate an individual workout that fits with the overall training plan and placement within this training week."
 
 
 class WeeklyWorkoutNode:
-    def __init__(self, deps: Dependencies) -> None:
+    def __init__(
+        self,
+        deps: Dependencies,
+        workout_batches: int | None = None,
+        max_regenerations: int = 2,
+        rule_based_easy_days: bool = False,
+    ) -> None:
         self.deps = deps
+        # Number of structured calls used to generate a week's workouts,
+        # None makes one call per training day
+        self.workout_batches = workout_batches
+        # Extra calls allowed per workout when local repair can't save it
+        self.max_regenerations = max_regenerations
+        # Opt in to building the outline's easy days from rules, so the
+        # model only writes key sessions
+        self.rule_based_easy_days = rule_based_easy_days
+
+        # Runnables, parsers and static prompt parts never change between
+        # calls, so build them once per node
+        self.weekly_plan_llm = deps.structured_llm(
+            WeeklyWorkout, call_type=CallPriority.WEEKLY_PLAN
+        )
+        self.workout_batch_llm = deps.structured_llm(
+            WorkoutBatch, include_raw=True, call_type=CallPriority.WORKOUT
+        )
+        self.workout_parser = PydanticOutputParser(pydantic_object=Workout)
+        self.workout_prompt = ChatPromptTemplate.from_messages(
+            [
+                (
+                    "system",
+                    cached_blocks(PLAN_INDIVDUAL_WORKOUT, "{plan_context}"),
+                ),
+                ("human", WORKOUT_WEEK),
+            ]
+        ).partial(
+            format_instructions=self.workout_parser.get_format_instructions()
+        )
+        # Parsed outside the chain so a failed parse can be repaired
+        # locally instead of rerunning the call
+        self.workout_chain = self.workout_prompt | deps.llm_for(
+            CallPriority.WORKOUT
+        )
+        # Regenerations go to the stronger tier when workouts are routed
+        # to one that escalates
+        self.escalated_workout_chain = self.workout_prompt | deps.llm_for(
+            CallPriority.WORKOUT, escalated=True
+        )
 
     async def generate_high_level_weekly_plan(self, state: WeeklyWorkoutState):
+        existing_week = state.get("existing_week")
+        if existing_week is not None:
+            week = await self.replan_week_days(
+                state, existing_week, state.get("replan_days") or []
+            )
+            return {"planned_weeks": {state["week_index"]: week}}
+
         # Input
-        claude_3_5_sonnet = self.deps.llm_client
-        current_training_plan = state["current_training_plan"]
+        outline = state["plan_outline"]
         week_index = state["week_index"]
+        constraints = workout_constraints(state)
+
+        # A close enough week from an earlier plan needs no model calls
+        features = self.template_features(state)
+        if features is not None:
+            week = self.deps.templates.find_week(
+                features, constraints, state.get("plan_id")
+            )
+            if week is not None:
+                return {"planned_weeks": {week_index: week}}
 
         # Generate high level weekly level training plan
-        structured_llm = claude_3_5_sonnet.with_structured_output(WeeklyWorkout)
+        structured_llm = self.weekly_plan_llm
 
-        # Format system instructions
-        system_instructions = HIGH_LEVEL_WEEKLY_PLAN_INSTRUCTIONS.format(
-            week_index=week_index,
-            plan_duration_weeks=current_training_plan.plan_duration_weeks,
-            plan_description=current_training_plan.plan_description,
-            progression_strategy=current_training_plan.progression_strategy,
+        # Only the week index differs between the plan's weekly calls
+        system_instructions = cached_blocks(
+            HIGH_LEVEL_WEEKLY_PLAN_INSTRUCTIONS,
+            plan_context(outline, constraints),
         )
 
         # Generate high-level training plan
-        results = await structured_llm.ainvoke(
-            [SystemMessage(content=system_instructions)]
-            + [
-                HumanMessage(
-                    content="Generate a high level weekly training plan that will help in organising the individual workouts"
-                ),
-            ]
-        )
+        with call_priority(CallPriority.WEEKLY_PLAN):
+            results = await structured_llm.ainvoke(
+                [
+                    SystemMessage(content=system_instructions),
+                    HumanMessage(
+                        content=HIGH_LEVEL_WEEKLY_PLAN_WEEK.format(
+                            week_index=week_index
+                        )
+                    ),
+                ]
+            )
         structured_results = cast(WeeklyWorkout, results)
 
-        # Create list of coroutines for non-rest days
-        workout_coroutines = [
-            self.generate_individual_workout(state, structured_results)
-            for i in range(1, 8)
-            if i not in structured_results.rest_days
+        rest_days = reconcile_rest_days(
+            structured_results.rest_days, state.get("workouts_per_week")
+        )
+        easy_days = reconcile_easy_days(
+            structured_results.easy_days, rest_days
+        )
+        fixes = []
+        if rest_days != structured_results.rest_days:
+            fixes.append("rest_days_reconciled")
+        if easy_days != structured_results.easy_days:
+            fixes.append("easy_days_reconciled")
+        self.deps.repair_stats.record(fixes)
+        structured_results.rest_days = rest_days
+        structured_results.easy_days = easy_days
+
+        workout_days = [
+            i for i in range(1, 8) if i not in structured_results.rest_days
         ]
 
-        # Run all workout generations concurrently
-        workouts = await asyncio.gather(*workout_coroutines)
-        structured_results.workouts = workouts
+        structured_results.workouts = await self.generate_workouts(
+            state, structured_results, workout_days
+        )
+        if features is not None:
+            self.deps.templates.add("week", features, structured_results)
+
+        return {"planned_weeks": {week_index: structured_results}}
+
+    async def replan_week_days(
+        self,
+        state: WeeklyWorkoutState,
+        existing_week: WeeklyWorkout,
+        days: list[int],
+    ) -> WeeklyWorkout:
+        """Regenerate the workouts on `days`, keeping the rest of the week"""
+        week = existing_week.model_copy()
+        workouts_by_day = dict(
+            zip(training_days(week.rest_days), existing_week.workouts)
+        )
+        days = [day for day in days if day in workouts_by_day]
+        workouts_by_day.update(
+            zip(days, await self.generate_workouts(state, week, days))
+        )
+        week.workouts = list(workouts_by_day.values())
+        return week
+
+    async def generate_workouts(
+        self,
+        state: WeeklyWorkoutState,
+        weekly_workout: WeeklyWorkout,
+        workout_days: list[int],
+    ) -> list[Workout]:
+        rule_based = self.rule_based_workouts(
+            state, weekly_workout, workout_days
+        )
+        key_days = [day for day in workout_days if day not in rule_based]
+
+        features = self.template_features(state)
+        reused: list[Workout] = []
+        if features is not None:
+            reused = self.deps.templates.find_workouts(
+                features, workout_constraints(state), len(key_days)
+            )
+        generated_days = key_days[len(reused) :]
+
+        if self.workout_batches:
+            generated = await self.generate_batched_workouts(
+                state, weekly_workout, generated_days
+            )
+        else:
+            # Create list of coroutines for non-rest days
+            workout_coroutines = [
+                self.generate_individual_workout(state, weekly_workout, day)
+                for day in generated_days
+            ]
 
-        structured_results.workouts = workouts
+            # Run all workout generations concurrently
+            generated = await gather_or_cancel(*workout_coroutines)
 
-        return {"planned_workouts": [structured_results]}
+        if features is not None:
+            for workout in generated:
+                self.deps.templates.add("workout", features, workout)
+        workouts_by_day = dict(zip(key_days, reused + generated))
+        workouts_by_day.update(rule_based)
+        return [workouts_by_day[day] for day in workout_days]
+
+    def rule_based_workouts(
+        self,
+        state: WeeklyWorkoutState,
+        weekly_workout: WeeklyWorkout,
+        workout_days: list[int],
+    ) -> dict[int, Workout]:
+        """Workouts for the outline's easy days among `workout_days`"""
+        # Free-text limitations might rule out a sport or an easy session
+        # as the rules would build it, so those athletes get model workouts
+        if not self.rule_based_easy_days or state.get(
+            "injuries_or_limitations"
+        ):
+            return {}
+        week_index = state["week_index"]
+        days = training_days(weekly_workout.rest_days)
+        easy_days = [
+            day for day in workout_days if day in weekly_workout.easy_days
+        ]
+        return {
+            day: easy_workout(
+                sport=easy_sport(
+                    state.get("sports") or (), week_index, position
+                ),
+                effort=easy_effort(day, days, weekly_workout.easy_days),
+                experience=state.get("experience"),
+                available_minutes=state.get("available_time_per_session"),
+                week_index=week_index,
+                plan_weeks=state["plan_outline"]["plan_duration_weeks"],
+            )
+            for position, day in enumerate(easy_days)
+        }
+
+    def template_features(
+        self, state: WeeklyWorkoutState
+    ) -> TemplateFeatures | None:
+        """Features to match templates by, None when reuse is off or unsafe"""
+        if self.deps.templates is None:
+            return None
+        # Free-text limitations can't be matched, so those athletes always
+        # get generated workouts and don't seed the library
+        if state.get("injuries_or_limitations"):
+            return None
+        profile = (
+            state.get("training_goal"),
+            state.get("experience"),
+            state.get("current_weekly_volume"),
+            state.get("workouts_per_week"),
+        )
+        if None in profile or not state.get("sports"):
+            return None
+        goal, experience, weekly_volume, workouts_per_week = profile
+        return TemplateFeatures(
+            goal=goal,
+            sports=state["sports"],
+            experience=experience,
+            week_index=state["week_index"],
+            plan_weeks=state["plan_outline"]["plan_duration_weeks"],
+            weekly_volume=weekly_volume,
+            workouts_per_week=workouts_per_week,
+        )
+
+    async def persist_week(
+        self,
+        state: WeeklyWorkoutState,
+        config: RunnableConfig,
+        writer: StreamWriter,
+    ):
+        # Announced on the graph's "custom" stream, so callers streaming
+        # the run see each week as soon as its branch finishes
+        for week_index, weekly_workout in state["planned_weeks"].items():
+            writer(
+                {
+                    "week_index": week_index,
+                    "week": weekly_workout.model_dump(mode="json"),
+                }
+            )
+
+        run_id = config.get("configurable", {}).get("thread_id")
+        if run_id is None:
+            # No run to stream into, keep the week in graph state
+            return {}
+
+        for week_index, weekly_workout in state["planned_weeks"].items():
+            self.deps.plan_writer.write_week(run_id, week_index, weekly_workout)
+
+        # The week is on disk, leave its slot in the parent state empty
+        return {"planned_weeks": {}}
 
     async def generate_individual_workout(
         self,
         state: WeeklyWorkoutState,
         weekly_workout: WeeklyWorkout,
+        day: int,
     ) -> Workout:
         # Input
-        claude_3_5_sonnet = self.deps.llm_client
-        current_training_plan = state["current_training_plan"]
+        outline = state["plan_outline"]
         week_index = state["week_index"]
         weekly_workout_description = weekly_workout.weekly_workout_description
         weekly_focus = weekly_workout.weekly_focus
         total_weekly_volume = weekly_workout.total_weekly_volume
 
-        # Generate high level weekly level training plan
-        # # Set up a parser + inject instructions into the prompt template.
-        parser = PydanticOutputParser(pydantic_object=Workout)
-        # structured_llm = claude_3_5_sonnet.with_structured_output(Workout)
+        constraints = workout_constraints(state)
+        query = WORKOUT_QUERY
 
-        # Format system instructions
-        system_instructions = PLAN_INDIVDUAL_WORKOUT.format(
-            week_index=week_index,
-            weekly_workout_description=weekly_workout_description,
-            weekly_focus=weekly_focus,
-            plan_description=current_training_plan.plan_description,
-            progression_strategy=current_training_plan.progression_strategy,
-            total_weekly_volume=total_weekly_volume,
-            format_instructions=parser.get_format_instructions(),
-        )
-
-        # prompt_template = PromptTemplate(
-        #     template=PLAN_INDIVDUAL_WORKOUT,
-        #     input_variables=[
-        #         "week_index"
-        #         "weekly_workout_description"
-        #         "weekly_focus"
-        #         "plan_description"
-        #         "progression_strategy"
-        #         "total_weekly_volume"
-        #     ],
-        #     partial_variables={
-        #         "format_instructions": parser.get_format_instructions()
-        #     },
-        # )
-
-        prompt = ChatPromptTemplate.from_messages(
-            [SystemMessage(content=system_instructions)]
-            + [
-                HumanMessage(content="{query}"),
+        for attempt in range(self.max_regenerations + 1):
+            # The last attempt keeps an off-plan sport rather than failing
+            # the whole week
+            attempt_constraints = (
+                constraints
+                if attempt < self.max_regenerations
+                else dataclasses.replace(constraints, sports=())
+            )
+            workout_chain = self.workout_chain
+            if attempt and self.deps.escalates(CallPriority.WORKOUT):
+                self.deps.record_escalation(CallPriority.WORKOUT)
+                workout_chain = self.escalated_workout_chain
+            # Generate workout details
+            with call_priority(CallPriority.WORKOUT):
+                message = await workout_chain.ainvoke(
+                    {
+                        "plan_context": plan_context(outline, constraints),
+                        "week_index": week_index,
+                        "weekly_workout_description": weekly_workout_description,
+                        "weekly_focus": weekly_focus,
+                        "total_weekly_volume": total_weekly_volume,
+                        # Without the day every workout of the week has
+                        # the same prompt, and the same cached response
+                        "rest_days": weekly_workout.rest_days,
+                        "day": day,
+                        "query": query,
+                    }
+                )
+
+            try:
+                workout, fixes = await self.parse_workout(
+                    cast(AIMessage, message), attempt_constraints
+                )
+            except UnrepairableOutput as error:
+                if attempt == self.max_regenerations:
+                    raise
+                self.deps.repair_stats.regenerated += 1
+                # Saying what was wrong also changes the prompt, so the
+                # response cache can't replay the same output
+                query = (
+                    f"{WORKOUT_QUERY}\n\nThe previous workout could not be "
+                    f"used: {error}. Generate a corrected workout."
+                )
+                continue
+
+            self.deps.repair_stats.record(fixes)
+            return workout
+
+    async def parse_workout(
+        self, message: AIMessage, constraints: WorkoutConstraints
+    ) -> tuple[Workout, list[str]]:
+        """Parse a workout response, repairing it locally where possible"""
+        try:
+            workout = await self.workout_parser.ainvoke(message)
+        except OutputParserException:
+            return repair_workout(
+                repair_json(message_text(message)), constraints
+            )
+
+        if not violates_constraints(workout, constraints):
+            return workout, []
+        return repair_workout(workout.model_dump(mode="json"), constraints)
+
+    async def generate_batched_workouts(
+        self,
+        state: WeeklyWorkoutState,
+        weekly_workout: WeeklyWorkout,
+        workout_days: list[int],
+    ) -> list[Workout]:
+        if not workout_days:
+            return []
+
+        # Split the training days into contiguous chunks, one call each
+        chunk_size = math.ceil(len(workout_days) / self.workout_batches)
+        chunks = [
+            workout_days[i : i + chunk_size]
+            for i in range(0, len(workout_days), chunk_size)
+        ]
+        batches = await gather_or_cancel(
+            *[
+                self.generate_workout_batch(state, weekly_workout, days)
+                for days in chunks
             ]
         )
+        workouts_by_day = {
+            day: workout for batch in batches for day, workout in batch.items()
+        }
 
-        # Generate workout details
-        chain = prompt | claude_3_5_sonnet | parser
-        results = await chain.ainvoke(
-            {
-                "query": "Generate an individual workout that fits with the overall training plan and placement within this training week."
-            }
+        # Only days missing from the batch output or failing repair fall
+        # back to an individual call
+        missing_days = [
+            day for day in workout_days if day not in workouts_by_day
+        ]
+        self.deps.repair_stats.regenerated += len(missing_days)
+        fallbacks = await gather_or_cancel(
+            *[
+                self.generate_individual_workout(state, weekly_workout, day)
+                for day in missing_days
+            ]
         )
-        structured_results = cast(Workout, results)
+        workouts_by_day.update(zip(missing_days, fallbacks))
+
+        return [workouts_by_day[day] for day in workout_days]
+
+    async def generate_workout_batch(
+        self,
+        state: WeeklyWorkoutState,
+        weekly_workout: WeeklyWorkout,
+        days: list[int],
+    ) -> dict[int, Workout]:
+        # Input
+        outline = state["plan_outline"]
+        week_index = state["week_index"]
+        constraints = workout_constraints(state)
+
+        # Keeps the raw tool call so valid days survive an invalid sibling
+        structured_llm = self.workout_batch_llm
+
+        # The week and its days go after the cached plan prefix
+        system_instructions = cached_blocks(
+            PLAN_WORKOUT_BATCH,
+            plan_context(outline, constraints),
+        )
+        week_details = WORKOUT_BATCH_WEEK.format(
+            week_index=week_index,
+            weekly_workout_description=weekly_workout.weekly_workout_description,
+            weekly_focus=weekly_workout.weekly_focus,
+            total_weekly_volume=weekly_workout.total_weekly_volume,
+            rest_days=weekly_workout.rest_days,
+            workout_days=days,
+        )
+
+        # Generate workouts for all requested days
+        with call_priority(CallPriority.WORKOUT):
+            results = await structured_llm.ainvoke(
+                [
+                    SystemMessage(content=system_instructions),
+                    HumanMessage(content=week_details),
+                ]
+            )
+
+        return validated_batch_workouts(
+            cast(AIMessage, results["raw"]),
+            days,
+            constraints,
+            self.deps.repair_stats,
+        )
+
+
+async def gather_or_cancel(*awaitables: Awaitable[T]) -> list[T]:
+    """`asyncio.gather` that cancels the other awaitables when one fails
+
+    A plain gather leaves the siblings of a failed workout running, still
+    holding scheduler slots and rate budget for a week that has already
+    failed.
+    """
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    try:
+        return await asyncio.gather(*tasks)
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        # Let the cancelled calls release their slots before the error
+        # reaches the graph
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def workout_constraints(state: WeeklyWorkoutState) -> WorkoutConstraints:
+    return WorkoutConstraints(
+        sports=state.get("sports") or (),
+        available_time_per_session=state.get("available_time_per_session"),
+        injuries_or_limitations=state.get("injuries_or_limitations"),
+    )
+
+
+def plan_context(outline: PlanOutline, constraints: WorkoutConstraints) -> str:
+    """Cached prompt block shared by every weekly and workout call of a plan"""
+    return PLAN_CONTEXT.format(**outline, **constraints.prompt_values())
+
+
+def message_text(message: AIMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        block if isinstance(block, str) else block.get("text", "")
+        for block in message.content
+    )
+
+
+def batch_items(message: AIMessage) -> list:
+    """Workout items of a WorkoutBatch tool call, fixing up broken JSON"""
+    if message.tool_calls:
+        args = message.tool_calls[0]["args"]
+    elif message.invalid_tool_calls:
+        try:
+            args = repair_json(message.invalid_tool_calls[0]["args"] or "")
+        except UnrepairableOutput:
+            return []
+    else:
+        return []
+    items = args.get("workouts") if isinstance(args, dict) else args
+    return items if isinstance(items, list) else []
+
+
+def validated_batch_workouts(
+    message: AIMessage,
+    days: list[int],
+    constraints: WorkoutConstraints,
+    stats: RepairStats,
+) -> dict[int, Workout]:
+    """Repair each day of a raw WorkoutBatch tool call independently
+
+    Workouts tagged with a rest day or a day already taken are moved to a
+    requested day that is still missing one rather than thrown away.
+    """
+    repaired = []
+    for item in batch_items(message):
+        if not isinstance(item, dict):
+            continue
+        try:
+            workout, fixes = repair_workout(item.get("workout"), constraints)
+        except UnrepairableOutput:
+            continue
+        repaired.append((item.get("day"), (workout, fixes)))
 
-        return structured_results
+    assigned, moved_days = assign_batch_days(repaired, days)
+    workouts: dict[int, Workout] = {}
+    for day, (workout, fixes) in assigned.items():
+        stats.record(fixes + ["day_reassigned"] if day in moved_days else fixes)
+        workouts[day] = workout
+    return workouts
@@ -0,0 +1,255 @@
+"""Validate, enrich and export generated training plans on every core.
+
+Pydantic validation of the nested workout trees, load computation and JSON
+dumping are CPU bound, so they run in a process pool rather than on the
+event loop. Plans are handed over in chunks: the loop reads a chunk's
+files straight into one shared memory block (on a thread) and workers
+parse from it in place, so serialised plans are never pickled through the
+pool's pipes. Workers write the exports themselves and only send back a
+small result per plan.
+
+    python -m coach.postprocess plans/ --export-dir exports/
+
+Each export holds the validated plan and its weekly training load:
+
+    {"plan": {...}, "load": {"weekly_load": [...], "total_load": 2310.5,
+     "peak_ramp_rate": 0.12, "weeks_outside_acwr": 0, ...}}
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.shared_memory import SharedMemory
+from pathlib import Path
+from typing import Any
+
+from pydantic import ValidationError
+
+from coach.analytics.load import analyse_plans
+from coach.models.schema import TrainingPlan
+from coach.storage.writer import atomic_write
+
+# (plan name, offset, length) of one serialised plan in a chunk's block
+ChunkEntry = tuple[str, int, int]
+
+
+@dataclass
+class ExportResult:
+    name: str
+    output_path: Path | None
+    weeks: int = 0
+    total_load: float = 0.0
+    error: str | None = None
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+def _number(value: float) -> float | None:
+    # NaN marks a metric that doesn't apply, e.g. week 1's ramp rate
+    return None if math.isnan(value) else round(float(value), 3)
+
+
+def plan_enrichment(plans: list[TrainingPlan]) -> list[dict[str, Any]]:
+    """Training load block of each plan's export, computed for the chunk"""
+    load = analyse_plans(plans)
+    summary = load.summary()
+    enrichment = []
+    for position, plan in enumerate(plans):
+        weeks = len(plan.weekly_workouts)
+        enrichment.append(
+            {
+                "weekly_load": [
+                    _number(value) for value in load.load[position, :weeks]
+                ],
+                "weekly_minutes": [
+                    _number(value)
+                    for value in load.minutes[position, :weeks]
+                ],
+                "ramp_rate": [
+                    _number(value)
+                    for value in load.ramp_rate[position, :weeks]
+                ],
+                "acute_chronic": [
+                    _number(value)
+                    for value in load.acute_chronic[position, :weeks]
+                ],
+                **{
+                    key: _number(values[position])
+                    for key, values in summary.items()
+                },
+            }
+        )
+    return enrichment
+
+
+def available_cores() -> int:
+    """Cores this process may run on, which respects container CPU sets"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:  # macOS and Windows
+        return os.cpu_count() or 1
+
+
+def export_chunk(
+    shm_name: str, entries: Sequence[ChunkEntry], export_dir: str
+) -> list[ExportResult]:
+    """Worker side: validate, enrich and write one chunk of plans"""
+    shm = SharedMemory(name=shm_name)
+    try:
+        names, plans, results = [], [], []
+        for name, offset, length in entries:
+            try:
+                # Pydantic only parses bytes, the one copy a plan gets
+                plan = TrainingPlan.model_validate_json(
+                    bytes(shm.buf[offset : offset + length])
+                )
+            except ValidationError as error:
+                results.append(
+                    ExportResult(
+                        name=name, output_path=None, error=str(error)
+                    )
+                )
+                continue
+            names.append(name)
+            plans.append(plan)
+    finally:
+        shm.close()
+
+    if not plans:
+        return results
+    for name, plan, load in zip(names, plans, plan_enrichment(plans)):
+        output_path = atomic_write(
+            Path(export_dir) / f"{name}.json",
+            [
+                '{"plan":',
+                plan.model_dump_json(),
+                ',"load":',
+                json.dumps(load),
+                "}",
+            ],
+        )
+        results.append(
+            ExportResult(
+                name=name,
+                output_path=output_path,
+                weeks=len(plan.weekly_workouts),
+                total_load=load["total_load"] or 0.0,
+            )
+        )
+    return results
+
+
+def stage_chunk(
+    paths: Sequence[Path],
+) -> tuple[SharedMemory, list[ChunkEntry]]:
+    """Read plan files into a new shared memory block, without a copy"""
+    sizes = [path.stat().st_size for path in paths]
+    shm = SharedMemory(create=True, size=max(sum(sizes), 1))
+    entries = []
+    offset = 0
+    try:
+        for path, size in zip(paths, sizes):
+            view = shm.buf[offset : offset + size]
+            try:
+                with open(path, "rb") as f:
+                    f.readinto(view)
+            finally:
+                view.release()
+            entries.append((path.stem, offset, size))
+            offset += size
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, entries
+
+
+async def postprocess_plans(
+    paths: Sequence[str | Path],
+    export_dir: str | Path,
+    workers: int | None = None,
+    chunk_size: int = 64,
+) -> list[ExportResult]:
+    """Export `paths` on `workers` processes, one per core by default"""
+    paths = [Path(path) for path in paths]
+    export_dir = Path(export_dir)
+    export_dir.mkdir(parents=True, exist_ok=True)
+    workers = workers or available_cores()
+    chunks = [
+        paths[i : i + chunk_size] for i in range(0, len(paths), chunk_size)
+    ]
+    loop = asyncio.get_running_loop()
+    # A staged chunk holds its shared memory until a worker is done with
+    # it, so only keep enough staged to have the next one ready per worker
+    staged = asyncio.Semaphore(workers * 2)
+
+    async def run_chunk(
+        pool: ProcessPoolExecutor, chunk: list[Path]
+    ) -> list[ExportResult]:
+        async with staged:
+            shm, entries = await asyncio.to_thread(stage_chunk, chunk)
+            try:
+                return await loop.run_in_executor(
+                    pool, export_chunk, shm.name, entries, str(export_dir)
+                )
+            finally:
+                shm.close()
+                shm.unlink()
+
+    # Spawned, not forked: the parent has an event loop and SQLite threads
+    # running that a forked child would inherit mid-flight
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        batches = await asyncio.gather(
+            *[run_chunk(pool, chunk) for chunk in chunks]
+        )
+    return [result for batch in batches for result in batch]
+
+
+def print_export_summary(
+    results: list[ExportResult], wall_seconds: float
+) -> None:
+    succeeded = [r for r in results if r.succeeded]
+    print(f"Exports: {len(succeeded)}/{len(results)} plans")
+    print(f"Export time: {wall_seconds:.1f}s")
+    if wall_seconds > 0:
+        print(
+            f"Export throughput: {len(results) / wall_seconds:.0f} plans/s"
+        )
+    for result in results:
+        if not result.succeeded:
+            print(f"INVALID {result.name}: {result.error.splitlines()[0]}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    plan_dir = Path(args.plan_dir)
+    paths = sorted(plan_dir.glob("*.json"))
+    start = time.perf_counter()
+    results = await postprocess_plans(
+        paths,
+        args.export_dir,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+    )
+    print_export_summary(results, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("plan_dir", help="Directory of training plan JSON")
+    parser.add_argument("--export-dir", default="exports")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="Defaults to all cores"
+    )
+    parser.add_argument("--chunk-size", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
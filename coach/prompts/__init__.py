@@ -1,9 +1,35 @@
+# Prompts are split into a shared prefix, sent as system blocks marked for
+# provider prompt caching, and a small per-call suffix sent as the human
+# message. Nothing that changes between calls of one kind (week index,
+# week outline, days) may appear in a prefix block, or every call after
+# it misses the cache.
+from typing import Any
+
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def cached_blocks(*texts: str) -> list[dict[str, Any]]:
+    """System content with a prompt cache breakpoint after each block"""
+    return [
+        {"type": "text", "text": text, "cache_control": CACHE_CONTROL}
+        for text in texts
+    ]
+
+
 # Prompt generating the high level training plan
 HIGH_LEVEL_PLAN_INSTRUCTIONS = """You are an expert athletic coach, helping to plan an athletes training.
 
-Your goal is to generate the outline of the training plan.
+Your goal is to generate the outline of the training plan from the athlete's details, which follow.
+
+The plan should have the following fields:
+
+- Plan Description - Overall description of the training plan's objectives and progression.
+- Progression Strategy - Description of how intensity and volume progress throughout the plan.
+- Plan Duration Weeks - Total number of weeks in the training plan.
+- Weekly Workouts - Collection of weekly workout plans forming a training plan, which you will leave blank for now.
+"""
 
-You should reflect on this information to organise the training plan:
+HIGH_LEVEL_PLAN_ATHLETE = """You should reflect on this information to organise the training plan:
 
 - Training Goal: {goal}
 - Sports: {sports}
@@ -15,57 +41,90 @@ You should reflect on this information to organise the training plan:
 
 The training plan should be {programme_length} weeks long.
 
-Now, generate the high level plan. The plan should have the following fields:
+Now, generate the high level plan."""
 
-- Plan Description - Overall description of the training plan's objectives and progression.
-- Progression Strategy - Description of how intensity and volume progress throughout the plan.
-- Plan Duration Weeks - Total number of weeks in the training plan.
-- Weekly Workouts - Collection of weekly workout plans forming a training plan, which you will leave blank for now.
+# Shared by every weekly outline and workout call of one plan
+PLAN_CONTEXT = """The overall training plan:
+- Plan Duration Weeks: {plan_duration_weeks}
+- Overal Plan Description: {plan_description}
+- Overall Plan Progression Strategy: {progression_strategy}
+- Sports: {sports}
+- Available Time per Session: {available_time_per_session}
+- Injuries or Limitations: {injuries_or_limitations}
 """
 
 HIGH_LEVEL_WEEKLY_PLAN_INSTRUCTIONS = """You are an expert athletic coach, helping to plan an athletes training.
 
-Your goal is to generate the outline of a weekly plan for the athlete.
-
-You should reflect on this information to organise the weekly plan:
-- Week Index: {week_index}
-- Plan Duration Weeks: {plan_duration_weeks}
-- Overal Plan Description: {plan_description}
-- Overall Plan Progression Strategy: {progression_strategy}
+Your goal is to generate the outline of a weekly plan for the athlete, reflecting on the overall training plan below and the week's place in it.
 
-Now, generate the high level weekly training plan. The plan should have the following fields:
+The weekly plan should have the following fields:
 
     - Workout Week Name - Name/identifier for this training week (e.g., 'Base Week 1', 'Peak Week')
     - Workout Week Description - Detailed description of the week's training focus and objectives
     - Weekly Focus - Primary training focus for this week
     - Total Weekly Volume - Total training volume for the week
     - Rest Days - List of rest days (1-7) in this week
+    - Easy Days - Training days (1-7) for easy aerobic or recovery sessions, leaving the remaining training days for key sessions
     - Workouts - Collection of structured workouts forming a single week of a training plan, which you will leave blank for now.
 """
 
+HIGH_LEVEL_WEEKLY_PLAN_WEEK = """- Week Index: {week_index}
+
+Generate a high level weekly training plan that will help in organising the individual workouts"""
+
 PLAN_INDIVDUAL_WORKOUT = """You are an expert athletic coach, helping to plan an athletes training.
 
 Your goal is to generate an individual workout that will form part of the athletes weekly plan.
-It should be aligned to the overall training plan's objectives and progression strategy, and must be relevant to the indivdual training week focus.
+It should be aligned to the overall training plan's objectives and progression strategy below, and must be relevant to the indivdual training week focus given with the request.
+
+The workout should have the following fields:
+    - Name - Descriptive name for the workout session
+    - Workout Goal - Training objectives that determine workout focus and structure
+    - Sport - Which sport this workout is for
+    - Warmup - Initial low-intensity segment to prepare for main workout
+    - Intervals - List of work intervals and/or technique drills forming the main workout, which you will leave blank for now.
+    - Cooldown - Final low-intensity segment to gradually reduce effort and recover
+    - Total Distance - (optional) - Total workout distance including warmup and cooldown
+    - Estimated Duration - (optional) - Estimated total workout duration
+    - Intensity Focus - (optional) - Primary intensity focus (e.g., 'Endurance', 'Threshold', 'VO2max')
+
+You must always return valid JSON fenced by a markdown code block. Do not return any additional text. Wrap the output in `json` tags\n{format_instructions}
+"""
 
-You should reflect on this information to organise the workout:
+WORKOUT_WEEK = """The training week:
     - Week Index: {week_index}
     - Training Week Description: {weekly_workout_description}
     - Training Week Focus: {weekly_focus}
-    - Overall Plan Description: {plan_description}
-    - Overall Plan Progression Strategy: {progression_strategy}
     - Total Weekly Volume: {total_weekly_volume}
+    - Rest Days: {rest_days}
+    - Workout Day: {day}
+
+{query}"""
+
+PLAN_WORKOUT_BATCH = """You are an expert athletic coach, helping to plan an athletes training.
+
+Your goal is to generate the individual workouts for several days of the athletes weekly plan in one go.
+Each workout should be aligned to the overall training plan's objectives and progression strategy below, and must be relevant to the indivdual training week focus given with the request.
+Together the workouts should form a coherent, well balanced week.
 
-Now, generate an individual workout plan. The plan should have the following fields:
+Generate exactly one workout for each of the requested workout days, tagged with its day. Each workout should have the following fields:
     - Name - Descriptive name for the workout session
     - Workout Goal - Training objectives that determine workout focus and structure
     - Sport - Which sport this workout is for
     - Warmup - Initial low-intensity segment to prepare for main workout
-    - Intervals - List of work intervals and/or technique drills forming the main workout, which you will leave blank for now.
+    - Intervals - List of work intervals and/or technique drills forming the main workout
     - Cooldown - Final low-intensity segment to gradually reduce effort and recover
     - Total Distance - (optional) - Total workout distance including warmup and cooldown
     - Estimated Duration - (optional) - Estimated total workout duration
     - Intensity Focus - (optional) - Primary intensity focus (e.g., 'Endurance', 'Threshold', 'VO2max')
-
-You must always return valid JSON fenced by a markdown code block. Do not return any additional text. Wrap the output in `json` tags\n{format_instructions}
 """
+
+WORKOUT_BATCH_WEEK = """The training week:
+    - Week Index: {week_index}
+    - Training Week Description: {weekly_workout_description}
+    - Training Week Focus: {weekly_focus}
+    - Total Weekly Volume: {total_weekly_volume}
+    - Rest Days: {rest_days}
+    - Workout Days: {workout_days}
+
+Generate one workout for each of the workout days that fits with the overall training plan and this training week."""
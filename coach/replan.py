@@ -0,0 +1,177 @@
+"""Re-plan an existing training plan after an athlete's input changes.
+
+Only the weeks and days the change invalidates go back to the model,
+everything else is carried over from the previous plan unchanged.
+
+    python -m coach.replan training_plan.json --input athlete.json \
+        --change '{"injuries_or_limitations": ["Sore knee"]}' --from-week 5
+
+`athlete.json` is the `TrainingPlanInput` the plan was generated from, in
+the same format as a line of the batch runner's input file. `--change`
+holds just the fields that changed.
+"""
+
+import argparse
+import asyncio
+import json
+import uuid
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+
+from dotenv import load_dotenv
+from langgraph.graph import END, START, StateGraph
+
+from coach.batch import training_plan_input_adapter
+from coach.main import build_weekly_workout_graph
+from coach.models.dependencies import Dependencies
+from coach.models.schema import TrainingPlan
+from coach.models.states import ReplanInput, ReplanState, TrainingPlanInput
+from coach.nodes.replan import ReplanNode, ReplanScope, replan_scope
+
+
+def build_replan_graph(
+    deps: Dependencies, weekly_graph: StateGraph
+) -> StateGraph:
+    replan_node = ReplanNode(deps=deps)
+
+    replan_builder = StateGraph(ReplanState, input=ReplanInput)
+
+    replan_builder.add_node("prepare_replan", replan_node.prepare_replan)
+    replan_builder.add_node("plan_weekly_workouts", weekly_graph.compile())
+    replan_builder.add_node("merge_weeks", replan_node.merge_weeks)
+
+    replan_builder.add_edge(START, "prepare_replan")
+    replan_builder.add_conditional_edges(
+        "prepare_replan",
+        replan_node.initiate_replanning,
+        ["plan_weekly_workouts", "merge_weeks"],
+    )
+    replan_builder.add_edge("plan_weekly_workouts", "merge_weeks")
+    replan_builder.add_edge("merge_weeks", END)
+
+    return replan_builder
+
+
+async def replan(
+    previous_plan: TrainingPlan,
+    previous_input: TrainingPlanInput,
+    changes: Mapping[str, Any],
+    deps: Dependencies,
+    from_week: int = 1,
+    output_path: str | Path = "training_plan.json",
+    run_id: str | None = None,
+    workout_batches: int | None = None,
+    rule_based_easy_days: bool = False,
+) -> ReplanScope:
+    """Regenerate what `changes` invalidate and write the merged plan"""
+    scope = replan_scope(previous_plan, previous_input, changes, from_week)
+
+    graph = build_replan_graph(
+        deps=deps,
+        weekly_graph=build_weekly_workout_graph(
+            deps=deps,
+            workout_batches=workout_batches,
+            rule_based_easy_days=rule_based_easy_days,
+        ),
+    ).compile()
+
+    config = {
+        "configurable": {
+            "thread_id": run_id or uuid.uuid4().hex,
+            "output_path": str(output_path),
+        }
+    }
+    await graph.ainvoke(
+        {
+            **previous_input,
+            **changes,
+            "previous_plan": scope.plan,
+            "replan_weeks": scope.weeks,
+            "regenerate_outline": scope.regenerate_outline,
+        },
+        config,
+    )
+    return scope
+
+
+async def main(args: argparse.Namespace) -> None:
+    previous_plan = TrainingPlan.model_validate_json(
+        Path(args.plan).read_bytes()
+    )
+    record = json.loads(Path(args.input).read_text())
+    record.pop("athlete_id", None)
+    change_record = json.loads(args.change)
+
+    previous_input = training_plan_input_adapter.validate_python(record)
+    updated_input = training_plan_input_adapter.validate_python(
+        {**record, **change_record}
+    )
+    changes = {field: updated_input[field] for field in change_record}
+
+    deps = Dependencies(
+        model_name=args.model_name,
+        provider=args.provider,
+        requests_per_minute=args.requests_per_minute,
+    )
+    scope = await replan(
+        previous_plan,
+        previous_input,
+        changes,
+        deps=deps,
+        from_week=args.from_week,
+        output_path=args.output or args.plan,
+        run_id=args.run_id,
+        workout_batches=args.workout_batches,
+        rule_based_easy_days=args.rule_based_easy_days,
+    )
+
+    kept = scope.plan.plan_duration_weeks - len(scope.weeks)
+    print(
+        f"Regenerated {len(scope.whole_weeks)} weeks and {scope.days} "
+        f"single days, kept {kept} weeks, repaired {scope.repaired} "
+        "workouts locally"
+    )
+    if scope.regenerate_outline:
+        print("Regenerated the high-level plan")
+    print(f"Model calls: {deps.scheduler.stats.calls}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("plan", help="Training plan JSON to re-plan")
+    parser.add_argument(
+        "--input",
+        required=True,
+        help="JSON file with the input the plan was generated from",
+    )
+    parser.add_argument(
+        "--change",
+        required=True,
+        help="JSON object of the input fields that changed",
+    )
+    parser.add_argument(
+        "--from-week",
+        type=int,
+        default=1,
+        help="First week the change applies to",
+    )
+    parser.add_argument(
+        "--output", help="Where to write the new plan, defaults to in place"
+    )
+    parser.add_argument("--run-id")
+    parser.add_argument("--model-name", default="claude-3-5-haiku-latest")
+    parser.add_argument(
+        "--provider", choices=["anthropic", "fake"], default="anthropic"
+    )
+    parser.add_argument("--requests-per-minute", type=float, default=50)
+    parser.add_argument("--workout-batches", type=int, default=None)
+    parser.add_argument(
+        "--rule-based-easy-days",
+        action="store_true",
+        help="Build easy and recovery days from rules instead of the model",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    asyncio.run(main(args))
@@ -0,0 +1,471 @@
+"""Serve training plan generation over HTTP.
+
+One compiled graph and one `Dependencies` stay warm for the life of the
+process. Plan requests go into a bounded queue worked by a fixed number of
+workers, and each week is pushed to the client over Server-Sent Events as
+soon as its branch finishes.
+
+    python -m coach.service --port 8000 --workers 4 --max-queue 32
+
+    POST   /plans              TrainingPlanInput JSON, 202 with the job id,
+                               503 with Retry-After when the queue is full
+    GET    /plans/<id>         job status
+    GET    /plans/<id>/events  SSE stream: status, week and done events
+    GET    /plans/<id>/plan    the assembled plan once the job completed
+    DELETE /plans/<id>         cancel a queued or running job
+    GET    /health             queue depth and worker count
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from pathlib import Path
+from typing import Any, Literal
+
+from dotenv import load_dotenv
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+from langgraph.graph.state import CompiledStateGraph
+from pydantic import ValidationError
+
+from coach.batch import training_plan_input_adapter
+from coach.main import build_training_plan_graph, build_weekly_workout_graph
+from coach.models.dependencies import Dependencies
+from coach.models.states import TrainingPlanInput
+
+JobStatus = Literal["queued", "running", "completed", "failed", "cancelled"]
+FINISHED: set[JobStatus] = {"completed", "failed", "cancelled"}
+
+# Seconds between SSE comments keeping idle connections open through proxies
+HEARTBEAT_SECONDS = 15.0
+MAX_BODY_BYTES = 64 * 1024
+
+
+class QueueFull(Exception):
+    pass
+
+
+@dataclass
+class PlanJob:
+    job_id: str
+    plan_input: TrainingPlanInput
+    output_path: Path
+    status: JobStatus = "queued"
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    error: str | None = None
+    # Raw JSON of each finished week, replayed to late subscribers
+    weeks: dict[int, dict[str, Any]] = field(default_factory=dict)
+    subscribers: list[asyncio.Queue] = field(default_factory=list)
+    task: asyncio.Task | None = None
+
+    def status_json(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "weeks_completed": sorted(self.weeks),
+            "programme_length": self.plan_input["programme_length"],
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    def publish(self, event: str, data: dict[str, Any]) -> None:
+        for subscriber in self.subscribers:
+            subscriber.put_nowait((event, data))
+
+    def subscribe(self) -> asyncio.Queue:
+        """Queue of (event, data) starting with everything so far"""
+        queue: asyncio.Queue = asyncio.Queue()
+        queue.put_nowait(("status", self.status_json()))
+        for week_index in sorted(self.weeks):
+            queue.put_nowait(("week", self.weeks[week_index]))
+        if self.status in FINISHED:
+            queue.put_nowait(("done", self.status_json()))
+        else:
+            self.subscribers.append(queue)
+        return queue
+
+
+class PlanService:
+    """Bounded job queue in front of one warm plan graph"""
+
+    def __init__(
+        self,
+        graph: CompiledStateGraph,
+        output_dir: str | Path = "plans",
+        workers: int = 4,
+        max_queue: int = 32,
+        max_finished_jobs: int = 1000,
+    ) -> None:
+        self.graph = graph
+        self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_finished_jobs = max_finished_jobs
+        # Unbounded, as cancelled jobs stay in it until a worker skips them.
+        # `queued` counts the live ones against `max_queue` instead.
+        self.queue: asyncio.Queue[PlanJob] = asyncio.Queue()
+        self.queued = 0
+        self.jobs: OrderedDict[str, PlanJob] = OrderedDict()
+        self._worker_tasks: list[asyncio.Task] = []
+        # Rolling mean job time, for Retry-After when the queue is full
+        self._mean_job_seconds = 30.0
+
+    def start(self) -> None:
+        self._worker_tasks = [
+            asyncio.create_task(self._worker()) for _ in range(self.workers)
+        ]
+
+    async def stop(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        for job in self.jobs.values():
+            if job.task is not None:
+                job.task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+
+    def submit(self, plan_input: TrainingPlanInput) -> PlanJob:
+        job_id = uuid.uuid4().hex
+        job = PlanJob(
+            job_id=job_id,
+            plan_input=plan_input,
+            output_path=self.output_dir / f"{job_id}.json",
+        )
+        if self.queued >= self.max_queue:
+            raise QueueFull
+        self.queue.put_nowait(job)
+        self.queued += 1
+        self.jobs[job_id] = job
+        self._evict_finished()
+        return job
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up"""
+        return max(1, round(self._mean_job_seconds / max(self.workers, 1)))
+
+    def cancel(self, job: PlanJob) -> bool:
+        if job.status in FINISHED:
+            return False
+        if job.task is None:
+            # Still in the queue, the worker skips it when it comes up but
+            # its slot is free for new jobs now
+            self.queued -= 1
+            self._finish(job, "cancelled")
+        else:
+            job.task.cancel()
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.status != "queued":
+                    continue
+                self.queued -= 1
+                job.task = asyncio.create_task(self._run(job))
+                try:
+                    await asyncio.shield(job.task)
+                except asyncio.CancelledError:
+                    if not job.task.cancelled():
+                        # The worker itself is shutting down
+                        job.task.cancel()
+                        raise
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job: PlanJob) -> None:
+        job.status = "running"
+        job.started_at = time.time()
+        job.publish("status", job.status_json())
+        config = {
+            "configurable": {
+                "thread_id": job.job_id,
+                "output_path": str(job.output_path),
+            }
+        }
+        try:
+            async for _, mode, chunk in self.graph.astream(
+                job.plan_input,
+                config,
+                stream_mode=["custom"],
+                subgraphs=True,
+            ):
+                if mode == "custom" and "week_index" in chunk:
+                    job.weeks[chunk["week_index"]] = chunk
+                    job.publish("week", chunk)
+        except asyncio.CancelledError:
+            self._finish(job, "cancelled")
+            raise
+        except Exception as error:
+            self._finish(job, "failed", repr(error))
+            return
+        self._finish(job, "completed")
+
+    def _finish(
+        self, job: PlanJob, status: JobStatus, error: str | None = None
+    ) -> None:
+        job.status = status
+        job.error = error
+        job.finished_at = time.time()
+        if job.started_at is not None and status == "completed":
+            seconds = job.finished_at - job.started_at
+            self._mean_job_seconds += (seconds - self._mean_job_seconds) / 10
+        job.publish("done", job.status_json())
+        job.subscribers.clear()
+
+    def _evict_finished(self) -> None:
+        finished = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.status in FINISHED
+        ]
+        for job_id in finished[: max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+
+def _response(
+    writer: asyncio.StreamWriter,
+    status: HTTPStatus,
+    body: Any = None,
+    headers: dict[str, str] | None = None,
+) -> None:
+    payload = b"" if body is None else json.dumps(body).encode()
+    lines = [
+        f"HTTP/1.1 {status.value} {status.phrase}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(payload)}",
+        "Connection: close",
+        *(f"{name}: {value}" for name, value in (headers or {}).items()),
+    ]
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + payload)
+
+
+async def _stream_events(
+    writer: asyncio.StreamWriter, job: PlanJob
+) -> None:
+    writer.write(
+        b"HTTP/1.1 200 OK\r\n"
+        b"Content-Type: text/event-stream\r\n"
+        b"Cache-Control: no-cache\r\n"
+        b"Connection: close\r\n\r\n"
+    )
+    queue = job.subscribe()
+    try:
+        while True:
+            try:
+                event, data = await asyncio.wait_for(
+                    queue.get(), HEARTBEAT_SECONDS
+                )
+            except TimeoutError:
+                writer.write(b": keep-alive\n\n")
+                await writer.drain()
+                continue
+            writer.write(
+                f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+            )
+            await writer.drain()
+            if event == "done":
+                return
+    finally:
+        if queue in job.subscribers:
+            job.subscribers.remove(queue)
+
+
+async def handle_request(
+    service: PlanService,
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+) -> None:
+    try:
+        request_line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if len(request_line) < 2:
+            return
+        method, path = request_line[0], request_line[1].split("?")[0]
+        parts = [part for part in path.split("/") if part]
+
+        if parts == ["health"] and method == "GET":
+            _response(
+                writer,
+                HTTPStatus.OK,
+                {"queued": service.queued, "workers": service.workers},
+            )
+        elif parts == ["plans"] and method == "POST":
+            try:
+                length = int(headers.get("content-length", 0))
+            except ValueError:
+                length = -1
+            if length < 0:
+                _response(
+                    writer,
+                    HTTPStatus.BAD_REQUEST,
+                    {"error": "Invalid Content-Length"},
+                )
+                return
+            if length > MAX_BODY_BYTES:
+                _response(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+                return
+            body = await reader.readexactly(length)
+            try:
+                plan_input = training_plan_input_adapter.validate_json(body)
+            except ValidationError as error:
+                _response(
+                    writer,
+                    HTTPStatus.UNPROCESSABLE_ENTITY,
+                    {"errors": json.loads(error.json())},
+                )
+                return
+            try:
+                job = service.submit(plan_input)
+            except QueueFull:
+                _response(
+                    writer,
+                    HTTPStatus.SERVICE_UNAVAILABLE,
+                    {"error": "Job queue is full"},
+                    {"Retry-After": str(service.retry_after())},
+                )
+                return
+            _response(
+                writer,
+                HTTPStatus.ACCEPTED,
+                job.status_json(),
+                {"Location": f"/plans/{job.job_id}"},
+            )
+        elif len(parts) in (2, 3) and parts[0] == "plans":
+            job = service.jobs.get(parts[1])
+            action = parts[2] if len(parts) == 3 else None
+            if job is None:
+                _response(writer, HTTPStatus.NOT_FOUND)
+            elif action is None and method == "GET":
+                _response(writer, HTTPStatus.OK, job.status_json())
+            elif action is None and method == "DELETE":
+                if service.cancel(job):
+                    _response(writer, HTTPStatus.ACCEPTED, job.status_json())
+                else:
+                    _response(writer, HTTPStatus.CONFLICT, job.status_json())
+            elif action == "events" and method == "GET":
+                await _stream_events(writer, job)
+            elif action == "plan" and method == "GET":
+                if job.status != "completed":
+                    _response(writer, HTTPStatus.CONFLICT, job.status_json())
+                    return
+                payload = job.output_path.read_bytes()
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                    + f"Content-Length: {len(payload)}\r\n".encode()
+                    + b"Connection: close\r\n\r\n"
+                    + payload
+                )
+            else:
+                _response(writer, HTTPStatus.METHOD_NOT_ALLOWED)
+        else:
+            _response(writer, HTTPStatus.NOT_FOUND)
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        try:
+            await writer.drain()
+            writer.close()
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def serve(
+    deps: Dependencies,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    workers: int = 4,
+    max_queue: int = 32,
+    output_dir: str = "plans",
+    checkpoint_path: str = ".coach_cache/checkpoints.sqlite",
+    workout_batches: int | None = None,
+    rule_based_easy_days: bool = False,
+) -> None:
+    training_plan_builder = build_training_plan_graph(
+        deps=deps,
+        weekly_graph=build_weekly_workout_graph(
+            deps=deps,
+            workout_batches=workout_batches,
+            rule_based_easy_days=rule_based_easy_days,
+        ),
+    )
+    Path(checkpoint_path).parent.mkdir(parents=True, exist_ok=True)
+
+    async with AsyncSqliteSaver.from_conn_string(
+        checkpoint_path
+    ) as checkpointer:
+        service = PlanService(
+            training_plan_builder.compile(checkpointer=checkpointer),
+            output_dir=output_dir,
+            workers=workers,
+            max_queue=max_queue,
+        )
+        service.start()
+        server = await asyncio.start_server(
+            lambda reader, writer: handle_request(service, reader, writer),
+            host,
+            port,
+        )
+        print(f"Serving training plans on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await service.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--max-queue", type=int, default=32)
+    parser.add_argument("--output-dir", default="plans")
+    parser.add_argument("--model-name", default="claude-3-5-haiku-latest")
+    parser.add_argument(
+        "--provider", choices=["anthropic", "fake"], default="anthropic"
+    )
+    parser.add_argument("--requests-per-minute", type=float, default=50)
+    parser.add_argument("--max-concurrency", type=int, default=10)
+    parser.add_argument("--workout-batches", type=int, default=None)
+    parser.add_argument(
+        "--rule-based-easy-days",
+        action="store_true",
+        help="Build easy and recovery days from rules instead of the model",
+    )
+    args = parser.parse_args()
+
+    load_dotenv()
+    deps = Dependencies(
+        model_name=args.model_name,
+        provider=args.provider,
+        requests_per_minute=args.requests_per_minute,
+        max_concurrency=args.max_concurrency,
+    )
+    try:
+        asyncio.run(
+            serve(
+                deps,
+                host=args.host,
+                port=args.port,
+                workers=args.workers,
+                max_queue=args.max_queue,
+                output_dir=args.output_dir,
+                workout_batches=args.workout_batches,
+                rule_based_easy_days=args.rule_based_easy_days,
+            )
+        )
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,484 @@
+"""Compact binary format for stored training plans.
+
+A plan is written as a set of tables instead of a JSON tree:
+
+    b"CPLN" | version | flags | body (zlib compressed when flags & 1)
+
+    body = strings | refs | days | intervals | workouts | weeks | plan
+
+Every table starts with its row count (u32) and every row is fixed width,
+little-endian, so a table decodes with one `struct.iter_unpack`. Strings
+are stored once and referenced by index. Enums are stored as their
+position in the `*_CODES` tuples below. Intervals, workouts and equipment
+lists are interned by content: identical ones, like a plan's repeated
+warmups, are written once and referenced by id. Ids of a row's children
+(a workout's intervals, a week's workouts) are a slice of `refs`, and a
+week's rest and easy days are slices of `days`.
+
+Decoding rebuilds the Pydantic models without revalidating them, so the
+round trip is exact, including `DrillInterval`s and `None`s. Interned
+rows decode to one shared instance, so copy a workout or interval before
+changing it in place.
+"""
+
+import struct
+import time
+import zlib
+from collections.abc import Iterable, Sequence
+from pathlib import Path
+from typing import Any
+
+from coach.models.enums import DistanceUnit, EffortZone, Goal, Sport
+from coach.models.schema import (
+    DrillInterval,
+    Interval,
+    TrainingPlan,
+    WeeklyWorkout,
+    Workout,
+)
+from coach.storage.writer import atomic_write
+
+MAGIC = b"CPLN"
+FORMAT_VERSION = 2
+COMPRESSED = 0x01
+
+# Stored codes are positions in these tuples, only ever append to them
+DISTANCE_UNIT_CODES = (DistanceUnit.KM, DistanceUnit.M)
+EFFORT_CODES = tuple(EffortZone)
+GOAL_CODES = (
+    Goal.ENDURANCE,
+    Goal.SPEED,
+    Goal.RECOVERY,
+    Goal.THRESHOLD,
+    Goal.BASE,
+    Goal.TECHNIQUE,
+)
+SPORT_CODES = (Sport.CYCLING, Sport.RUNNING, Sport.SWIMMING, Sport.TRIATHLON)
+
+# Row flags, one bit per optional field
+DRILL = 0x01
+HAS_DURATION = 0x02
+HAS_RECOVERY = 0x04
+HAS_TOTAL_DISTANCE = 0x01
+HAS_ESTIMATED_DURATION = 0x02
+HAS_INTENSITY_FOCUS = 0x04
+HAS_VOLUME = 0x01
+HAS_FOCUS = 0x02
+HAS_PROGRESSION = 0x01
+
+PREFIX = struct.Struct("<4sBB")
+COUNT = struct.Struct("<I")
+# flags, unit, effort, distance, duration, recovery, drill description,
+# equipment refs start and count
+INTERVAL = struct.Struct("<BBBxQddIII")
+# name, sport, goal, flags, warmup, cooldown, interval refs start and
+# count, total distance, estimated duration, intensity focus
+WORKOUT = struct.Struct("<IBBBxIIIIQQI")
+# description, name, flags, volume, focus, rest days start and count,
+# workout refs start and count, easy days start and count
+WEEK = struct.Struct("<IIBxxxQIIIIIII")
+# duration weeks, description, flags, progression strategy
+PLAN = struct.Struct("<QIBxxxI")
+
+
+class PlanEncodingError(ValueError):
+    pass
+
+
+def _codes(values: Sequence[Any]) -> dict[Any, int]:
+    return {value: code for code, value in enumerate(values)}
+
+
+_UNIT_CODE = _codes(DISTANCE_UNIT_CODES)
+_EFFORT_CODE = _codes(EFFORT_CODES)
+_GOAL_CODE = _codes(GOAL_CODES)
+_SPORT_CODE = _codes(SPORT_CODES)
+
+
+class _Encoder:
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        self.refs: list[int] = []
+        self.days: list[int] = []
+        self.intervals: dict[bytes, int] = {}
+        self.workouts: dict[tuple, int] = {}
+        self.workout_rows: list[bytes] = []
+        self.ref_lists: dict[tuple[int, ...], int] = {}
+
+    def string(self, value: str) -> int:
+        return self.strings.setdefault(value, len(self.strings))
+
+    def ref_list(self, ids: Sequence[int]) -> int:
+        """Start of `ids` in refs, shared with any identical earlier list"""
+        key = tuple(ids)
+        start = self.ref_lists.get(key)
+        if start is None:
+            start = len(self.refs)
+            self.refs.extend(key)
+            self.ref_lists[key] = start
+        return start
+
+    def interval(self, interval: Interval) -> int:
+        flags = 0
+        drill_description = equipment_start = equipment_count = 0
+        if isinstance(interval, DrillInterval):
+            flags |= DRILL
+            drill_description = self.string(interval.drill_description)
+            equipment = [
+                self.string(item) for item in interval.equipment_needed
+            ]
+            equipment_start = self.ref_list(equipment)
+            equipment_count = len(equipment)
+        if interval.duration_estimate is not None:
+            flags |= HAS_DURATION
+        if interval.recovery_time is not None:
+            flags |= HAS_RECOVERY
+        row = INTERVAL.pack(
+            flags,
+            _UNIT_CODE[interval.distance_unit],
+            _EFFORT_CODE[interval.effort],
+            interval.distance,
+            interval.duration_estimate or 0.0,
+            interval.recovery_time or 0.0,
+            drill_description,
+            equipment_start,
+            equipment_count,
+        )
+        # The row holds string ids, which are themselves interned, so equal
+        # rows mean equal intervals
+        return self.intervals.setdefault(row, len(self.intervals))
+
+    def workout(self, workout: Workout) -> int:
+        interval_ids = tuple(
+            self.interval(interval) for interval in workout.intervals
+        )
+        flags = 0
+        if workout.total_distance is not None:
+            flags |= HAS_TOTAL_DISTANCE
+        if workout.estimated_duration is not None:
+            flags |= HAS_ESTIMATED_DURATION
+        if workout.intensity_focus is not None:
+            flags |= HAS_INTENSITY_FOCUS
+        fields = (
+            self.string(workout.name),
+            _SPORT_CODE[workout.sport],
+            _GOAL_CODE[workout.workout_goal],
+            flags,
+            self.interval(workout.warmup),
+            self.interval(workout.cooldown),
+        )
+        values = (
+            workout.total_distance or 0,
+            workout.estimated_duration or 0,
+            self.string(workout.intensity_focus)
+            if workout.intensity_focus is not None
+            else 0,
+        )
+        key = (fields, values, interval_ids)
+        workout_id = self.workouts.get(key)
+        if workout_id is None:
+            workout_id = len(self.workout_rows)
+            self.workout_rows.append(
+                WORKOUT.pack(
+                    *fields,
+                    self.ref_list(interval_ids),
+                    len(interval_ids),
+                    *values,
+                )
+            )
+            self.workouts[key] = workout_id
+        return workout_id
+
+    def week(self, week: WeeklyWorkout) -> bytes:
+        workout_ids = [self.workout(workout) for workout in week.workouts]
+        flags = 0
+        if week.total_weekly_volume is not None:
+            flags |= HAS_VOLUME
+        if week.weekly_focus is not None:
+            flags |= HAS_FOCUS
+        rest_start = len(self.days)
+        self.days.extend(week.rest_days)
+        easy_start = len(self.days)
+        self.days.extend(week.easy_days)
+        return WEEK.pack(
+            self.string(week.weekly_workout_description),
+            self.string(week.workout_week_name),
+            flags,
+            week.total_weekly_volume or 0,
+            self.string(week.weekly_focus)
+            if week.weekly_focus is not None
+            else 0,
+            rest_start,
+            len(week.rest_days),
+            self.ref_list(workout_ids),
+            len(workout_ids),
+            easy_start,
+            len(week.easy_days),
+        )
+
+    def body(self, plan: TrainingPlan) -> bytes:
+        week_rows = [self.week(week) for week in plan.weekly_workouts]
+        plan_row = PLAN.pack(
+            plan.plan_duration_weeks,
+            self.string(plan.plan_description),
+            HAS_PROGRESSION if plan.progression_strategy is not None else 0,
+            self.string(plan.progression_strategy)
+            if plan.progression_strategy is not None
+            else 0,
+        )
+        encoded = [string.encode() for string in self.strings]
+        return b"".join(
+            [
+                COUNT.pack(len(encoded)),
+                struct.pack(f"<{len(encoded)}I", *map(len, encoded)),
+                *encoded,
+                COUNT.pack(len(self.refs)),
+                struct.pack(f"<{len(self.refs)}I", *self.refs),
+                COUNT.pack(len(self.days)),
+                struct.pack(f"<{len(self.days)}q", *self.days),
+                COUNT.pack(len(self.intervals)),
+                *self.intervals,
+                COUNT.pack(len(self.workout_rows)),
+                *self.workout_rows,
+                COUNT.pack(len(week_rows)),
+                *week_rows,
+                plan_row,
+            ]
+        )
+
+
+def encode_plan(
+    plan: TrainingPlan, compress: bool = True, level: int = 6
+) -> bytes:
+    """`plan` in the binary format, zlib compressed at `level` by default"""
+    try:
+        body = _Encoder().body(plan)
+    except struct.error as error:
+        # e.g. a distance beyond 64 bits or a negative rest day past them
+        raise PlanEncodingError(f"Plan doesn't fit the format: {error}")
+    if compress:
+        body = zlib.compress(body, level)
+    flags = COMPRESSED if compress else 0
+    return PREFIX.pack(MAGIC, FORMAT_VERSION, flags) + body
+
+
+def _table(
+    body: bytes, pos: int, row: struct.Struct
+) -> tuple[Iterable[tuple], int]:
+    (count,) = COUNT.unpack_from(body, pos)
+    start = pos + COUNT.size
+    end = start + count * row.size
+    if end > len(body):
+        raise PlanEncodingError(f"Table at byte {pos} runs past the end")
+    return row.iter_unpack(body[start:end]), end
+
+
+def _array(body: bytes, pos: int, code: str) -> tuple[tuple, int]:
+    (count,) = COUNT.unpack_from(body, pos)
+    pos += COUNT.size
+    values = struct.unpack_from(f"<{count}{code}", body, pos)
+    return values, pos + struct.calcsize(f"<{count}{code}")
+
+
+def decode_plan(data: bytes) -> TrainingPlan:
+    """Rebuild a plan, raising `PlanEncodingError` for anything unreadable"""
+    try:
+        magic, version, flags = PREFIX.unpack_from(data)
+        if magic != MAGIC:
+            raise PlanEncodingError("Not a binary training plan")
+        if version != FORMAT_VERSION:
+            raise PlanEncodingError(
+                f"Unsupported plan format version {version}"
+            )
+        body = data[PREFIX.size :]
+        if flags & COMPRESSED:
+            body = zlib.decompress(body)
+        return _decode_body(body)
+    except (struct.error, zlib.error, IndexError, UnicodeDecodeError) as error:
+        # Truncated or corrupt, ids and lengths point past their tables
+        raise PlanEncodingError(f"Corrupt plan: {error}") from error
+
+
+def _decode_body(body: bytes) -> TrainingPlan:
+    lengths, pos = _array(body, 0, "I")
+    strings = []
+    for length in lengths:
+        strings.append(body[pos : pos + length].decode())
+        pos += length
+    refs, pos = _array(body, pos, "I")
+    days, pos = _array(body, pos, "q")
+
+    rows, pos = _table(body, pos, INTERVAL)
+    intervals: list[Interval] = []
+    for (
+        interval_flags,
+        unit,
+        effort,
+        distance,
+        duration,
+        recovery,
+        drill_description,
+        equipment_start,
+        equipment_count,
+    ) in rows:
+        fields = {
+            "distance": distance,
+            "distance_unit": DISTANCE_UNIT_CODES[unit],
+            "effort": EFFORT_CODES[effort],
+            "duration_estimate": (
+                duration if interval_flags & HAS_DURATION else None
+            ),
+            "recovery_time": (
+                recovery if interval_flags & HAS_RECOVERY else None
+            ),
+        }
+        if interval_flags & DRILL:
+            intervals.append(
+                DrillInterval.model_construct(
+                    **fields,
+                    drill_description=strings[drill_description],
+                    equipment_needed=[
+                        strings[item]
+                        for item in refs[
+                            equipment_start : equipment_start
+                            + equipment_count
+                        ]
+                    ],
+                )
+            )
+        else:
+            intervals.append(Interval.model_construct(**fields))
+
+    rows, pos = _table(body, pos, WORKOUT)
+    workouts: list[Workout] = []
+    for (
+        name,
+        sport,
+        goal,
+        workout_flags,
+        warmup,
+        cooldown,
+        interval_start,
+        interval_count,
+        total_distance,
+        estimated_duration,
+        intensity_focus,
+    ) in rows:
+        workouts.append(
+            Workout.model_construct(
+                name=strings[name],
+                sport=SPORT_CODES[sport],
+                warmup=intervals[warmup],
+                intervals=[
+                    intervals[interval_id]
+                    for interval_id in refs[
+                        interval_start : interval_start + interval_count
+                    ]
+                ],
+                cooldown=intervals[cooldown],
+                workout_goal=GOAL_CODES[goal],
+                total_distance=(
+                    total_distance
+                    if workout_flags & HAS_TOTAL_DISTANCE
+                    else None
+                ),
+                estimated_duration=(
+                    estimated_duration
+                    if workout_flags & HAS_ESTIMATED_DURATION
+                    else None
+                ),
+                intensity_focus=(
+                    strings[intensity_focus]
+                    if workout_flags & HAS_INTENSITY_FOCUS
+                    else None
+                ),
+            )
+        )
+
+    rows, pos = _table(body, pos, WEEK)
+    weeks = [
+        WeeklyWorkout.model_construct(
+            workouts=[
+                workouts[workout_id]
+                for workout_id in refs[
+                    workout_start : workout_start + workout_count
+                ]
+            ],
+            weekly_workout_description=strings[description],
+            workout_week_name=strings[name],
+            total_weekly_volume=volume if week_flags & HAS_VOLUME else None,
+            rest_days=list(days[rest_start : rest_start + rest_count]),
+            easy_days=list(days[easy_start : easy_start + easy_count]),
+            weekly_focus=strings[focus] if week_flags & HAS_FOCUS else None,
+        )
+        for (
+            description,
+            name,
+            week_flags,
+            volume,
+            focus,
+            rest_start,
+            rest_count,
+            workout_start,
+            workout_count,
+            easy_start,
+            easy_count,
+        ) in rows
+    ]
+
+    duration_weeks, description, plan_flags, progression = PLAN.unpack_from(
+        body, pos
+    )
+    return TrainingPlan.model_construct(
+        weekly_workouts=weeks,
+        plan_duration_weeks=duration_weeks,
+        plan_description=strings[description],
+        progression_strategy=(
+            strings[progression] if plan_flags & HAS_PROGRESSION else None
+        ),
+    )
+
+
+class PlanArchive:
+    """Every plan generated for an athlete, in the binary format.
+
+    Plans are kept as `<root>/<athlete_id>/<created_at_ns>.cplan`, so an
+    athlete's history lists in the order it was generated.
+    """
+
+    SUFFIX = ".cplan"
+
+    def __init__(
+        self, root: str | Path = ".coach_cache/plans", compress: bool = True
+    ) -> None:
+        self.root = Path(root)
+        self.compress = compress
+
+    def save(
+        self,
+        athlete_id: str,
+        plan: TrainingPlan,
+        created_at_ns: int | None = None,
+    ) -> Path:
+        created_at_ns = created_at_ns or time.time_ns()
+        return atomic_write(
+            self.root / athlete_id / f"{created_at_ns}{self.SUFFIX}",
+            [encode_plan(plan, compress=self.compress)],
+            binary=True,
+        )
+
+    def history(self, athlete_id: str) -> list[Path]:
+        athlete_dir = self.root / athlete_id
+        if not athlete_dir.is_dir():
+            return []
+        return sorted(
+            athlete_dir.glob(f"*{self.SUFFIX}"),
+            key=lambda path: int(path.stem),
+        )
+
+    def load(self, path: str | Path) -> TrainingPlan:
+        return decode_plan(Path(path).read_bytes())
+
+    def latest(self, athlete_id: str) -> TrainingPlan | None:
+        history = self.history(athlete_id)
+        return self.load(history[-1]) if history else None
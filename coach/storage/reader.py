@@ -0,0 +1,391 @@
+from __future__ import annotations
+
+import functools
+import json
+import mmap
+import re
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Union
+
+from coach.storage.writer import atomic_write
+
+if TYPE_CHECKING:
+    # Imported where plan slices are validated, so scanning and the plan
+    # header don't pay for building the Pydantic models
+    from coach.models.schema import (
+        DrillInterval,
+        Interval,
+        WeeklyWorkout,
+        Workout,
+    )
+
+INDEX_VERSION = 1
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+# Rest of a string after its opening quote, up to the closing quote
+_STRING_TAIL = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+# Everything up to the next bracket, including whole strings
+_TO_BRACKET = re.compile(
+    rb'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL
+)
+_SCALAR = re.compile(rb"[^,\]}\s]*")
+
+
+@functools.cache
+def interval_adapter() -> Any:
+    from pydantic import TypeAdapter
+
+    from coach.models.schema import DrillInterval, Interval
+
+    return TypeAdapter(Union[Interval, DrillInterval])
+
+
+class PlanFormatError(ValueError):
+    pass
+
+
+def _skip_ws(buf: Any, pos: int) -> int:
+    return _WHITESPACE.match(buf, pos).end()
+
+
+def _value_end(buf: Any, pos: int) -> int:
+    """Offset just past the JSON value starting at `pos`"""
+    first = buf[pos : pos + 1]
+    if first == b'"':
+        match = _STRING_TAIL.match(buf, pos + 1)
+        if match is None:
+            raise PlanFormatError(f"Unterminated string at byte {pos}")
+        return match.end()
+
+    if first in (b"{", b"["):
+        # Jump from bracket to bracket, the regex consumes whole strings so
+        # brackets inside them are never counted
+        depth = 0
+        index = pos
+        while True:
+            index = _TO_BRACKET.match(buf, index).end()
+            char = buf[index : index + 1]
+            if char in (b"{", b"["):
+                depth += 1
+            elif char in (b"}", b"]"):
+                depth -= 1
+            else:
+                raise PlanFormatError(f"Unterminated value at byte {pos}")
+            index += 1
+            if depth == 0:
+                return index
+
+    return _SCALAR.match(buf, pos).end()
+
+
+def _expect(buf: Any, pos: int, char: bytes) -> None:
+    if buf[pos : pos + 1] != char:
+        raise PlanFormatError(f"Expected {char!r} at byte {pos}")
+
+
+def iter_object(
+    buf: Any, pos: int, value_end: Callable[[str, int], int] | None = None
+) -> Iterator[tuple[str, int, int]]:
+    """Yield (key, value start, value end) for the object at `pos`
+
+    `value_end(key, start)` can replace the generic skip for values the
+    caller walks itself, so their bytes are only scanned once.
+    """
+    value_end = value_end or (lambda key, start: _value_end(buf, start))
+    _expect(buf, pos, b"{")
+    index = _skip_ws(buf, pos + 1)
+    if buf[index : index + 1] == b"}":
+        return
+
+    while True:
+        key_end = _value_end(buf, index)
+        key = json.loads(buf[index:key_end])
+        index = _skip_ws(buf, key_end)
+        _expect(buf, index, b":")
+        start = _skip_ws(buf, index + 1)
+        end = value_end(key, start)
+        yield key, start, end
+
+        index = _skip_ws(buf, end)
+        if buf[index : index + 1] == b"}":
+            return
+        _expect(buf, index, b",")
+        index = _skip_ws(buf, index + 1)
+
+
+def iter_array(
+    buf: Any, pos: int, item_end: Callable[[int], int] | None = None
+) -> Iterator[tuple[int, int]]:
+    """Yield (item start, item end) for the array at `pos`"""
+    item_end = item_end or (lambda start: _value_end(buf, start))
+    _expect(buf, pos, b"[")
+    index = _skip_ws(buf, pos + 1)
+    if buf[index : index + 1] == b"]":
+        return
+
+    while True:
+        end = item_end(index)
+        yield index, end
+
+        index = _skip_ws(buf, end)
+        if buf[index : index + 1] == b"]":
+            return
+        _expect(buf, index, b",")
+        index = _skip_ws(buf, index + 1)
+
+
+def _closing_end(buf: Any, start: int, items: list[tuple[int, int]]) -> int:
+    """End of the container at `start` given its already scanned items"""
+    last = items[-1][1] if items else start + 1
+    return _skip_ws(buf, last) + 1
+
+
+def training_days(rest_days: list[int]) -> list[int]:
+    """Days a week's workouts are assigned to, in order"""
+    return [day for day in range(1, 8) if day not in rest_days]
+
+
+@dataclass
+class WeekEntry:
+    start: int
+    end: int
+    rest_days: list[int]
+    workouts: list[tuple[int, int]]
+
+    def workout_span(self, day: int) -> tuple[int, int] | None:
+        days = training_days(self.rest_days)
+        if day not in days:
+            return None
+        position = days.index(day)
+        if position >= len(self.workouts):
+            return None
+        return self.workouts[position]
+
+
+class PlanReader:
+    """Read-only, lazily parsed view of a training plan JSON document.
+
+    The file is memory mapped and only the slices that are asked for are
+    validated. A sidecar index (`<plan>.idx`) stores the byte ranges of
+    every week and workout, so lookups by (week, day) jump straight to the
+    bytes they need. The index is rebuilt whenever the plan's size or
+    modification time no longer match it, and only saved with
+    `write_index`, as the plan's directory may be read-only.
+
+        with PlanReader("training_plan.json", write_index=True) as plan:
+            workout = plan.workout(week_index=3, day=2)
+    """
+
+    def __init__(self, path: str | Path, write_index: bool = False) -> None:
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx")
+        self._file = open(self.path, "rb")
+        try:
+            try:
+                self._buf = mmap.mmap(
+                    self._file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            except ValueError as error:
+                # mmap refuses empty files
+                raise PlanFormatError(f"{self.path} is empty") from error
+        except BaseException:
+            self._file.close()
+            raise
+        try:
+            self.weeks = self._load_index(write_index)
+        except BaseException:
+            self.close()
+            raise
+
+    def __enter__(self) -> "PlanReader":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._buf.close()
+        self._file.close()
+
+    @property
+    def week_count(self) -> int:
+        return len(self.weeks)
+
+    def header(self) -> dict[str, Any]:
+        """Plan level fields, everything except `weekly_workouts`"""
+        return {
+            key: json.loads(self._buf[start:end])
+            for key, start, end in iter_object(
+                self._buf, _skip_ws(self._buf, 0)
+            )
+            if key != "weekly_workouts"
+        }
+
+    def week_header(self, week_index: int) -> dict[str, Any]:
+        """Week level fields, everything except `workouts`, unvalidated"""
+        entry = self._week_entry(week_index)
+        return {
+            key: json.loads(self._buf[start:end])
+            for key, start, end in iter_object(self._buf, entry.start)
+            if key != "workouts"
+        }
+
+    def workout_header(
+        self, week_index: int, day: int
+    ) -> dict[str, Any] | None:
+        """A workout's fields except its `intervals`, unvalidated"""
+        span = self._week_entry(week_index).workout_span(day)
+        if span is None:
+            return None
+        return {
+            key: json.loads(self._buf[start:end])
+            for key, start, end in iter_object(self._buf, span[0])
+            if key != "intervals"
+        }
+
+    def week(self, week_index: int) -> WeeklyWorkout:
+        from coach.models.schema import WeeklyWorkout
+
+        entry = self._week_entry(week_index)
+        return WeeklyWorkout.model_validate_json(
+            self._buf[entry.start : entry.end]
+        )
+
+    def workout(self, week_index: int, day: int) -> Workout | None:
+        """The workout on `day` (1-7) of a week, None on rest days"""
+        from coach.models.schema import Workout
+
+        span = self._week_entry(week_index).workout_span(day)
+        if span is None:
+            return None
+        start, end = span
+        return Workout.model_validate_json(self._buf[start:end])
+
+    def iter_weeks(self) -> Iterator[tuple[int, WeeklyWorkout]]:
+        for week_index in range(1, self.week_count + 1):
+            yield week_index, self.week(week_index)
+
+    def iter_workouts(
+        self, week_index: int | None = None
+    ) -> Iterator[tuple[int, int, Workout]]:
+        """Yield (week, day, workout) without loading whole weeks"""
+        from coach.models.schema import Workout
+
+        week_indexes = (
+            range(1, self.week_count + 1)
+            if week_index is None
+            else [week_index]
+        )
+        for index in week_indexes:
+            entry = self._week_entry(index)
+            for day, (start, end) in zip(
+                training_days(entry.rest_days), entry.workouts
+            ):
+                yield index, day, Workout.model_validate_json(
+                    self._buf[start:end]
+                )
+
+    def iter_intervals(
+        self, week_index: int, day: int
+    ) -> Iterator[Interval | DrillInterval]:
+        """Main set intervals of one workout, parsed one at a time"""
+        span = self._week_entry(week_index).workout_span(day)
+        if span is None:
+            return
+        for key, start, _ in iter_object(self._buf, span[0]):
+            if key != "intervals":
+                continue
+            for item_start, item_end in iter_array(self._buf, start):
+                yield interval_adapter().validate_json(
+                    self._buf[item_start:item_end]
+                )
+            return
+
+    def _week_entry(self, week_index: int) -> WeekEntry:
+        if not 1 <= week_index <= self.week_count:
+            raise IndexError(
+                f"Week {week_index} out of range 1-{self.week_count}"
+            )
+        return self.weeks[week_index - 1]
+
+    def _load_index(self, write_index: bool) -> list[WeekEntry]:
+        stat = self.path.stat()
+        try:
+            index = json.loads(self.index_path.read_text())
+            if (
+                index["version"] == INDEX_VERSION
+                and index["size"] == stat.st_size
+                and index["mtime_ns"] == stat.st_mtime_ns
+            ):
+                return [
+                    WeekEntry(
+                        start=week["start"],
+                        end=week["end"],
+                        rest_days=week["rest_days"],
+                        workouts=[tuple(span) for span in week["workouts"]],
+                    )
+                    for week in index["weeks"]
+                ]
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        weeks = self._scan()
+        if write_index:
+            index = {
+                "version": INDEX_VERSION,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "weeks": [
+                    {
+                        "start": week.start,
+                        "end": week.end,
+                        "rest_days": week.rest_days,
+                        "workouts": week.workouts,
+                    }
+                    for week in weeks
+                ],
+            }
+            try:
+                atomic_write(self.index_path, [json.dumps(index)])
+            except OSError:
+                # The index only saves the next reader a scan
+                pass
+        return weeks
+
+    def _scan(self) -> list[WeekEntry]:
+        buf = self._buf
+        weeks: list[WeekEntry] = []
+
+        def week_end(start: int) -> int:
+            entry = WeekEntry(start=start, end=0, rest_days=[], workouts=[])
+
+            def week_value_end(key: str, value_start: int) -> int:
+                if key != "workouts":
+                    return _value_end(buf, value_start)
+                entry.workouts = list(iter_array(buf, value_start))
+                return _closing_end(buf, value_start, entry.workouts)
+
+            fields = []
+            for key, value_start, value_end in iter_object(
+                buf, start, week_value_end
+            ):
+                if key == "rest_days":
+                    entry.rest_days = (
+                        json.loads(buf[value_start:value_end]) or []
+                    )
+                fields.append((value_start, value_end))
+            entry.end = _closing_end(buf, start, fields)
+            weeks.append(entry)
+            return entry.end
+
+        def plan_value_end(key: str, start: int) -> int:
+            if key != "weekly_workouts":
+                return _value_end(buf, start)
+            spans = list(iter_array(buf, start, item_end=week_end))
+            return _closing_end(buf, start, spans)
+
+        for _ in iter_object(buf, _skip_ws(buf, 0), plan_value_end):
+            pass
+        return weeks
@@ -0,0 +1,392 @@
+import math
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Collection, Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Literal
+
+import numpy as np
+
+from coach.models.enums import Experience, Goal, Sport
+from coach.models.repair import (
+    UnrepairableOutput,
+    WorkoutConstraints,
+    repair_workout,
+    violates_constraints,
+)
+from coach.models.schema import Interval, WeeklyWorkout, Workout
+
+TemplateKind = Literal["week", "workout"]
+
+GOALS = [goal.value for goal in Goal]
+SPORTS = [sport.value for sport in Sport]
+EXPERIENCE_LEVELS = [level.value for level in Experience]
+FEATURE_SIZE = len(GOALS) + len(SPORTS) + 5
+
+# Feature weights, chosen so any categorical mismatch (another goal or
+# sport, a different number of sessions for a week) or a plan of very
+# different length is further away than DEFAULT_MAX_DISTANCE, while a few
+# weeks of plan position or a modest volume difference stay within it
+EXPERIENCE_WEIGHT = 0.5  # per level
+POSITION_WEIGHT = 1.0  # across the whole plan
+PLAN_LENGTH_WEIGHT = 0.5  # per doubling
+VOLUME_WEIGHT = 0.5  # per doubling
+SESSIONS_WEIGHT = 1.0  # per session, weeks only
+DEFAULT_MAX_DISTANCE = 0.3
+# Templates are only stretched this far to meet the athlete's volume
+MIN_SCALE, MAX_SCALE = 0.5, 2.0
+# Plans whose used week templates are remembered, oldest dropped first
+MAX_TRACKED_PLANS = 1000
+WEEK_NUMBER = re.compile(r"\b(week\s+)(\d+)\b", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class TemplateFeatures:
+    """What makes a generated week or workout reusable for another athlete"""
+
+    goal: Goal
+    sports: Sequence[Sport]
+    experience: Experience
+    week_index: int
+    plan_weeks: int
+    weekly_volume: float  # athlete's minutes per week
+    workouts_per_week: int
+
+    @property
+    def week_position(self) -> float:
+        if self.plan_weeks <= 1:
+            return 0.0
+        return (self.week_index - 1) / (self.plan_weeks - 1)
+
+    def volume(self, kind: TemplateKind) -> float:
+        """Volume a template of `kind` was generated for, minutes"""
+        if kind == "week":
+            return self.weekly_volume
+        return self.weekly_volume / max(self.workouts_per_week, 1)
+
+    def vector(self, kind: TemplateKind) -> np.ndarray:
+        """Normalised feature vector, compared by Euclidean distance"""
+        sports = {sport.value for sport in self.sports}
+        return np.array(
+            [float(goal == self.goal.value) for goal in GOALS]
+            + [float(sport in sports) for sport in SPORTS]
+            + [
+                EXPERIENCE_LEVELS.index(self.experience.value)
+                * EXPERIENCE_WEIGHT,
+                self.week_position * POSITION_WEIGHT,
+                math.log2(max(self.plan_weeks, 1)) * PLAN_LENGTH_WEIGHT,
+                math.log2(max(self.volume(kind), 1.0)) * VOLUME_WEIGHT,
+                # A week's rest days have to fit, a workout fits any week
+                self.workouts_per_week * SESSIONS_WEIGHT
+                if kind == "week"
+                else 0.0,
+            ],
+            dtype=np.float32,
+        )
+
+
+@dataclass
+class TemplateStats:
+    hits: dict[str, int] = field(default_factory=dict)
+    misses: dict[str, int] = field(default_factory=dict)
+    stored: int = 0
+
+    def record(self, kind: TemplateKind, hit: bool) -> None:
+        counts = self.hits if hit else self.misses
+        counts[kind] = counts.get(kind, 0) + 1
+
+    def reuse_rate(self, kind: TemplateKind) -> float:
+        hits = self.hits.get(kind, 0)
+        lookups = hits + self.misses.get(kind, 0)
+        return hits / lookups if lookups else 0.0
+
+
+def _scale_segment(segment: Interval, factor: float) -> Interval:
+    return segment.model_copy(
+        update={
+            "distance": max(1, round(segment.distance * factor)),
+            "duration_estimate": (
+                segment.duration_estimate * factor
+                if segment.duration_estimate
+                else segment.duration_estimate
+            ),
+        }
+    )
+
+
+def scale_workout(
+    workout: Workout, factor: float, constraints: WorkoutConstraints
+) -> Workout:
+    """Stretch a workout's distances and durations by `factor`.
+
+    Recovery times are kept. The result is brought back within the
+    athlete's limits the same way model output is, raising
+    `UnrepairableOutput` when that isn't possible.
+    """
+    factor = min(max(factor, MIN_SCALE), MAX_SCALE)
+    scaled = workout.model_copy(
+        update={
+            "warmup": _scale_segment(workout.warmup, factor),
+            "intervals": [
+                _scale_segment(interval, factor)
+                for interval in workout.intervals
+            ],
+            "cooldown": _scale_segment(workout.cooldown, factor),
+            "total_distance": (
+                max(1, round(workout.total_distance * factor))
+                if workout.total_distance
+                else workout.total_distance
+            ),
+            "estimated_duration": (
+                max(1, round(workout.estimated_duration * factor))
+                if workout.estimated_duration
+                else workout.estimated_duration
+            ),
+        }
+    )
+    if not violates_constraints(scaled, constraints):
+        return scaled
+    scaled, _ = repair_workout(scaled.model_dump(mode="json"), constraints)
+    return scaled
+
+
+def renumber_week(text: str, week_index: int) -> str:
+    """Point "Week N" mentions in a template's text at `week_index`"""
+    return WEEK_NUMBER.sub(
+        lambda match: f"{match.group(1)}{week_index}", text
+    )
+
+
+def scale_week(
+    week: WeeklyWorkout,
+    factor: float,
+    constraints: WorkoutConstraints,
+    week_index: int,
+) -> WeeklyWorkout:
+    """Scale a week template, renumbered as week `week_index`"""
+    factor = min(max(factor, MIN_SCALE), MAX_SCALE)
+    return week.model_copy(
+        update={
+            "workout_week_name": renumber_week(
+                week.workout_week_name, week_index
+            ),
+            "weekly_workout_description": renumber_week(
+                week.weekly_workout_description, week_index
+            ),
+            "workouts": [
+                scale_workout(workout, factor, constraints)
+                for workout in week.workouts
+            ],
+            "total_weekly_volume": (
+                max(1, round(week.total_weekly_volume * factor))
+                if week.total_weekly_volume
+                else week.total_weekly_volume
+            ),
+        }
+    )
+
+
+class TemplateStore:
+    """Library of generated weeks and workouts, reused for similar athletes.
+
+    Templates are persisted to SQLite with the feature vector and volume
+    they were generated for. Lookups are a nearest-neighbour search over
+    every template of a kind, held in memory as one NumPy matrix, and only
+    a match within `max_distance` is reused, scaled to the new athlete's
+    volume. A week template is used at most once per plan.
+    """
+
+    def __init__(
+        self,
+        path: str | Path = ".coach_cache/templates.sqlite",
+        max_distance: float = DEFAULT_MAX_DISTANCE,
+    ) -> None:
+        self.path = Path(path)
+        self.max_distance = max_distance
+        self.stats = TemplateStats()
+
+        if str(path) != ":memory:":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS templates (
+                id INTEGER PRIMARY KEY,
+                kind TEXT NOT NULL,
+                features BLOB NOT NULL,
+                volume REAL NOT NULL,
+                payload TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """)
+        self._conn.commit()
+        # kind -> (template ids, feature matrix, volumes)
+        self._index: dict[str, tuple[list[int], np.ndarray, np.ndarray]] = {}
+        # plan id -> week templates its weeks already use
+        self._plan_weeks: OrderedDict[str, set[int]] = OrderedDict()
+
+    def _load_index(
+        self, kind: TemplateKind
+    ) -> tuple[list[int], np.ndarray, np.ndarray]:
+        # Caller holds the lock
+        if kind not in self._index:
+            # Rows stored before the feature layout changed can't be
+            # compared, skip them
+            rows = self._conn.execute(
+                "SELECT id, features, volume FROM templates "
+                "WHERE kind = ? AND length(features) = ?",
+                (kind, FEATURE_SIZE * 4),
+            ).fetchall()
+            self._index[kind] = (
+                [row[0] for row in rows],
+                np.array(
+                    [np.frombuffer(row[1], dtype=np.float32) for row in rows],
+                    dtype=np.float32,
+                ).reshape(len(rows), FEATURE_SIZE),
+                np.array([row[2] for row in rows], dtype=np.float64),
+            )
+        return self._index[kind]
+
+    def add(
+        self,
+        kind: TemplateKind,
+        features: TemplateFeatures,
+        template: WeeklyWorkout | Workout,
+    ) -> None:
+        vector = features.vector(kind)
+        volume = features.volume(kind)
+        with self._lock:
+            cursor = self._conn.execute(
+                """
+                INSERT INTO templates
+                    (kind, features, volume, payload, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (
+                    kind,
+                    vector.tobytes(),
+                    volume,
+                    template.model_dump_json(),
+                    time.time(),
+                ),
+            )
+            self._conn.commit()
+            if kind in self._index:
+                ids, matrix, volumes = self._index[kind]
+                self._index[kind] = (
+                    [*ids, cursor.lastrowid],
+                    np.vstack([matrix, vector]),
+                    np.append(volumes, volume),
+                )
+            self.stats.stored += 1
+
+    def nearest(
+        self,
+        kind: TemplateKind,
+        features: TemplateFeatures,
+        exclude: Collection[int] = (),
+    ) -> tuple[int, str, float] | None:
+        """Closest template within `max_distance`: id, payload and scale"""
+        vector = features.vector(kind)
+        with self._lock:
+            ids, matrix, volumes = self._load_index(kind)
+            if not ids:
+                return None
+            distances = np.linalg.norm(matrix - vector, axis=1)
+            if exclude:
+                excluded = np.isin(ids, list(exclude))
+                distances[excluded] = np.inf
+            best = int(np.argmin(distances))
+            if distances[best] > self.max_distance:
+                return None
+            (payload,) = self._conn.execute(
+                "SELECT payload FROM templates WHERE id = ?", (ids[best],)
+            ).fetchone()
+        return ids[best], payload, features.volume(kind) / volumes[best]
+
+    def find_week(
+        self,
+        features: TemplateFeatures,
+        constraints: WorkoutConstraints,
+        plan_id: str | None = None,
+    ) -> WeeklyWorkout | None:
+        """Nearest week template no other week of `plan_id` uses yet"""
+        with self._lock:
+            used: set[int] = set()
+            if plan_id is not None:
+                used = self._plan_weeks.setdefault(plan_id, set())
+                self._plan_weeks.move_to_end(plan_id)
+                while len(self._plan_weeks) > MAX_TRACKED_PLANS:
+                    self._plan_weeks.popitem(last=False)
+            match = self.nearest("week", features, exclude=used)
+            if match is not None:
+                used.add(match[0])
+        week = None
+        if match is not None:
+            _, payload, factor = match
+            try:
+                week = scale_week(
+                    WeeklyWorkout.model_validate_json(payload),
+                    factor,
+                    constraints,
+                    features.week_index,
+                )
+            except UnrepairableOutput:
+                week = None
+        self.stats.record("week", week is not None)
+        return week
+
+    def find_workouts(
+        self,
+        features: TemplateFeatures,
+        constraints: WorkoutConstraints,
+        count: int,
+    ) -> list[Workout]:
+        """Up to `count` distinct workouts, nearest first"""
+        workouts: list[Workout] = []
+        used: list[int] = []
+        while len(workouts) < count:
+            match = self.nearest("workout", features, exclude=used)
+            if match is None:
+                break
+            template_id, payload, factor = match
+            used.append(template_id)
+            try:
+                workouts.append(
+                    scale_workout(
+                        Workout.model_validate_json(payload),
+                        factor,
+                        constraints,
+                    )
+                )
+            except UnrepairableOutput:
+                continue
+        for position in range(count):
+            self.stats.record("workout", position < len(workouts))
+        return workouts
+
+    def size(self, kind: TemplateKind | None = None) -> int:
+        with self._lock:
+            if kind is None:
+                query, params = "SELECT COUNT(*) FROM templates", ()
+            else:
+                query = "SELECT COUNT(*) FROM templates WHERE kind = ?"
+                params = (kind,)
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM templates")
+            self._conn.commit()
+            self._index.clear()
+            self._plan_weeks.clear()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import functools
+import os
+import re
+import shutil
+import tempfile
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    # Validation happens in the few methods that need it, so the CLI can
+    # read plans without importing Pydantic
+    from coach.models.schema import TrainingPlan, WeeklyWorkout
+
+WEEK_FILE_PATTERN = re.compile(r"^week_(\d+)\.json$")
+
+
+@functools.cache
+def _file_mode() -> int:
+    """Mode `open` would create files with under the process umask"""
+    # The umask can only be read by setting it, do that once
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def atomic_write(
+    path: str | Path,
+    chunks: Iterable[str] | Iterable[bytes],
+    binary: bool = False,
+) -> Path:
+    """Write `chunks` to a temp file beside `path`, then rename over it.
+
+    Readers only ever see the previous complete file or the new one.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(
+        dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+    )
+    try:
+        # mkstemp creates the file owner-only, which the rename would keep
+        os.fchmod(fd, _file_mode())
+        with os.fdopen(fd, "wb" if binary else "w") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return path
+
+
+class PlanWriter:
+    """Streams each completed week of a run to its own chunk file.
+
+    Weeks land in `<root>/<run_id>/week_NN.json` as soon as their branch
+    finishes, so consumers can read early weeks while later ones are still
+    generating. `assemble` then builds the final training plan document one
+    week at a time, without holding the whole plan in memory, and removes
+    the run's chunks.
+    """
+
+    def __init__(self, root: str | Path = ".coach_cache/runs") -> None:
+        self.root = Path(root)
+
+    def run_dir(self, run_id: str) -> Path:
+        return self.root / run_id
+
+    def week_path(self, run_id: str, week_index: int) -> Path:
+        return self.run_dir(run_id) / f"week_{week_index:02d}.json"
+
+    def write_week(
+        self, run_id: str, week_index: int, weekly_workout: WeeklyWorkout
+    ) -> Path:
+        return atomic_write(
+            self.week_path(run_id, week_index),
+            [weekly_workout.model_dump_json()],
+        )
+
+    def completed_weeks(self, run_id: str) -> list[int]:
+        run_dir = self.run_dir(run_id)
+        if not run_dir.is_dir():
+            return []
+
+        weeks = []
+        for entry in run_dir.iterdir():
+            match = WEEK_FILE_PATTERN.match(entry.name)
+            if match:
+                weeks.append(int(match.group(1)))
+        return sorted(weeks)
+
+    def iter_week_json(self, run_id: str) -> Iterator[tuple[int, str]]:
+        """Yield (week_index, raw JSON) for completed weeks in week order"""
+        for week_index in self.completed_weeks(run_id):
+            yield week_index, self.week_path(run_id, week_index).read_text()
+
+    def iter_weeks(self, run_id: str) -> Iterator[tuple[int, WeeklyWorkout]]:
+        from coach.models.schema import WeeklyWorkout
+
+        for week_index, raw in self.iter_week_json(run_id):
+            yield week_index, WeeklyWorkout.model_validate_json(raw)
+
+    def assemble(
+        self, run_id: str, plan: TrainingPlan, output_path: str | Path
+    ) -> Path:
+        """Write the final plan document from the run's week chunks"""
+        output_path = Path(output_path)
+        run_dir = self.run_dir(run_id)
+        if not run_dir.is_dir() and output_path.exists():
+            # Assembled by an earlier attempt whose checkpoint never landed,
+            # its chunks are already gone
+            return output_path
+        atomic_write(output_path, self._plan_chunks(run_id, plan))
+        shutil.rmtree(run_dir, ignore_errors=True)
+        return output_path
+
+    def _plan_chunks(self, run_id: str, plan: TrainingPlan) -> Iterator[str]:
+        # Same layout as TrainingPlan.model_dump_json, with the weeks spliced
+        # in from disk one at a time
+        header = plan.model_dump_json(exclude={"weekly_workouts"})
+        yield '{"weekly_workouts":['
+        for position, (_, raw) in enumerate(self.iter_week_json(run_id)):
+            if position:
+                yield ","
+            yield raw
+        yield "]"
+        if header != "{}":
+            yield "," + header[1:]
+        else:
+            yield "}"
@@ -0,0 +1,294 @@
+"""Summaries and exporters for spans recorded by `InstrumentationHandler`.
+
+- `write_otlp_json` appends the spans to a file in the OTLP/JSON layout
+  used by the OpenTelemetry collector's file exporter, one
+  `ExportTraceServiceRequest` per line.
+- `prometheus_text` renders aggregated metrics in the Prometheus text
+  exposition format, `serve_prometheus` exposes them over HTTP.
+- `print_summary` prints per-node, per-call-type and per-week tables.
+"""
+
+import json
+import threading
+from collections import defaultdict
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+from coach.telemetry.spans import InstrumentationHandler, Span
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+@dataclass
+class SpanTotals:
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    errors: int = 0
+    queue_wait_seconds: float = 0.0
+    retries: int = 0
+    hedges: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    def add(self, span: Span) -> None:
+        self.count += 1
+        self.seconds += span.seconds
+        self.max_seconds = max(self.max_seconds, span.seconds)
+        self.errors += span.error is not None
+        attributes = span.attributes
+        self.queue_wait_seconds += attributes.get("queue_wait_seconds", 0.0)
+        self.retries += attributes.get("retries", 0)
+        self.hedges += bool(attributes.get("hedged"))
+        self.input_tokens += attributes.get("input_tokens", 0)
+        self.output_tokens += attributes.get("output_tokens", 0)
+
+
+def aggregate(
+    spans: Iterable[Span], key: Callable[[Span], Any]
+) -> dict[Any, SpanTotals]:
+    totals: dict[Any, SpanTotals] = defaultdict(SpanTotals)
+    for span in spans:
+        group = key(span)
+        if group is not None:
+            totals[group].add(span)
+    return dict(totals)
+
+
+def by_kind_and_name(spans: Iterable[Span]) -> dict[Any, SpanTotals]:
+    return aggregate(spans, lambda span: (span.kind, span.name))
+
+
+def by_week(spans: Iterable[Span]) -> dict[Any, SpanTotals]:
+    """Model call totals per week, week 0 is the high-level plan"""
+    return aggregate(
+        spans,
+        lambda span: (span.week_index or 0) if span.kind == "llm" else None,
+    )
+
+
+def print_summary(handler: InstrumentationHandler) -> None:
+    spans = handler.spans
+    run = next((span for span in spans if span.kind == "run"), None)
+    if run is not None:
+        print(f"Run {handler.run_id}: {run.seconds:.2f}s wall")
+
+    header = (
+        f"{'kind':<7} {'name':<32} {'count':>5} {'total_s':>8} "
+        f"{'max_s':>7} {'queue_s':>8} {'retries':>7} {'errors':>6}"
+    )
+    print(header)
+    print("-" * len(header))
+    for (kind, name), t in sorted(by_kind_and_name(spans).items()):
+        if kind == "run":
+            continue
+        print(
+            f"{kind:<7} {name[:32]:<32} {t.count:>5} {t.seconds:>8.2f} "
+            f"{t.max_seconds:>7.2f} {t.queue_wait_seconds:>8.2f} "
+            f"{t.retries:>7} {t.errors:>6}"
+        )
+
+    weeks = by_week(spans)
+    if weeks:
+        print()
+        header = (
+            f"{'week':>4} {'calls':>5} {'llm_s':>8} {'queue_s':>8} "
+            f"{'in_tok':>8} {'out_tok':>8} {'retries':>7} {'hedges':>6}"
+        )
+        print(header)
+        print("-" * len(header))
+        for week_index, t in sorted(weeks.items()):
+            week = str(week_index) if week_index else "plan"
+            print(
+                f"{week:>4} {t.count:>5} {t.seconds:>8.2f} "
+                f"{t.queue_wait_seconds:>8.2f} {t.input_tokens:>8} "
+                f"{t.output_tokens:>8} {t.retries:>7} {t.hedges:>6}"
+            )
+
+
+def _otlp_value(value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP/JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict[str, Any]) -> list[dict[str, Any]]:
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+def _otlp_span(span: Span, trace_id: str) -> dict[str, Any]:
+    attributes = {
+        "coach.span.kind": span.kind,
+        "coach.week_index": span.week_index,
+        **{f"coach.{key}": value for key, value in span.attributes.items()},
+    }
+    otlp_span = {
+        "traceId": trace_id,
+        "spanId": span.span_id,
+        "name": span.name,
+        "kind": SPAN_KIND_CLIENT if span.kind == "llm" else SPAN_KIND_INTERNAL,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns or span.start_ns),
+        "attributes": _otlp_attributes(attributes),
+        "status": (
+            {"code": STATUS_ERROR, "message": span.error}
+            if span.error is not None
+            else {"code": STATUS_OK}
+        ),
+    }
+    if span.parent_id is not None:
+        otlp_span["parentSpanId"] = span.parent_id
+    return otlp_span
+
+
+def write_otlp_json(handler: InstrumentationHandler, path: str | Path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    request = {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": _otlp_attributes(
+                        {"service.name": "cycling-running-coach"}
+                    )
+                },
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "coach.telemetry"},
+                        "spans": [
+                            _otlp_span(span, handler.trace_id)
+                            for span in handler.spans
+                        ],
+                    }
+                ],
+            }
+        ]
+    }
+    with open(path, "a") as f:
+        f.write(json.dumps(request) + "\n")
+    return path
+
+
+def _label_value(value: Any) -> str:
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+    )
+
+
+def _labels(**labels: Any) -> str:
+    pairs = (f'{key}="{_label_value(value)}"' for key, value in labels.items())
+    return "{" + ",".join(pairs) + "}"
+
+
+def prometheus_text(handler: InstrumentationHandler) -> str:
+    spans = handler.spans
+    lines: list[str] = []
+
+    def metric(
+        name: str, kind: str, help_text: str, samples: list[tuple[str, Any]]
+    ) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{name}{labels} {value}" for labels, value in samples)
+
+    totals = by_kind_and_name(spans)
+    metric(
+        "coach_span_seconds_total",
+        "counter",
+        "Wall time spent in spans",
+        [
+            (_labels(kind=kind, name=name), f"{t.seconds:.6f}")
+            for (kind, name), t in sorted(totals.items())
+        ],
+    )
+    metric(
+        "coach_spans_total",
+        "counter",
+        "Completed spans",
+        [
+            (_labels(kind=kind, name=name), t.count)
+            for (kind, name), t in sorted(totals.items())
+        ],
+    )
+    metric(
+        "coach_span_errors_total",
+        "counter",
+        "Spans that raised, parser errors are parse failures",
+        [
+            (_labels(kind=kind, name=name), t.errors)
+            for (kind, name), t in sorted(totals.items())
+        ],
+    )
+
+    weeks = sorted(by_week(spans).items())
+    metric(
+        "coach_llm_queue_wait_seconds_total",
+        "counter",
+        "Time model calls waited for scheduler capacity",
+        [(_labels(week=w), f"{t.queue_wait_seconds:.6f}") for w, t in weeks],
+    )
+    metric(
+        "coach_llm_tokens_total",
+        "counter",
+        "Model tokens by direction",
+        [
+            (_labels(week=w, direction=direction), tokens)
+            for w, t in weeks
+            for direction, tokens in (
+                ("input", t.input_tokens),
+                ("output", t.output_tokens),
+            )
+        ],
+    )
+    metric(
+        "coach_llm_retries_total",
+        "counter",
+        "Model call retries made by the scheduler",
+        [(_labels(week=w), t.retries) for w, t in weeks],
+    )
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(
+    handler: InstrumentationHandler, port: int, host: str = "127.0.0.1"
+) -> ThreadingHTTPServer:
+    """Serve `/metrics` from a daemon thread until `shutdown()` is called"""
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text(handler).encode()
+            self.send_response(200)
+            self.send_header(
+                "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+            )
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,197 @@
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Literal
+from uuid import UUID
+
+from langchain_core.callbacks import AsyncCallbackHandler
+from langchain_core.outputs import LLMResult
+
+SpanKind = Literal["run", "node", "llm", "parser"]
+
+# Graph plumbing that shows up as chain runs but isn't worth a span
+IGNORED_NODES = {"__start__", "__end__"}
+
+
+@dataclass
+class Span:
+    name: str
+    kind: SpanKind
+    span_id: str
+    parent_id: str | None
+    start_ns: int
+    end_ns: int | None = None
+    week_index: int | None = None
+    error: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def seconds(self) -> float:
+        if self.end_ns is None:
+            return 0.0
+        return (self.end_ns - self.start_ns) / 1e9
+
+
+@dataclass
+class _RunInfo:
+    parent: UUID | None
+    week_index: int | None
+    span: Span | None
+
+
+class InstrumentationHandler(AsyncCallbackHandler):
+    """Records spans for graph nodes, model calls and output parsing.
+
+    Pass it as a callback when invoking the graph. Nodes are the chain runs
+    LangGraph tags with `langgraph_node`, parsers are chain runs named
+    `*Parser`, everything else (prompt templates, sequences, state writes)
+    is only used to link spans to their parent and to their week.
+    Scheduler queue wait, attempts and retries come from the `scheduler`
+    entry `ScheduledChatModel` adds to `llm_output`.
+    """
+
+    def __init__(self, run_id: str | None = None) -> None:
+        self.run_id = run_id or uuid.uuid4().hex
+        # OTLP trace ids are 16 bytes, derive one from any run id
+        self.trace_id = uuid.uuid5(uuid.NAMESPACE_OID, self.run_id).hex
+        self.spans: list[Span] = []
+        self._runs: dict[UUID, _RunInfo] = {}
+
+    # Chains: the graph itself, its nodes and output parsers
+
+    async def on_chain_start(
+        self,
+        serialized: dict[str, Any] | None,
+        inputs: Any,
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name", "")
+        metadata = metadata or {}
+
+        week_index = None
+        if isinstance(inputs, dict) and isinstance(
+            inputs.get("week_index"), int
+        ):
+            week_index = inputs["week_index"]
+
+        kind: SpanKind | None = None
+        if parent_run_id is None:
+            kind = "run"
+        elif (
+            name == metadata.get("langgraph_node")
+            and name not in IGNORED_NODES
+        ):
+            kind = "node"
+        elif name.endswith("Parser"):
+            kind = "parser"
+
+        self._start(run_id, parent_run_id, name, kind, week_index)
+
+    async def on_chain_end(
+        self, outputs: Any, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id)
+
+    async def on_chain_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id, error=error)
+
+    # Model calls
+
+    async def on_chat_model_start(
+        self,
+        serialized: dict[str, Any] | None,
+        messages: list[list[Any]],
+        *,
+        run_id: UUID,
+        parent_run_id: UUID | None = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name") or (serialized or {}).get("name", "llm")
+        self._start(run_id, parent_run_id, name, "llm", None)
+
+    async def on_llm_end(
+        self, response: LLMResult, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        info = self._runs.get(run_id)
+        if info is not None and info.span is not None:
+            attributes = llm_attributes(response)
+            info.span.attributes.update(attributes)
+            # Group calls by what they generate rather than by model class
+            if attributes.get("call_type"):
+                info.span.attributes["model"] = info.span.name
+                info.span.name = attributes["call_type"]
+        self._end(run_id)
+
+    async def on_llm_error(
+        self, error: BaseException, *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        self._end(run_id, error=error)
+
+    def _start(
+        self,
+        run_id: UUID,
+        parent_run_id: UUID | None,
+        name: str,
+        kind: SpanKind | None,
+        week_index: int | None,
+    ) -> None:
+        parent = self._runs.get(parent_run_id) if parent_run_id else None
+        if week_index is None and parent is not None:
+            week_index = parent.week_index
+
+        span = None
+        if kind is not None:
+            span = Span(
+                name=name,
+                kind=kind,
+                span_id=run_id.hex[-16:],
+                parent_id=self._parent_span_id(parent_run_id),
+                start_ns=time.time_ns(),
+                week_index=week_index,
+            )
+            self.spans.append(span)
+
+        self._runs[run_id] = _RunInfo(
+            parent=parent_run_id, week_index=week_index, span=span
+        )
+
+    def _end(self, run_id: UUID, error: BaseException | None = None) -> None:
+        info = self._runs.pop(run_id, None)
+        if info is None or info.span is None:
+            return
+        info.span.end_ns = time.time_ns()
+        if error is not None:
+            info.span.error = f"{type(error).__name__}: {error}"
+
+    def _parent_span_id(self, run_id: UUID | None) -> str | None:
+        # Nearest ancestor that has a span, skipping plumbing runs
+        while run_id is not None:
+            info = self._runs.get(run_id)
+            if info is None:
+                return None
+            if info.span is not None:
+                return info.span.span_id
+            run_id = info.parent
+        return None
+
+
+def llm_attributes(response: LLMResult) -> dict[str, Any]:
+    attributes: dict[str, Any] = {}
+
+    generation = response.generations[0][0] if response.generations else None
+    usage = getattr(
+        getattr(generation, "message", None), "usage_metadata", None
+    )
+    if usage:
+        attributes["input_tokens"] = usage["input_tokens"]
+        attributes["output_tokens"] = usage["output_tokens"]
+
+    # Absent for cache hits and streamed calls
+    attributes.update((response.llm_output or {}).get("scheduler") or {})
+    return attributes